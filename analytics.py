@@ -0,0 +1,185 @@
+import datetime
+import threading
+
+import numpy as np
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# Buckets averaged by the rolling series when no window is given
+DEFAULT_ROLLING = {'day': 7, 'week': 4, 'month': 3}
+
+# Days of history the depletion forecast takes the consumption rate from
+DEFAULT_FORECAST_WINDOW = 30
+
+# Results kept per store version, so polling dashboards do not recompute
+CACHE_SIZE = 32
+
+
+def bucket_starts(days, granularity):
+    """Map datetime64[D] days to the first day of their day/week (Monday)/month bucket"""
+    if granularity == 'day':
+        return days
+    if granularity == 'week':
+        # 1970-01-01 was a Thursday: shift so that Mondays fall on multiples of 7
+        ordinals = days.astype(np.int64)
+        return (ordinals - (ordinals + 3) % 7).astype('datetime64[D]')
+    return days.astype('datetime64[M]').astype('datetime64[D]')
+
+
+def bucket_range(first, last, granularity):
+    """Return every bucket start from first to last (inclusive), without gaps"""
+    if granularity == 'day':
+        return np.arange(first, last + 1, dtype='datetime64[D]')
+    if granularity == 'week':
+        return np.arange(first, last + 1, 7, dtype='datetime64[D]')
+    months = np.arange(first.astype('datetime64[M]'), last.astype('datetime64[M]') + 1)
+    return months.astype('datetime64[D]')
+
+
+def bucket_label(start, granularity):
+    """Label a bucket: YYYY-MM-DD for days and weeks (Monday), YYYY-MM for months"""
+    label = str(start)
+    return label[:7] if granularity == 'month' else label
+
+
+def rolling_mean(values, window):
+    """Trailing mean over `window` buckets (fewer at the start of the series)"""
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    return (cumulative[ends] - cumulative[starts]) / (ends - starts)
+
+
+def consumption_series(rows, granularity='month', rolling=None):
+    """Roll daily (day, gas type, count, bar, liters) buckets up into dense per-gas series
+
+    Returns {'buckets': [labels], 'series': {gas: {'liters', 'bar', 'count',
+    'rolling_liters'}}}; buckets without consumption are zeros, so the rolling
+    windows span real time.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity '{granularity}' (use {', '.join(GRANULARITIES)})")
+    window = DEFAULT_ROLLING[granularity] if rolling is None else rolling
+    if window < 1:
+        raise ValueError('The rolling window must be at least 1')
+    if not rows:
+        return {'granularity': granularity, 'rolling_window': window, 'buckets': [], 'series': {}}
+
+    days = np.array([row[0] for row in rows], dtype='datetime64[D]')
+    starts = bucket_starts(days, granularity)
+    buckets = bucket_range(starts.min(), starts.max(), granularity)
+    positions = np.searchsorted(buckets, starts)
+
+    gas_types = sorted({row[1] for row in rows})
+    gas_codes = {gas: i for i, gas in enumerate(gas_types)}
+    gas_index = np.array([gas_codes[row[1]] for row in rows], dtype=np.int64)
+    counts = np.array([row[2] for row in rows], dtype=np.float64)
+    bar = np.array([row[3] for row in rows], dtype=np.float64)
+    liters = np.array([row[4] for row in rows], dtype=np.float64)
+
+    # One bincount per measure over (gas, bucket) cells
+    cells = gas_index * len(buckets) + positions
+    size = len(gas_types) * len(buckets)
+    shape = (len(gas_types), len(buckets))
+    count_grid = np.bincount(cells, weights=counts, minlength=size).reshape(shape)
+    bar_grid = np.bincount(cells, weights=bar, minlength=size).reshape(shape)
+    liters_grid = np.bincount(cells, weights=liters, minlength=size).reshape(shape)
+
+    series = {}
+    for i, gas in enumerate(gas_types):
+        series[gas] = {
+            'liters': np.round(liters_grid[i], 2).tolist(),
+            'bar': np.round(bar_grid[i], 2).tolist(),
+            'count': count_grid[i].astype(np.int64).tolist(),
+            'rolling_liters': np.round(rolling_mean(liters_grid[i], window), 2).tolist()
+        }
+
+    return {
+        'granularity': granularity,
+        'rolling_window': window,
+        'buckets': [bucket_label(start, granularity) for start in buckets],
+        'series': series
+    }
+
+
+def depletion_forecast(rows, stock_by_gas, as_of, window=DEFAULT_FORECAST_WINDOW):
+    """Forecast, per gas type, the days until the stock runs out at the recent consumption rate
+
+    `rows` are the daily buckets of the `window` days ending on `as_of`;
+    `stock_by_gas` maps gas types to {'count', 'liters'} of the stock (pressure
+    x volume). Gases consumed in the window but not in stock have 0 days left.
+    """
+    if window < 1:
+        raise ValueError('The forecast window must be at least 1 day')
+
+    consumed = {}
+    for _, gas, _, _, liters in rows:
+        consumed[gas] = consumed.get(gas, 0.0) + liters
+
+    forecast = {}
+    for gas in sorted(set(stock_by_gas) | set(consumed)):
+        stock = stock_by_gas.get(gas, {'count': 0, 'liters': 0.0})
+        rate = consumed.get(gas, 0.0) / window
+        days_left = None
+        empty_date = None
+        if rate > 0:
+            days_left = max(stock['liters'], 0.0) / rate
+            empty_date = (as_of + datetime.timedelta(days=int(days_left))).isoformat()
+        forecast[gas] = {
+            'cylinders_in_stock': stock['count'],
+            'stock_liters': round(stock['liters'], 2),
+            'daily_rate_liters': round(rate, 2),
+            'days_until_empty': round(days_left, 1) if days_left is not None else None,
+            'empty_date': empty_date
+        }
+    return forecast
+
+
+class ConsumptionAnalytics:
+    """Consumption series and depletion forecasts computed from the store's daily buckets
+
+    The store maintains the daily buckets incrementally as records change, so
+    a request only rolls up the (days x gas types) buckets, never the history
+    records. Results are cached until the store version changes.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def series(self, granularity='month', gas_type=None, start=None, end=None, rolling=None):
+        """Liters, bar and counts consumed per gas type and bucket, with a rolling mean"""
+        def compute():
+            rows = self.store.daily_consumption(gas_type, start, end)
+            return consumption_series(rows, granularity, rolling)
+        return self._cached(('series', granularity, gas_type, start, end, rolling), compute)
+
+    def forecast(self, window=DEFAULT_FORECAST_WINDOW, as_of=None):
+        """Days until each gas type runs out, from the stock and the last `window` days of consumption"""
+        as_of = as_of or datetime.datetime.now(datetime.timezone.utc).date()
+
+        def compute():
+            first = (as_of - datetime.timedelta(days=window - 1)).isoformat()
+            rows = self.store.daily_consumption(None, first, as_of.isoformat())
+            stock = self.store.summary()['stock']['by_gas_type']
+            return {
+                'as_of': as_of.isoformat(),
+                'window_days': window,
+                'gas_types': depletion_forecast(rows, stock, as_of, window)
+            }
+        return self._cached(('forecast', window, as_of), compute)
+
+    def _cached(self, key, compute):
+        version = self.store.current_version()
+        with self._lock:
+            hit = self._cache.get(key)
+        if hit and hit[0] == version:
+            return hit[1]
+
+        result = dict(compute(), version=version)
+        with self._lock:
+            if len(self._cache) >= CACHE_SIZE:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[key] = (version, result)
+        return result
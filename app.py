@@ -1,16 +1,40 @@
 import os
 import sys
+import argparse
+import atexit
 import json
 import csv
+import io
 import datetime
+import hashlib
+import itertools
 import mimetypes
+import mmap
+import multiprocessing
+import signal
 import socket
 import ssl
-from flask import Flask, render_template, request, send_file, jsonify, send_from_directory
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import Flask, Response, abort, g, render_template, request, send_file, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import NotFound
+from werkzeug.serving import WSGIRequestHandler
 import webbrowser
-from threading import Timer
-import glob
+from threading import Lock, Timer
+from assets import COMPRESS_MIN_SIZE, AssetPipeline, ResponseCompression
+from backups import RetentionPolicy
+from columnar import COLUMNAR_FORMATS, columnar_available, write_columnar
+from datastore import StoreError, iso_now
+from feed import FeedFull
+from ingest import MAX_RECORD_SIZE, IngestError, RecordStream, TeeReader
+from jobs import JobQueue, JobQueueFull
+from lifecycle import ARCHIVE_AFTER_DAYS, ARCHIVE_BUDGET, ARCHIVE_INTERVAL, LifecycleWorker
+from metrics import Gauge, RequestMetrics
+from report import iter_history_rows, iter_report_rows, iter_stock_rows, report_row_count, write_sites_report
+from sites import DEFAULT_SITE, MAX_SITES, InvalidSiteError, SiteRegistry, UnknownSiteError
 
 # Ensure proper MIME types
 mimetypes.add_type('text/css', '.css')
@@ -27,35 +51,65 @@ SSL_DIR = os.path.join(BASE_DIR, "ssl")
 SSL_CERT = os.path.join(SSL_DIR, "cert.pem")
 SSL_KEY = os.path.join(SSL_DIR, "key.pem")
 
+# TLS 1.2 cipher preference: forward-secret AEAD suites only, ECDSA first
+# (TLS 1.3 suites are negotiated by OpenSSL and are all AEAD)
+TLS_CIPHERS = ':'.join([
+    'ECDHE-ECDSA-AES128-GCM-SHA256', 'ECDHE-ECDSA-CHACHA20-POLY1305', 'ECDHE-ECDSA-AES256-GCM-SHA384',
+    'ECDHE-RSA-AES128-GCM-SHA256', 'ECDHE-RSA-CHACHA20-POLY1305', 'ECDHE-RSA-AES256-GCM-SHA384'
+])
+
+# TLS 1.3 session tickets issued per full handshake; a reconnecting client
+# presents one to resume without the certificate exchange
+TLS_SESSION_TICKETS = 2
+
 # Create Flask app with static folder configuration
 app = Flask(__name__, static_folder=BASE_DIR, static_url_path='')
 CORS(app)
 
-# Define output directory for CSV files
+# Define output directory for CSV files; it holds the data of the default
+# site, other sites are partitioned into reports/sites/<name>/
 OUTPUT_DIR = "reports"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# Helper functions
-def format_date(iso_date):
-    """Format ISO date string to DD/MM/YYYY format"""
-    try:
-        date_obj = datetime.datetime.fromisoformat(iso_date.replace('Z', '+00:00'))
-        return date_obj.strftime("%d/%m/%Y")
-    except Exception:
-        return iso_date
-
-def get_physical_form_label(form):
-    """Convert physical form code to readable label"""
-    labels = {
-        'gas': 'Gas',
-        'liquid': 'Liquid',
-        'liquidWithDip': 'Liquid with dip tube'
-    }
-    return labels.get(form, form)
+# Server-sent events feed of store changes; every open stream holds a server thread
+FEED_MAX_SUBSCRIBERS = int(os.environ.get('GAS_MANAGER_FEED_MAX_SUBSCRIBERS', 32))
+
+# Bounded pool for background report generation
+EXPORT_WORKERS = int(os.environ.get('GAS_MANAGER_EXPORT_WORKERS', 2))
+export_jobs = JobQueue(max_workers=EXPORT_WORKERS)
+
+# Compressed, deduplicated backup storage; its manifest (counts, hashes)
+# answers backup listings without parsing payloads
+BACKUP_RETENTION = os.environ.get('GAS_MANAGER_BACKUP_RETENTION', '1') != '0'
+BACKUP_KEEP_HOURLY = int(os.environ.get('GAS_MANAGER_BACKUP_KEEP_HOURLY', 24))
+BACKUP_KEEP_DAILY = int(os.environ.get('GAS_MANAGER_BACKUP_KEEP_DAILY', 30))
+
+# Sites kept open at the same time, each with its store, feed and save queue
+MAX_OPEN_SITES = int(os.environ.get('GAS_MANAGER_MAX_SITES', MAX_SITES))
+
+# Processes building the sections of cross-site reports in parallel
+REPORT_PROCESSES = int(os.environ.get('GAS_MANAGER_REPORT_PROCESSES', min(4, os.cpu_count() or 1)))
+
+# Request metrics and phase timers served on /metrics; with profiling enabled,
+# requests sent with ?profile=1 save folded stacks to reports/profiles
+PROFILING = os.environ.get('GAS_MANAGER_PROFILING', '0') == '1'
+PROFILE_DIR = os.path.join(OUTPUT_DIR, "profiles")
+request_metrics = RequestMetrics(PROFILE_DIR if PROFILING else None)
+request_metrics.init_app(app)
+
+# Static files served precompressed (gzip/brotli) with ETags; pages reference
+# fingerprinted /assets/ URLs cached for a year. JSON and CSV responses larger
+# than GAS_MANAGER_COMPRESS_MIN_SIZE bytes are compressed on the fly.
+assets = AssetPipeline(BASE_DIR)
+response_compression = ResponseCompression(
+    int(os.environ.get('GAS_MANAGER_COMPRESS_MIN_SIZE', COMPRESS_MIN_SIZE))
+)
+response_compression.init_app(app)
 
+# Helper functions
 def generate_timestamp():
-    """Generate a timestamp for filenames"""
-    return datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    """Generate a timestamp for filenames (microseconds, so files written in the same second do not collide)"""
+    return datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
 
 def get_local_ip():
     """Get the local IP address of the machine"""
@@ -70,244 +124,427 @@ def get_local_ip():
     except Exception:
         return "127.0.0.1"  # Fallback to localhost if can't determine IP
 
+def serve_asset(path):
+    """Serve a static file through the asset pipeline, or as a plain file if it is not an asset"""
+    response = assets.response(path)
+    if response is None:
+        response = send_from_directory(BASE_DIR, path)
+    return response
+
 @app.route('/')
 def index():
     """Serve the main HTML page"""
-    return send_from_directory(BASE_DIR, 'gas.html')
+    return serve_asset('gas.html')
 
 @app.route('/camera-test')
 def camera_test():
     """Serve the camera test diagnostic tool"""
-    return send_from_directory(BASE_DIR, 'camera_test.html')
+    return serve_asset('camera_test.html')
+
+@app.route('/assets/<path:path>')
+def serve_fingerprinted_asset(path):
+    """Serve a fingerprinted asset URL with far-future caching"""
+    response = assets.fingerprinted_response(path)
+    if response is None:
+        abort(404)
+    return response
 
 @app.route('/<path:path>')
 def serve_static(path):
     """Serve static files"""
-    return send_from_directory(BASE_DIR, path)
+    return serve_asset(path)
 
-@app.route('/api/export-stock', methods=['POST'])
-def export_stock():
-    """Generate CSV file for current stock"""
-    data = request.json
+# Flush streamed CSV output to the client every ~64 KB
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Read size used when passing stored files through to the client
+FILE_CHUNK_SIZE = 1024 * 1024
+
+# Request bodies are parsed one record at a time and every record is checked
+# against its schema; a single record may not exceed this many bytes
+INGEST_MAX_RECORD_SIZE = int(os.environ.get('GAS_MANAGER_MAX_RECORD_SIZE', MAX_RECORD_SIZE))
+
+def request_records(kind=None, stream=None, check_fields=True):
+    """Read the records of the request body (an array of `kind` records, or an object) as they are consumed"""
+    return RecordStream(stream or request.stream, kind, INGEST_MAX_RECORD_SIZE, check_fields)
+
+@app.errorhandler(IngestError)
+def invalid_request_body(e):
+    return jsonify({
+        'success': False,
+        'message': f'Invalid request body: {str(e)}',
+        'kind': e.kind,
+        'index': e.index
+    }), 400
+
+def write_csv(filepath, rows):
+    """Write CSV rows to a temp file, then move it into place"""
+    tmp_path = filepath + '.part'
+    try:
+        with request_metrics.phase('csv_write'):
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerows(rows)
+        os.replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def write_csv_with_progress(filepath, rows, job):
+    """Write CSV rows to a temp file for a background job, then move it into place"""
+    tmp_path = filepath + '.part'
+    try:
+        with request_metrics.phase('csv_write'):
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as csvfile:
+                writer = csv.writer(csvfile)
+                for row in rows:
+                    writer.writerow(row)
+                    job.advance()
+        os.replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def iter_csv_chunks(rows, tee_path=None):
+    """Encode CSV rows into ~STREAM_CHUNK_SIZE text chunks, optionally copying them to a file
+
+    The copy is moved into place once all rows were written.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    tee = open(tee_path + '.part', 'w', newline='', encoding='utf-8') if tee_path else None
     
-    # Generate filename with timestamp
-    filename = f"cylinder_stock_{generate_timestamp()}.csv"
-    filepath = os.path.join(OUTPUT_DIR, filename)
+    # Only the time spent producing chunks counts, not the time spent sending them
+    elapsed = 0
+    try:
+        start = time.perf_counter()
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= STREAM_CHUNK_SIZE:
+                chunk = buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                if tee:
+                    tee.write(chunk)
+                elapsed += time.perf_counter() - start
+                yield chunk
+                start = time.perf_counter()
+        
+        chunk = buffer.getvalue()
+        if chunk:
+            if tee:
+                tee.write(chunk)
+            elapsed += time.perf_counter() - start
+            yield chunk
+        
+        if tee:
+            tee.close()
+            os.replace(tee.name, tee_path)
+    finally:
+        if tee:
+            tee.close()
+            if os.path.exists(tee.name):
+                os.remove(tee.name)
+        request_metrics.observe_phase('csv_write', elapsed)
+
+def csv_export_response(body, rows, filename, success_message, error_message):
+    """Write an export built from the request body to the site's directory, or stream it when the request asks for ?stream=1
+
+    The body is parsed while the rows are written, and the file only moved
+    into place once all of it was read and validated. In streaming mode the
+    rows are sent with chunked transfer as they are generated; ?save=1
+    additionally tees them to the site's directory.
+    """
+    filepath = os.path.join(current_site().directory, filename)
+    rows = body.consume(rows)
+    
+    if request.args.get('stream', type=int):
+        tee_path = filepath if request.args.get('save', type=int) else None
+        chunks = iter_csv_chunks(rows, tee_path)
+        
+        # The first chunk is produced before answering, so that an invalid
+        # body is still reported with a 400; a record found invalid later
+        # ends the transfer
+        first = next(chunks, '')
+        return Response(
+            stream_with_context(itertools.chain([first], chunks)),
+            mimetype='text/csv',
+            headers={
+                'Content-Disposition': f'attachment; filename={filename}',
+                'X-Accel-Buffering': 'no'
+            }
+        )
     
     try:
-        with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['Cylinder Code', 'Gas Type', 'Pressure (bar)', 
-                         'Cylinder Volume (L)', 'Physical Form', 'Entry Date']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            writer.writeheader()
-            for cylinder in data:
-                writer.writerow({
-                    'Cylinder Code': cylinder['code'],
-                    'Gas Type': cylinder['gasType'],
-                    'Pressure (bar)': cylinder['pressure'],
-                    'Cylinder Volume (L)': cylinder.get('cylinderVolume', '50'),
-                    'Physical Form': get_physical_form_label(cylinder['physicalForm']),
-                    'Entry Date': format_date(cylinder['entryDate'])
-                })
+        write_csv(filepath, rows)
                 
         return jsonify({
             'success': True,
-            'message': f'Stock exported successfully to {filename}',
+            'message': f'{success_message} {filename}',
             'filepath': filepath
         })
     
+    except IngestError:
+        raise
+    
     except Exception as e:
         return jsonify({
             'success': False,
-            'message': f'Error during export: {str(e)}'
+            'message': f'{error_message}: {str(e)}'
         }), 500
 
-@app.route('/api/export-history', methods=['POST'])
-def export_history():
-    """Generate CSV file for operation history"""
-    data = request.json
+def columnar_export_response(body, fmt, exports, success_message, error_message):
+    """Write typed Parquet/Arrow IPC files to the site's directory, one per (basename, kind, records) export
+
+    The records are read from the request body while the files are written;
+    if the body turns out to be invalid, no file is kept.
+    """
+    if fmt not in COLUMNAR_FORMATS:
+        return jsonify({
+            'success': False,
+            'message': f"Unknown export format '{fmt}' (use csv, {', '.join(COLUMNAR_FORMATS)})"
+        }), 400
     
-    # Generate filename with timestamp
-    filename = f"cylinder_history_{generate_timestamp()}.csv"
-    filepath = os.path.join(OUTPUT_DIR, filename)
+    if not columnar_available():
+        return jsonify({
+            'success': False,
+            'message': 'Parquet and Arrow exports require pyarrow (pip install pyarrow)'
+        }), 501
     
+    directory = current_site().directory
+    filenames = []
     try:
-        with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['Cylinder Code', 'Gas Type', 'Entry Pressure (bar)', 
-                         'Cylinder Volume (L)', 'Exit Pressure (bar)', 'Entry Date', 'Exit Date',
-                         'Consumption (bar)', 'Consumption (%)', 'Consumption (L)']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            writer.writeheader()
-            for record in data:
-                # Calculate consumption metrics
-                pressureIn = float(record['pressureIn'])
-                pressureOut = float(record['pressureOut'])
-                cylinderVolume = float(record.get('cylinderVolume', '50'))
-                consumption = pressureIn - pressureOut
-                consumption_percentage = (consumption / pressureIn * 100) if pressureIn > 0 else 0
-                consumed_liters = (consumption * cylinderVolume)
-                
-                writer.writerow({
-                    'Cylinder Code': record['code'],
-                    'Gas Type': record['gasType'],
-                    'Entry Pressure (bar)': pressureIn,
-                    'Cylinder Volume (L)': cylinderVolume,
-                    'Exit Pressure (bar)': pressureOut,
-                    'Entry Date': format_date(record['entryDate']),
-                    'Exit Date': format_date(record['exitDate']),
-                    'Consumption (bar)': round(consumption, 2),
-                    'Consumption (%)': round(consumption_percentage, 2),
-                    'Consumption (L)': round(consumed_liters, 2)
-                })
-                
+        with request_metrics.phase('columnar_write'):
+            for basename, kind, records in exports:
+                filename = basename + COLUMNAR_FORMATS[fmt]
+                write_columnar(os.path.join(directory, filename), fmt, kind, records)
+                filenames.append(filename)
+            body.finish()
+        
         return jsonify({
             'success': True,
-            'message': f'History exported successfully to {filename}',
-            'filepath': filepath
+            'message': f"{success_message} {', '.join(filenames)}",
+            'filepath': os.path.join(directory, filenames[0]),
+            'files': filenames
         })
     
+    except IngestError:
+        for filename in filenames:
+            os.remove(os.path.join(directory, filename))
+        raise
+    
     except Exception as e:
         return jsonify({
             'success': False,
-            'message': f'Error during export: {str(e)}'
+            'message': f'{error_message}: {str(e)}'
         }), 500
 
+@app.route('/api/export-stock', methods=['POST'])
+def export_stock():
+    """Generate CSV (or ?format=parquet/arrow) file for current stock"""
+    body = request_records('cylinders')
+    
+    basename = f"cylinder_stock_{generate_timestamp()}"
+    fmt = request.args.get('format', 'csv')
+    if fmt != 'csv':
+        return columnar_export_response(
+            body, fmt, [(basename, 'stock', body.records('cylinders'))],
+            'Stock exported successfully to', 'Error during export')
+    
+    # Generate filename with timestamp
+    filename = f"{basename}.csv"
+    
+    return csv_export_response(
+        body, iter_stock_rows(body.records('cylinders')), filename,
+        'Stock exported successfully to', 'Error during export')
+
+@app.route('/api/export-history', methods=['POST'])
+def export_history():
+    """Generate CSV (or ?format=parquet/arrow) file for operation history"""
+    body = request_records('history')
+    
+    basename = f"cylinder_history_{generate_timestamp()}"
+    fmt = request.args.get('format', 'csv')
+    if fmt != 'csv':
+        return columnar_export_response(
+            body, fmt, [(basename, 'history', body.records('history'))],
+            'History exported successfully to', 'Error during export')
+    
+    # Generate filename with timestamp
+    filename = f"{basename}.csv"
+    
+    return csv_export_response(
+        body, iter_history_rows(body.records('history')), filename,
+        'History exported successfully to', 'Error during export')
+
 @app.route('/api/export-all', methods=['POST'])
 def export_all():
-    """Generate comprehensive report with all data"""
-    data = request.json
-    stock = data.get('cylinders', [])
-    history = data.get('history', [])
+    """Generate comprehensive report with all data (?format=parquet/arrow writes stock and history files)"""
+    basename = f"complete_cylinder_report_{generate_timestamp()}"
+    fmt = request.args.get('format', 'csv')
+    if fmt != 'csv':
+        body = request_records()
+        return columnar_export_response(
+            body, fmt, [(f'{basename}_stock', 'stock', body.records('cylinders')),
+                        (f'{basename}_history', 'history', body.records('history'))],
+            'Complete report successfully generated in', 'Error during report generation')
     
     # Generate filename with timestamp
-    filename = f"complete_cylinder_report_{generate_timestamp()}.csv"
+    filename = f"{basename}.csv"
+    
+    if request.args.get('async', type=int):
+        # The body is validated while it is copied to a temporary file, which
+        # the job parses again; the copy is gone once the job has finished
+        site = current_site()
+        digest = hashlib.sha256(site.name.encode('utf-8') + b'\0')
+        spool = tempfile.TemporaryFile()
+        try:
+            body = request_records(stream=TeeReader(request.stream, spool, digest))
+            # The summaries have a row per gas type, counted for the job's progress
+            stock_gases = {cylinder['gasType'] for cylinder in body.records('cylinders')}
+            history_gases = {record['gasType'] for record in body.records('history')}
+            body.finish()
+        except BaseException:
+            spool.close()
+            raise
+        
+        def write(filepath, job):
+            spool.seek(0)
+            body = request_records(stream=spool)
+            rows = iter_report_rows(body.records('cylinders'), body.records('history'))
+            write_csv_with_progress(filepath, body.consume(rows), job)
+        
+        return submit_report_job(
+            'export-all', digest.hexdigest(),
+            report_row_count(body.counts['cylinders'], body.counts['history'],
+                             len(stock_gases), len(history_gases)),
+            write, os.path.join(site.directory, filename), filename, cleanup=spool.close)
+    
+    body = request_records()
+    return csv_export_response(
+        body, iter_report_rows(body.records('cylinders'), body.records('history')), filename,
+        'Complete report successfully generated in', 'Error during report generation')
+
+def submit_report_job(kind, digest, total, write, filepath, filename, cleanup=None):
+    """Queue a report on the export pool and return its job id; `write(filepath, job)` produces it
+
+    `cleanup()` is called once the job no longer needs its input.
+    """
+    def task(job):
+        write(filepath, job)
+        return {'filename': filename, 'filepath': filepath}
+    
+    try:
+        job, created = export_jobs.submit(
+            kind, digest, total, task,
+            is_valid=lambda job: os.path.exists(job.result['filepath']),
+            cleanup=cleanup)
+    except JobQueueFull:
+        return jsonify({
+            'success': False,
+            'message': 'Too many reports are being generated, please retry shortly'
+        }), 503
+    
+    if created:
+        message = 'Report generation started'
+    elif job.active:
+        message = 'A report for this data is already being generated'
+    else:
+        message = 'A report for this data is already available'
+    
+    return jsonify({
+        'success': True,
+        'message': message,
+        'job_id': job.id,
+        'status_url': f'/api/jobs/{job.id}'
+    }), 202
+
+# Process pool of cross-site reports, started on first use. Workers are
+# spawned rather than forked from a server running threads; they import this
+# module, whose stores and threads only start_services() opens
+report_pool = None
+report_pool_lock = Lock()
+
+def map_report_sections(count):
+    """Return the map that builds `count` site sections: the process pool's, or the builtin for one site"""
+    global report_pool
+    if count < 2 or REPORT_PROCESSES < 2:
+        return map
+    with report_pool_lock:
+        if report_pool is None:
+            report_pool = ProcessPoolExecutor(REPORT_PROCESSES, mp_context=multiprocessing.get_context('spawn'))
+        return report_pool.map
+
+def shutdown_report_pool():
+    """Stop the report worker processes (a broken pool is replaced on next use)"""
+    global report_pool
+    with report_pool_lock:
+        pool, report_pool = report_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+atexit.register(shutdown_report_pool)
+
+def write_sites_report_file(filepath, sites, progress=None):
+    """Write the cross-site report of open sites, building their sections in parallel"""
+    # Sections are read from the site databases, so pending saves go first
+    for site in sites:
+        site.save_writer.flush()
+    sections = [(site.name, site.database_path) for site in sites]
+    try:
+        with request_metrics.phase('csv_write'):
+            return write_sites_report(filepath, sections, map_report_sections(len(sections)), progress)
+    except BrokenProcessPool:
+        shutdown_report_pool()
+        raise
+
+@app.route('/api/sites', methods=['GET'])
+def list_sites():
+    """List the sites with data, the default site first"""
+    names = site_registry.names()
+    return jsonify({
+        'success': True,
+        'message': f'Found {len(names)} sites',
+        'sites': names,
+        'default': DEFAULT_SITE
+    })
+
+@app.route('/api/export-sites', methods=['POST'])
+def export_sites():
+    """Generate the complete report of several sites (?sites=a,b, default all) with merged summaries
+    
+    Each site's section (the export-all layout) is built from its store in a
+    separate process; the report is written to the reports directory of the
+    default site. ?async=1 queues it as a background job.
+    """
+    names = [name for name in request.args.get('sites', '').split(',') if name.strip()]
+    sites = []
+    for name in names or site_registry.names():
+        site = site_registry.get(name)
+        if site not in sites:
+            sites.append(site)
+    
+    filename = f"cross_site_report_{generate_timestamp()}.csv"
     filepath = os.path.join(OUTPUT_DIR, filename)
     
+    if request.args.get('async', type=int):
+        # The same sites at the same store versions give the same report
+        state = [(site.name, site.store.current_version()) for site in sites]
+        digest = hashlib.sha256(json.dumps(state).encode('utf-8')).hexdigest()
+        return submit_report_job(
+            'export-sites', digest, len(sites),
+            lambda filepath, job: write_sites_report_file(filepath, sites, job.advance),
+            filepath, filename)
+    
     try:
-        with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            
-            # Write report header
-            writer.writerow(['PRESSURE CYLINDER MANAGEMENT COMPLETE REPORT'])
-            writer.writerow(['Generation date:', datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")])
-            writer.writerow([])
-            
-            # Write stock section
-            writer.writerow(['CURRENT STOCK'])
-            writer.writerow(['Cylinder Code', 'Gas Type', 'Pressure (bar)', 
-                           'Cylinder Volume (L)', 'Physical Form', 'Entry Date'])
-            
-            for cylinder in stock:
-                writer.writerow([
-                    cylinder['code'],
-                    cylinder['gasType'],
-                    cylinder['pressure'],
-                    cylinder.get('cylinderVolume', '50'),
-                    get_physical_form_label(cylinder['physicalForm']),
-                    format_date(cylinder['entryDate'])
-                ])
-            
-            writer.writerow([])
-            writer.writerow(['Total cylinders in stock:', len(stock)])
-            
-            # Gas type summary
-            gas_types = {}
-            for cylinder in stock:
-                gas = cylinder['gasType']
-                if gas in gas_types:
-                    gas_types[gas] += 1
-                else:
-                    gas_types[gas] = 1
-            
-            writer.writerow([])
-            writer.writerow(['GAS TYPE SUMMARY'])
-            writer.writerow(['Gas Type', 'Quantity'])
-            for gas, count in gas_types.items():
-                writer.writerow([gas, count])
-            
-            writer.writerow([])
-            
-            # Write history section
-            writer.writerow(['OPERATION HISTORY'])
-            writer.writerow(['Cylinder Code', 'Gas Type', 'Entry Pressure (bar)', 
-                           'Cylinder Volume (L)', 'Exit Pressure (bar)', 'Entry Date', 'Exit Date',
-                           'Consumption (bar)', 'Consumption (%)', 'Consumption (L)'])
-            
-            for record in history:
-                # Calculate consumption metrics
-                pressureIn = float(record['pressureIn'])
-                pressureOut = float(record['pressureOut'])
-                cylinderVolume = float(record.get('cylinderVolume', '50'))
-                consumption = pressureIn - pressureOut
-                consumption_percentage = (consumption / pressureIn * 100) if pressureIn > 0 else 0
-                consumed_liters = (consumption * cylinderVolume)
-                
-                writer.writerow([
-                    record['code'],
-                    record['gasType'],
-                    pressureIn,
-                    cylinderVolume,
-                    pressureOut,
-                    format_date(record['entryDate']),
-                    format_date(record['exitDate']),
-                    round(consumption, 2),
-                    round(consumption_percentage, 2),
-                    round(consumed_liters, 2)
-                ])
-            
-            writer.writerow([])
-            writer.writerow(['Total completed operations:', len(history)])
-            
-            # Consumption summary by gas type
-            gas_consumption = {}  # Bar consumption
-            gas_volume_consumption = {}  # Liter consumption
-            
-            for record in history:
-                gas = record['gasType']
-                pressureIn = float(record['pressureIn'])
-                pressureOut = float(record['pressureOut'])
-                cylinderVolume = float(record.get('cylinderVolume', '50'))
-                
-                # Calculate consumption in bar
-                consumption = pressureIn - pressureOut
-                
-                # Calculate consumption in liters
-                # Formula: consumed_liters = (pressure_diff * cylinder_volume)
-                consumed_liters = (consumption * cylinderVolume)
-                
-                if gas in gas_consumption:
-                    gas_consumption[gas] += consumption
-                    gas_volume_consumption[gas] += consumed_liters
-                else:
-                    gas_consumption[gas] = consumption
-                    gas_volume_consumption[gas] = consumed_liters
-            
-            writer.writerow([])
-            writer.writerow(['GAS CONSUMPTION SUMMARY'])
-            writer.writerow(['Gas Type', 'Total Consumption (bar)', 'Total Consumption (L)'])
-            
-            for gas in gas_consumption:
-                writer.writerow([
-                    gas, 
-                    round(gas_consumption[gas], 2),
-                    round(gas_volume_consumption[gas], 2)
-                ])
-                
-            # Add overall total consumption
-            total_bar_consumption = sum(gas_consumption.values())
-            total_liter_consumption = sum(gas_volume_consumption.values())
-            
-            writer.writerow([])
-            writer.writerow(['TOTAL CONSUMPTION', 
-                           round(total_bar_consumption, 2), 
-                           round(total_liter_consumption, 2)])
-                
+        summary = write_sites_report_file(filepath, sites)
+        
         return jsonify({
             'success': True,
-            'message': f'Complete report successfully generated in {filename}',
-            'filepath': filepath
+            'message': f'Cross-site report successfully generated in {filename}',
+            'filepath': filepath,
+            'sites': [site.name for site in sites],
+            'summary': summary
         })
     
     except Exception as e:
@@ -316,23 +553,207 @@ def export_all():
             'message': f'Error during report generation: {str(e)}'
         }), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Report the progress of a background export"""
+    job = export_jobs.get(job_id)
+    if not job:
+        return jsonify({
+            'success': False,
+            'message': f'Job {job_id} not found'
+        }), 404
+    
+    return jsonify(dict(job.to_dict(), success=True))
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued or running background export"""
+    job = export_jobs.cancel(job_id)
+    if not job:
+        return jsonify({
+            'success': False,
+            'message': f'Job {job_id} not found'
+        }), 404
+    
+    return jsonify(dict(job.to_dict(), success=True))
+
+@app.route('/api/jobs/<job_id>/download', methods=['GET'])
+def download_job_result(job_id):
+    """Download the file produced by a completed background export"""
+    job = export_jobs.get(job_id)
+    if not job:
+        return jsonify({
+            'success': False,
+            'message': f'Job {job_id} not found'
+        }), 404
+    
+    if job.status != 'done':
+        return jsonify(dict(job.to_dict(), success=False, message=f'Job is {job.status}')), 409
+    
+    filepath = job.result['filepath']
+    return send_from_directory(os.path.dirname(filepath), os.path.basename(filepath), as_attachment=True)
+
+def save_snapshot(site, data):
+    """Write a client snapshot as a backup of its site and mirror it into the site's store"""
+    with site.write_lock:
+        entry, written = write_backup(site, data)
+        
+        # Mirror the snapshot into the store (only changed records are written)
+        with request_metrics.phase('store_sync'):
+            version = site.store.replace_all(data)
+    return {'filename': entry['filename'], 'written': written, 'version': version}
+
+def write_backup(site, data):
+    """Write a backup of the site; return (index entry, whether a file was written)"""
+    # Unchanged content is not written again
+    with request_metrics.phase('backup_save'):
+        entry, written = site.backup_store.save(data, generate_timestamp())
+    if written:
+        site.latest_backup_cache.invalidate()
+    return entry, written
+
+def apply_store_changes(site, apply):
+    """Run apply(store) on the site's store and back up the records if it changed them
+
+    Loads serve the newest backup, and a snapshot save makes the store match
+    its snapshot: a change written to the store alone would be missing from
+    loads and deleted by the next save of a client that loaded before it.
+    """
+    with site.write_lock:
+        version = site.store.current_version()
+        result = apply(site.store)
+        if site.store.current_version() != version:
+            write_backup(site, dict(site.store.snapshot(), timestamp=iso_now()))
+    return result
+
+# Saves are acknowledged at once and written in the background: a burst of
+# saves within GAS_MANAGER_SAVE_WINDOW seconds becomes one write of the newest
+# snapshot (0 writes every save before answering)
+SAVE_WINDOW = float(os.environ.get('GAS_MANAGER_SAVE_WINDOW', 2))
+
+# Every site has its own store, change feed, analytics, backups and save queue;
+# the default site is opened at startup
+site_registry = SiteRegistry(
+    OUTPUT_DIR,
+    MAX_OPEN_SITES,
+    save=save_snapshot,
+    retention=RetentionPolicy(BACKUP_KEEP_HOURLY, BACKUP_KEEP_DAILY) if BACKUP_RETENTION else None,
+    max_subscribers=FEED_MAX_SUBSCRIBERS,
+    save_window=SAVE_WINDOW
+)
+
+save_queue_depth = request_metrics.registry.register(Gauge(
+    'gas_manager_save_queue_depth', 'Acknowledged saves not written yet', labels=('site',)))
+save_last_flush = request_metrics.registry.register(Gauge(
+    'gas_manager_save_last_flush_seconds', 'Duration of the last background save write', labels=('site',)))
+
+def serving_requests():
+    """Check whether requests other than change feed streams are being served"""
+    streams = sum(site.change_feed.subscribers for site in site_registry.open_sites())
+    return request_metrics.in_flight.value() > streams
+
+# Exports older than GAS_MANAGER_ARCHIVE_AFTER_DAYS days (0 disables archiving)
+# are moved into monthly archives by a background worker that runs every
+# GAS_MANAGER_ARCHIVE_INTERVAL seconds, uses at most GAS_MANAGER_ARCHIVE_BUDGET
+# of the wall time and steps aside while requests are being served
+lifecycle_worker = LifecycleWorker(
+    lambda: [site_registry.archive(name) for name in site_registry.names()],
+    after_days=int(os.environ.get('GAS_MANAGER_ARCHIVE_AFTER_DAYS', ARCHIVE_AFTER_DAYS)),
+    interval=float(os.environ.get('GAS_MANAGER_ARCHIVE_INTERVAL', ARCHIVE_INTERVAL)),
+    budget=float(os.environ.get('GAS_MANAGER_ARCHIVE_BUDGET', ARCHIVE_BUDGET)),
+    is_busy=serving_requests
+)
+
+archive_last_run = request_metrics.registry.register(Gauge(
+    'gas_manager_archive_last_run_seconds', 'Wall time of the last archiving pass'))
+archive_last_work = request_metrics.registry.register(Gauge(
+    'gas_manager_archive_last_work_seconds', 'Time the last archiving pass spent working (within its budget)'))
+
+# Endpoints that are not bound to a single site
+CROSS_SITE_ENDPOINTS = {'list_sites', 'export_sites', 'job_status', 'cancel_job', 'download_job_result',
+                        'run_archiving'}
+
+@app.before_request
+def resolve_site():
+    """Bind API and download requests to their site (?site= or the X-Site header, else the default site)
+    
+    Writes (POST) create a site on first use; other requests for a site
+    without data answer 404.
+    """
+    if request.path.startswith(('/api/', '/download/')) and request.endpoint not in CROSS_SITE_ENDPOINTS:
+        name = request.args.get('site') or request.headers.get('X-Site') or DEFAULT_SITE
+        g.site = site_registry.get(name, create=request.method == 'POST')
+
+def current_site():
+    """Return the site of the current request"""
+    return g.site
+
+@app.errorhandler(InvalidSiteError)
+def invalid_site(e):
+    return jsonify({
+        'success': False,
+        'message': str(e)
+    }), 400
+
+@app.errorhandler(UnknownSiteError)
+def unknown_site(e):
+    return jsonify({
+        'success': False,
+        'message': str(e)
+    }), 404
+
+# API requests other than these wait for the pending saves of their site
+# first, so that they neither read stale data nor apply changes that an
+# older snapshot would undo
+SAVE_BARRIER_EXEMPT = {'extract_localstorage', 'save_status', 'change_stream'}
+
+@app.before_request
+def wait_for_pending_saves():
+    if request.path.startswith('/api/') and request.endpoint not in SAVE_BARRIER_EXEMPT and 'site' in g:
+        g.site.save_writer.flush()
+
 @app.route('/api/extract-localstorage', methods=['POST'])
 def extract_localstorage():
-    """Receive localStorage data from client and save it to a file"""
-    data = request.json
-    
-    # Generate backup filename with timestamp
-    filename = f"backup_data_{generate_timestamp()}.json"
-    filepath = os.path.join(OUTPUT_DIR, filename)
+    """Receive localStorage data from client and queue it to be saved"""
+    # Check the shape once here so that loads can serve the stored bytes
+    # unparsed; the snapshot is kept whole for the save queue. Its fields are
+    # not checked: the client saves records in progress (e.g. a return
+    # without an exit pressure yet), and a backup must never be refused
+    try:
+        data = request_records(check_fields=False).load()
+    except IngestError as e:
+        return jsonify({
+            'success': False,
+            'message': f'Dati non validi: {str(e)}'
+        }), 400
     
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-                
+        site = current_site()
+        save_id = site.save_writer.submit(data)
+        if SAVE_WINDOW > 0:
+            return jsonify({
+                'success': True,
+                'message': f'Dati ricevuti, salvataggio entro {SAVE_WINDOW:g} s',
+                'save_id': save_id,
+                'pending': site.save_writer.depth()
+            })
+        
+        # Without a coalescing window the save is written before answering
+        flush = site.save_writer.flush()
+        if flush['error']:
+            raise RuntimeError(flush['error'])
+        result = flush['result']
+        if result['written']:
+            message = f"Dati salvati con successo in {result['filename']}"
+        else:
+            message = f"Nessuna modifica, dati già salvati in {result['filename']}"
+        
         return jsonify({
             'success': True,
-            'message': f'Dati salvati con successo in {filename}',
-            'filepath': filepath
+            'message': message,
+            'save_id': save_id,
+            'filepath': os.path.join(site.directory, result['filename']),
+            'version': result['version']
         })
     
     except Exception as e:
@@ -341,43 +762,506 @@ def extract_localstorage():
             'message': f'Errore durante il salvataggio dei dati: {str(e)}'
         }), 500
 
-@app.route('/download/<path:filename>')
-def download_file(filename):
-    """Download a file from the reports directory"""
-    return send_from_directory(OUTPUT_DIR, filename, as_attachment=True)
+@app.route('/api/save-status', methods=['GET'])
+def save_status():
+    """Report the saves waiting to be written and the outcome of the last write"""
+    status = current_site().save_writer.status()
+    return jsonify(dict(status, success=True, site=current_site().name,
+                        message=f"{status['pending']} salvataggi in attesa"))
 
-def get_latest_backup():
-    """Find the most recent backup file in the reports directory"""
-    backup_files = glob.glob(os.path.join(OUTPUT_DIR, "backup_data_*.json"))
-    if not backup_files:
-        return None
+@app.route('/api/sync', methods=['GET'])
+def sync_changes():
+    """Return the records changed or deleted since a client-supplied version"""
+    since = request.args.get('since', 0, type=int)
+    
+    try:
+        return jsonify({
+            'success': True,
+            'message': 'Sincronizzazione completata',
+            'changes': current_site().store.changes_since(since)
+        })
     
-    # Sort files by modification time (newest first)
-    latest_file = max(backup_files, key=os.path.getmtime)
-    return latest_file
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Errore durante la sincronizzazione: {str(e)}'
+        }), 500
 
-@app.route('/api/load-data', methods=['GET'])
-def load_data():
-    """Load data from the most recent backup file"""
-    latest_backup = get_latest_backup()
+@app.route('/api/sync', methods=['POST'])
+def sync_delta():
+    """Apply a delta of changed/deleted records and return changes since the client version"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({
+            'success': False,
+            'message': 'Il corpo della richiesta deve essere un oggetto JSON'
+        }), 400
     
-    if not latest_backup:
+    try:
+        since = int(data.get('since', 0))
+    except (TypeError, ValueError):
         return jsonify({
             'success': False,
-            'message': 'Nessun backup trovato',
-            'data': {'cylinders': [], 'history': []}
+            'message': f"Versione non valida: {data.get('since')!r}"
+        }), 400
+    
+    try:
+        site = current_site()
+        version = apply_store_changes(site, lambda store: store.apply_changes(data))
+        
+        return jsonify({
+            'success': True,
+            'message': f'Modifiche salvate (versione {version})',
+            'version': version,
+            'changes': site.store.changes_since(since)
         })
     
+    except StoreError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Errore durante la sincronizzazione: {str(e)}'
+        }), 500
+
+@app.route('/api/changes', methods=['GET'])
+def change_stream():
+    """Stream store changes as server-sent events, resuming after Last-Event-ID (or ?since=)"""
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
     try:
-        with open(latest_backup, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            
+        since = int(since) if since not in (None, '') else None
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': f'Versione non valida: {since}'
+        }), 400
+    
+    try:
+        stream = current_site().change_feed.subscribe(since)
+    except FeedFull:
+        return jsonify({
+            'success': False,
+            'message': 'Troppi client collegati al flusso delle modifiche'
+        }), 503
+    
+    return Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+# Largest number of events accepted by one /api/batch request
+MAX_BATCH_EVENTS = 5000
+
+@app.route('/api/batch', methods=['POST'])
+def batch_events():
+    """Apply a batch of cylinder entry/return events (e.g. an OCR scan burst) in one transaction
+
+    The whole batch is rejected if any event is invalid, unless the body
+    sets "atomic": false, in which case the valid events are applied.
+    """
+    data = request.get_json(silent=True)
+    events = data.get('events') if isinstance(data, dict) else None
+
+    if not isinstance(events, list) or not events:
+        return jsonify({
+            'success': False,
+            'message': "Il batch deve contenere una lista 'events' non vuota"
+        }), 400
+
+    if len(events) > MAX_BATCH_EVENTS:
+        return jsonify({
+            'success': False,
+            'message': f'Troppi eventi nel batch (massimo {MAX_BATCH_EVENTS})'
+        }), 400
+
+    try:
+        version, results = apply_store_changes(
+            current_site(), lambda store: store.apply_events(events, atomic=data.get('atomic', True) is not False))
+        applied = sum(1 for result in results if result['status'] == 'applied')
+        rejected = sum(1 for result in results if result['status'] == 'rejected')
+
+        if not applied and rejected:
+            return jsonify({
+                'success': False,
+                'message': f'Batch rifiutato: {rejected} eventi non validi',
+                'version': version,
+                'results': results
+            }), 400
+
         return jsonify({
             'success': True,
-            'message': f'Dati caricati da {os.path.basename(latest_backup)}',
-            'data': data
+            'message': f'{applied} eventi applicati, {rejected} rifiutati (versione {version})',
+            'version': version,
+            'results': results
+        })
+
+    except StoreError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Errore durante il salvataggio del batch: {str(e)}'
+        }), 500
+
+# Query string parameters accepted as filters by the query API
+QUERY_FILTERS = ('code', 'code_prefix', 'gas_type', 'physical_form',
+                 'entry_from', 'entry_to', 'exit_from', 'exit_to')
+
+def query_response(kind, default_sort):
+    """Run a filtered, sorted, cursor-paginated store query from the request arguments"""
+    filters = {name: request.args[name] for name in QUERY_FILTERS if request.args.get(name)}
+    
+    try:
+        items, next_cursor = current_site().store.query(
+            kind,
+            filters,
+            sort=request.args.get('sort', default_sort),
+            order=request.args.get('order', 'asc'),
+            limit=request.args.get('limit', 100, type=int),
+            cursor=request.args.get('cursor')
+        )
+        
+        return jsonify({
+            'success': True,
+            'message': f'Found {len(items)} records',
+            'items': items,
+            'count': len(items),
+            'next_cursor': next_cursor
         })
     
+    except StoreError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error during query: {str(e)}'
+        }), 500
+
+@app.route('/api/stock', methods=['GET'])
+def query_stock():
+    """Query cylinders in stock with filters, sorting and cursor pagination"""
+    return query_response('cylinders', 'code')
+
+@app.route('/api/stock/<path:code>', methods=['GET'])
+def get_stock_cylinder(code):
+    """Look up a single cylinder in stock by code"""
+    cylinder = current_site().store.get_cylinder(code)
+    
+    if not cylinder:
+        return jsonify({
+            'success': False,
+            'message': f'Cylinder {code} not found in stock'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'message': f'Cylinder {code} found',
+        'cylinder': cylinder
+    })
+
+@app.route('/api/history', methods=['GET'])
+def query_history():
+    """Query the operation history with filters, sorting and cursor pagination"""
+    return query_response('history', 'exit_date')
+
+@app.route('/api/summary', methods=['GET'])
+def summary():
+    """Return the materialized stock and consumption aggregates (?verify=1 checks them against a rebuild)"""
+    try:
+        store = current_site().store
+        result = dict(store.summary(), success=True)
+        if request.args.get('verify', type=int):
+            mismatches = store.verify_aggregates()
+            result['verified'] = not mismatches
+            result['mismatches'] = mismatches
+        return jsonify(result)
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error reading the summary: {str(e)}'
+        }), 500
+
+@app.route('/api/analytics/consumption', methods=['GET'])
+def consumption_analytics():
+    """Liters consumed per gas type as day/week/month series with a rolling mean"""
+    try:
+        start = request.args.get('from') or None
+        end = request.args.get('to') or None
+        for value in (start, end):
+            if value:
+                datetime.date.fromisoformat(value)
+        
+        result = current_site().analytics.series(
+            granularity=request.args.get('granularity', 'month'),
+            gas_type=request.args.get('gas_type') or None,
+            start=start,
+            end=end,
+            rolling=request.args.get('rolling', type=int)
+        )
+        return jsonify(dict(result, success=True))
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error computing the consumption series: {str(e)}'
+        }), 500
+
+@app.route('/api/analytics/forecast', methods=['GET'])
+def depletion_forecast():
+    """Forecast the days until each gas type runs out at the recent consumption rate"""
+    try:
+        as_of = request.args.get('as_of')
+        result = current_site().analytics.forecast(
+            window=request.args.get('window', 30, type=int),
+            as_of=datetime.date.fromisoformat(as_of) if as_of else None
+        )
+        return jsonify(dict(result, success=True))
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error computing the forecast: {str(e)}'
+        }), 500
+
+@app.route('/api/summary/rebuild', methods=['POST'])
+def rebuild_summary():
+    """Recompute the aggregates from the stored records"""
+    try:
+        store = current_site().store
+        store.rebuild_aggregates()
+        return jsonify(dict(store.summary(), success=True, message='Summary rebuilt'))
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error rebuilding the summary: {str(e)}'
+        }), 500
+
+@app.route('/download/<path:filename>')
+def download_file(filename):
+    """Download a file from the reports directory of the site, or from its archives"""
+    site = current_site()
+    if site.file_path(filename) is None:
+        abort(404)
+    try:
+        return send_from_directory(site.directory, filename, as_attachment=True)
+    except NotFound:
+        # Old exports are served from their monthly archive
+        response = archived_file_response(site, filename)
+        if response is None:
+            raise
+        return response
+
+def archived_file_response(site, filename):
+    """Stream a file out of the site's archives, or return None if it was not archived"""
+    opened = site.archive.open(filename)
+    if opened is None:
+        return None
+    entry, f = opened
+    
+    def generate():
+        while True:
+            chunk = f.read(FILE_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    
+    response = Response(generate(), mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response.content_length = entry['size']
+    response.last_modified = datetime.datetime.fromtimestamp(entry['mtime_ns'] / 1e9)
+    response.headers.set('Content-Disposition', 'attachment', filename=filename)
+    response.call_on_close(f.close)
+    return response
+
+@app.route('/api/archive', methods=['GET'])
+def list_archived():
+    """Search the site's archived exports (?type=, ?month=YYYY-MM, ?q=, ?page=&per_page=)"""
+    page = request.args.get('page', type=int)
+    per_page = request.args.get('per_page', 50, type=int)
+    site = current_site()
+    query = f'?site={site.name}' if site.name != DEFAULT_SITE else ''
+    
+    entries, total = site.archive.search(
+        export_type=request.args.get('type') or None,
+        month=request.args.get('month') or None,
+        name=request.args.get('q') or None,
+        page=page,
+        per_page=per_page
+    )
+    
+    result = {
+        'success': True,
+        'message': f'Found {total} archived files',
+        'files': [dict(entry, download_url=f"/download/{entry['filename']}{query}") for entry in entries],
+        'total': total,
+        'lifecycle': lifecycle_worker.status()
+    }
+    if page:
+        result['page'] = page
+        result['per_page'] = per_page
+    
+    return jsonify(result)
+
+@app.route('/api/archive/run', methods=['POST'])
+def run_archiving():
+    """Start an archiving pass over every site now"""
+    if lifecycle_worker.after_days <= 0:
+        return jsonify({
+            'success': False,
+            'message': 'Archiving is disabled (GAS_MANAGER_ARCHIVE_AFTER_DAYS=0)'
+        }), 409
+    
+    lifecycle_worker.trigger()
+    return jsonify({
+        'success': True,
+        'message': 'Archiving pass started',
+        'lifecycle': lifecycle_worker.status()
+    }), 202
+
+# File suffix of each export format listed by /api/list-exports
+EXPORT_SUFFIXES = dict({'csv': '.csv'}, **COLUMNAR_FORMATS)
+
+@app.route('/api/list-exports', methods=['GET'])
+def list_exports():
+    """List exported CSV, Parquet and Arrow files in the reports directory, newest first"""
+    fmt = request.args.get('format')
+    page = request.args.get('page', type=int)
+    per_page = request.args.get('per_page', 50, type=int)
+
+    try:
+        site = current_site()
+        # Download links of other sites carry the site
+        query = f'?site={site.name}' if site.name != DEFAULT_SITE else ''
+        exports = []
+        with os.scandir(site.directory) as entries:
+            for entry in entries:
+                for name, suffix in EXPORT_SUFFIXES.items():
+                    if entry.name.endswith(suffix) and (not fmt or fmt == name) and entry.is_file():
+                        stat = entry.stat()
+                        exports.append((stat.st_mtime, {
+                            'filename': entry.name,
+                            'format': name,
+                            'size': stat.st_size,
+                            'modified': datetime.datetime.fromtimestamp(stat.st_mtime).strftime("%d/%m/%Y %H:%M:%S"),
+                            'download_url': f'/download/{entry.name}{query}'
+                        }))
+
+        exports.sort(key=lambda item: item[0], reverse=True)
+        total = len(exports)
+        if page:
+            exports = exports[(page - 1) * per_page:page * per_page]
+
+        result = {
+            'success': True,
+            'message': f'Found {total} exports',
+            'exports': [export for _, export in exports],
+            'total': total
+        }
+        if page:
+            result['page'] = page
+            result['per_page'] = per_page
+
+        return jsonify(result)
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error listing exports: {str(e)}',
+            'exports': []
+        }), 500
+
+def get_latest_backup():
+    """Find the most recent backup file in the reports directory"""
+    site = current_site()
+    with request_metrics.phase('backup_scan'):
+        latest = site.backup_index.latest()
+    if not latest:
+        return None
+    
+    return os.path.join(site.directory, latest['filename'])
+
+def backup_envelope(filename):
+    """Return the bytes that wrap a stored backup in the {success, message, data} envelope"""
+    message = json.dumps(f'Dati caricati da {filename}', ensure_ascii=False)
+    return f'{{"success": true, "message": {message}, "data": '.encode('utf-8'), b'}'
+
+def backup_passthrough_response(file_path, filename):
+    """Stream a validated backup file into the response envelope without decoding it"""
+    f = open(file_path, 'rb')
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    prefix, suffix = backup_envelope(filename)
+    
+    def generate():
+        yield prefix
+        for offset in range(0, len(mm), FILE_CHUNK_SIZE):
+            yield mm[offset:offset + FILE_CHUNK_SIZE]
+        yield suffix
+    
+    def cleanup():
+        mm.close()
+        f.close()
+    
+    response = Response(generate(), mimetype='application/json')
+    response.content_length = len(prefix) + len(mm) + len(suffix)
+    response.call_on_close(cleanup)
+    return response
+
+@app.route('/api/load-data', methods=['GET'])
+def load_data():
+    """Load data from the most recent backup file (cached, with ETag revalidation)"""
+    try:
+        with request_metrics.phase('backup_scan'):
+            latest = current_site().latest_backup_cache.get()
+        
+        if not latest:
+            return jsonify({
+                'success': False,
+                'message': 'Nessun backup trovato',
+                'data': {'cylinders': [], 'history': []}
+            })
+        
+        if not latest['valid']:
+            raise ValueError(f"{latest['filename']} non contiene un backup valido")
+        
+        etag = latest['etag']
+        # Weak comparison: the ETag becomes weak when the response is compressed
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            # The stored bytes go into the envelope as they are
+            prefix, suffix = backup_envelope(latest['filename'])
+            response = Response([prefix, latest['raw'], suffix], mimetype='application/json')
+            response.content_length = len(prefix) + len(latest['raw']) + len(suffix)
+        
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
     except Exception as e:
         return jsonify({
             'success': False,
@@ -387,54 +1271,51 @@ def load_data():
 
 @app.route('/api/list-backups', methods=['GET'])
 def list_backups():
-    """List all available backup files"""
-    backup_files = glob.glob(os.path.join(OUTPUT_DIR, "backup_data_*.json"))
+    """List available backup files from the backup index (optionally paged)"""
+    page = request.args.get('page', type=int)
+    per_page = request.args.get('per_page', 50, type=int)
+    
+    with request_metrics.phase('backup_scan'):
+        entries, total = current_site().backup_index.list(page, per_page)
     
-    if not backup_files:
+    if not total:
         return jsonify({
             'success': False,
             'message': 'Nessun backup trovato',
             'backups': []
         })
     
-    # Sort files by modification time (newest first)
-    backup_files.sort(key=os.path.getmtime, reverse=True)
-    
-    # Extract file information
     backups = []
-    for file_path in backup_files:
-        filename = os.path.basename(file_path)
-        mod_time = datetime.datetime.fromtimestamp(os.path.getmtime(file_path))
-        
-        # Try to get cylinder and history counts
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                cylinders_count = len(data.get('cylinders', []))
-                history_count = len(data.get('history', []))
-        except:
-            cylinders_count = 0
-            history_count = 0
-        
+    for entry in entries:
+        mod_time = datetime.datetime.fromtimestamp(entry['mtime_ns'] / 1e9)
         backups.append({
-            'filename': filename,
+            'filename': entry['filename'],
             'modified': mod_time.strftime("%d/%m/%Y %H:%M:%S"),
-            'cylinders_count': cylinders_count,
-            'history_count': history_count
+            'size': entry['size'],
+            'cylinders_count': entry['cylinders_count'],
+            'history_count': entry['history_count'],
+            'sha256': entry['sha256']
         })
     
-    return jsonify({
+    result = {
         'success': True,
-        'message': f'Trovati {len(backups)} backup',
-        'backups': backups
-    })
+        'message': f'Trovati {total} backup',
+        'backups': backups,
+        'total': total
+    }
+    if page:
+        result['page'] = page
+        result['per_page'] = per_page
+    
+    return jsonify(result)
 
 @app.route('/api/load-backup/<path:filename>', methods=['GET'])
 def load_specific_backup(filename):
     """Load data from a specific backup file"""
-    file_path = os.path.join(OUTPUT_DIR, filename)
+    site = current_site()
+    file_path = site.file_path(filename)
     
-    if not os.path.exists(file_path):
+    if not file_path or not os.path.isfile(file_path):
         return jsonify({
             'success': False,
             'message': f'Backup {filename} non trovato',
@@ -442,8 +1323,22 @@ def load_specific_backup(filename):
         }), 404
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        # Backups validated at write time are passed through without decoding;
+        # compressed ones are only decompressed (deltas are rebuilt)
+        entry = site.backup_index.get(filename)
+        if entry and entry['valid']:
+            if entry['format'] == 'plain':
+                return backup_passthrough_response(file_path, filename)
+            
+            raw = site.backup_store.read_bytes(filename)
+            prefix, suffix = backup_envelope(filename)
+            response = Response([prefix, raw, suffix], mimetype='application/json')
+            response.content_length = len(prefix) + len(raw) + len(suffix)
+            return response
+        
+        with request_metrics.phase('json_decode'):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
             
         return jsonify({
             'success': True,
@@ -458,44 +1353,186 @@ def load_specific_backup(filename):
             'data': {'cylinders': [], 'history': []}
         }), 500
 
-def open_browser():
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Expose request and phase metrics in the Prometheus text format"""
+    for site in site_registry.open_sites():
+        status = site.save_writer.status()
+        save_queue_depth.set(status['pending'], site.name)
+        if status['last_flush']:
+            save_last_flush.set(status['last_flush']['latency'], site.name)
+    last_run = lifecycle_worker.last_run
+    if last_run:
+        archive_last_run.set(last_run['duration'])
+        archive_last_work.set(last_run['work_seconds'])
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def start_services():
+    """Compress the static assets, open the default site and start the archiving worker
+
+    Called once by the server process, not on import: the report worker
+    processes import this module too (as __mp_main__ when the server was
+    started as a script) and must not open stores or start threads.
+    """
+    assets.refresh(force=True)
+    site_registry.get(DEFAULT_SITE)
+    atexit.register(site_registry.close)
+    if lifecycle_worker.after_days > 0:
+        lifecycle_worker.start()
+    atexit.register(lifecycle_worker.close)
+
+def open_browser(port=8078):
     """Open browser after Flask app starts"""
     # Get local IP address
     local_ip = get_local_ip()
     # Open browser to the local IP address using HTTPS
-    webbrowser.open_new(f'https://{local_ip}:8078/')
+    webbrowser.open_new(f'https://{local_ip}:{port}/')
+
+def build_ssl_context(cert_path=SSL_CERT, key_path=SSL_KEY, ciphers=TLS_CIPHERS, session_tickets=True):
+    """Create the server TLS context: TLS 1.2+, preferred ciphers and session resumption"""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(cert_path, key_path)
+    context.set_ciphers(ciphers)
+    context.options |= ssl.OP_CIPHER_SERVER_PREFERENCE
+    
+    # Stateless tickets let clients resume sessions (abbreviated handshake) on
+    # any connection; without them TLS 1.2 clients still resume from the
+    # server-side session cache
+    if session_tickets:
+        context.options &= ~ssl.OP_NO_TICKET
+        context.num_tickets = TLS_SESSION_TICKETS
+    else:
+        context.options |= ssl.OP_NO_TICKET
+        context.num_tickets = 0
+    return context
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """Development server handler that keeps HTTP/1.1 connections open between requests
+    
+    Idle connections are closed after `timeout` seconds so they do not hold a
+    server thread forever.
+    """
+    protocol_version = 'HTTP/1.1'
+    timeout = 60
+
+def parse_args(argv=None):
+    """Parse the server command line options"""
+    parser = argparse.ArgumentParser(description='RMIC - Pressure Cylinder Management - Report Server')
+    parser.add_argument('--host', default='0.0.0.0', help='Address to listen on (default: 0.0.0.0)')
+    parser.add_argument('--port', type=int, default=8078, help='Port to listen on (default: 8078)')
+    parser.add_argument('--production', action='store_true',
+                        help='Run the multi-threaded production server instead of the Flask development server')
+    parser.add_argument('--threads', type=int, default=16,
+                        help='Worker threads in production mode (default: 16)')
+    parser.add_argument('--max-threads', type=int, default=64,
+                        help='Upper bound the thread pool may grow to under load (default: 64)')
+    parser.add_argument('--request-timeout', type=float, default=60,
+                        help='Seconds a connection may stay idle or blocked on I/O (default: 60)')
+    parser.add_argument('--keep-alive-connections', type=int, default=32,
+                        help='Idle keep-alive connections kept open (default: 32)')
+    parser.add_argument('--cert', default=SSL_CERT, help='Certificate file (default: ssl/cert.pem)')
+    parser.add_argument('--key', default=SSL_KEY, help='Private key file (default: ssl/key.pem)')
+    parser.add_argument('--ciphers', default=TLS_CIPHERS,
+                        help='OpenSSL cipher list for TLS 1.2 connections (default: ECDHE AEAD suites, ECDSA first)')
+    parser.add_argument('--no-session-tickets', action='store_true',
+                        help='Do not issue TLS session tickets')
+    parser.add_argument('--shutdown-timeout', type=float, default=15,
+                        help='Seconds to let in-flight requests finish on shutdown (default: 15)')
+    parser.add_argument('--headless', action='store_true',
+                        help='Do not open a browser on startup')
+    return parser.parse_args(argv)
+
+def run_production_server(args, context):
+    """Serve the app with the cheroot thread-pool server, terminating TLS in-process"""
+    from cheroot import wsgi
+    from cheroot.ssl.builtin import BuiltinSSLAdapter
+    
+    server = wsgi.Server(
+        (args.host, args.port),
+        app,
+        numthreads=args.threads,
+        max=args.max_threads,
+        request_queue_size=128,
+        timeout=args.request_timeout,
+        shutdown_timeout=args.shutdown_timeout,
+        server_name='gas-manager'
+    )
+    server.keep_alive_conn_limit = args.keep_alive_connections
+    
+    adapter = BuiltinSSLAdapter(args.cert, args.key)
+    adapter.context = context
+    server.ssl_adapter = adapter
+    
+    # Treat SIGTERM like CTRL+C so both end in the same graceful stop
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+    
+    signal.signal(signal.SIGTERM, terminate)
+    
+    try:
+        server.start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Stop accepting connections and let in-flight requests finish
+        print("\n Shutting down, waiting for running requests...")
+        for site in site_registry.open_sites():
+            site.change_feed.close()
+        server.stop()
+        lifecycle_worker.close()
+        # Write the saves still waiting in the coalescing windows
+        site_registry.close()
+        shutdown_report_pool()
 
 if __name__ == '__main__':
+    args = parse_args()
+    
     # Get local IP address
     local_ip = get_local_ip()
     
     # Check if SSL certificates exist
-    if not os.path.exists(SSL_CERT) or not os.path.exists(SSL_KEY):
+    if not os.path.exists(args.cert) or not os.path.exists(args.key):
         print("\nERROR: SSL certificates not found. Please run 'python create_cert.py' first.")
         sys.exit(1)
     
+    # Create SSL context
+    try:
+        context = build_ssl_context(args.cert, args.key, args.ciphers, not args.no_session_tickets)
+    except ssl.SSLError as e:
+        print(f"\nERROR: Invalid TLS configuration: {e}")
+        sys.exit(1)
+    
+    start_services()
+    
     # Open browser automatically
-    Timer(1, open_browser).start()
+    if not args.headless:
+        Timer(1, open_browser, args=(args.port,)).start()
     
     # Print startup message
     print("\n" + "="*80)
     print(" RMIC - Pressure Cylinder Management - Report Server".center(80))
     print("="*80)
-    print(f" Server started: https://{local_ip}:8078/")
-    print(f" Local access: https://127.0.0.1:8078/")
+    print(f" Server started: https://{local_ip}:{args.port}/")
+    print(f" Local access: https://127.0.0.1:{args.port}/")
     print(f" Report directory: {os.path.abspath(OUTPUT_DIR)}")
+    if args.production:
+        print(f" Production mode: {args.threads} threads (max {args.max_threads})")
     print("="*80)
     print(" Press CTRL+C to terminate")
     print("="*80 + "\n")
     
-    # Create SSL context
-    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-    context.load_cert_chain(SSL_CERT, SSL_KEY)
-    
-    # Start Flask app with network access and SSL
-    app.run(
-        host='0.0.0.0', 
-        port=8078, 
-        debug=False,
-        ssl_context=context
-    ) 
\ No newline at end of file
+    if args.production:
+        run_production_server(args, context)
+    else:
+        # Close idle keep-alive connections after the same timeout as the production server
+        KeepAliveRequestHandler.timeout = args.request_timeout
+        
+        # Start Flask app with network access and SSL
+        app.run(
+            host=args.host, 
+            port=args.port, 
+            debug=False,
+            ssl_context=context,
+            request_handler=KeepAliveRequestHandler
+        )
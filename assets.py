@@ -0,0 +1,295 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+import time
+import zlib
+
+from flask import Response, request
+
+# brotli is optional: without it assets and responses are only gzip-compressed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Static files handled by the asset pipeline
+ASSET_EXTENSIONS = ('.html', '.js', '.css', '.svg')
+
+# Directories under the static root that never hold assets
+SKIP_DIRS = ('reports', 'ssl', 'benchmarks', '__pycache__', 'node_modules')
+
+# Seconds between two checks of the static files for changes
+ASSET_CHECK_INTERVAL = 2
+
+# Hex digits of the content hash in fingerprinted URLs
+FINGERPRINT_LENGTH = 12
+
+# URL prefix of fingerprinted assets, cached by browsers for a year
+ASSET_URL_PREFIX = '/assets/'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Responses of these types are compressed on the fly above a minimum size
+COMPRESSIBLE_TYPES = ('application/json', 'text/csv')
+COMPRESS_MIN_SIZE = 8192
+
+# Static assets are compressed once, so at the highest levels; responses are
+# compressed per request, at levels trading some ratio for speed
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 11
+DYNAMIC_GZIP_LEVEL = 5
+DYNAMIC_BROTLI_QUALITY = 4
+
+# src/href attributes pointing at local files, rewritten to fingerprinted URLs
+ASSET_REFERENCE = re.compile(r'''(\b(?:src|href)\s*=\s*)(["'])([^"'?#:]+)\2''')
+
+
+def available_encodings():
+    """Content codings this server can produce, preferred first"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate_encoding(accept_encodings, offered):
+    """Pick the coding of `offered` the client accepts with the highest quality (None for identity)"""
+    best = None
+    best_quality = 0
+    for encoding in offered:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress_bytes(data, encoding, dynamic=False):
+    """Compress a whole body with gzip or brotli"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=DYNAMIC_BROTLI_QUALITY if dynamic else STATIC_BROTLI_QUALITY)
+    return gzip.compress(data, DYNAMIC_GZIP_LEVEL if dynamic else STATIC_GZIP_LEVEL, mtime=0)
+
+
+def iter_compressed(chunks, encoding):
+    """Compress a streamed body chunk by chunk, flushing after each one so it still streams"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=DYNAMIC_BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(DYNAMIC_GZIP_LEVEL, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class Asset:
+    """A static file with its content hash and precompressed variants"""
+
+    def __init__(self, path, stat, body):
+        self.path = path
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.body = body
+        self.digest = hashlib.sha256(body).hexdigest()[:FINGERPRINT_LENGTH]
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.variants = {}
+        for encoding in available_encodings():
+            compressed = compress_bytes(body, encoding)
+            # Keep a variant only when it is actually smaller
+            if len(compressed) < len(body):
+                self.variants[encoding] = compressed
+
+    @property
+    def url(self):
+        """Fingerprinted URL of this version of the file"""
+        stem, ext = posixpath.splitext(self.path)
+        return f'{ASSET_URL_PREFIX}{stem}.{self.digest}{ext}'
+
+
+class AssetPipeline:
+    """Serve static files precompressed, with ETags and fingerprinted immutable URLs
+
+    Files are read and compressed (gzip, and brotli when installed) at
+    startup and again when they change on disk. HTML pages are served with
+    their local script and stylesheet references rewritten to
+    /assets/<name>.<hash>.<ext> URLs, which browsers may cache for a year
+    since a new version gets a new URL; the pages themselves are revalidated
+    with their ETag.
+    """
+
+    def __init__(self, root, skip_dirs=SKIP_DIRS, check_interval=ASSET_CHECK_INTERVAL):
+        self.root = root
+        self.skip_dirs = set(skip_dirs)
+        self.check_interval = check_interval
+        self._assets = {}
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """Rebuild the assets whose files changed since the last check (at most every check_interval)"""
+        if not force and time.monotonic() - self._checked < self.check_interval:
+            return
+        with self._lock:
+            if not force and time.monotonic() - self._checked < self.check_interval:
+                return
+            files = self._scan()
+            changed = (set(files) != set(self._assets) or any(
+                (stat.st_mtime_ns, stat.st_size) != (self._assets[path].mtime_ns, self._assets[path].size)
+                for path, stat in files.items()))
+            if changed:
+                self._assets = self._build(files)
+            self._checked = time.monotonic()
+
+    def get(self, path):
+        """Return the asset of a path relative to the root, or None if it is not an asset"""
+        self.refresh()
+        return self._assets.get(path)
+
+    def response(self, path, fingerprint=None):
+        """Build the response serving an asset, or return None if the path is not an asset
+
+        With the asset's current fingerprint the response may be cached
+        forever; otherwise it must be revalidated with its ETag.
+        """
+        asset = self.get(path)
+        if asset is None:
+            return None
+
+        encoding = negotiate_encoding(request.accept_encodings, asset.variants)
+        etag = f'{asset.digest}-{encoding}' if encoding else asset.digest
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(asset.variants[encoding] if encoding else asset.body, mimetype=asset.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        if fingerprint == asset.digest:
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def fingerprinted_response(self, url_path):
+        """Serve /assets/<name>.<hash>.<ext>; a stale hash gets the current file, revalidated"""
+        stem, ext = posixpath.splitext(url_path)
+        stem, _, fingerprint = stem.rpartition('.')
+        if not stem:
+            return None
+        return self.response(stem + ext, fingerprint)
+
+    def _scan(self):
+        """Map the relative path of every asset file under the root to its stat"""
+        files = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if d not in self.skip_dirs and not d.startswith('.')]
+            for filename in filenames:
+                if filename.endswith(ASSET_EXTENSIONS):
+                    full_path = os.path.join(dirpath, filename)
+                    path = os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                    try:
+                        files[path] = os.stat(full_path)
+                    except OSError:
+                        pass
+        return files
+
+    def _build(self, files):
+        """Load and compress the assets, pages last so they can reference the others' fingerprints"""
+        assets = {}
+        pages = sorted(path for path in files if path.endswith('.html'))
+        for path in sorted(set(files) - set(pages)) + pages:
+            previous = self._assets.get(path)
+            stat = files[path]
+            if (previous and (previous.mtime_ns, previous.size) == (stat.st_mtime_ns, stat.st_size)
+                    and path not in pages):
+                assets[path] = previous
+                continue
+            try:
+                with open(os.path.join(self.root, path), 'rb') as f:
+                    body = f.read()
+            except OSError:
+                continue
+            if path in pages:
+                body = self._rewrite_references(path, body, assets)
+            assets[path] = Asset(path, stat, body)
+        return assets
+
+    @staticmethod
+    def _rewrite_references(page, body, assets):
+        """Point the page's local src/href attributes at the fingerprinted asset URLs"""
+        base = posixpath.dirname(page)
+
+        def replace(match):
+            reference = match.group(3)
+            if reference.startswith('//'):
+                return match.group(0)
+            if reference.startswith('/'):
+                target = reference.lstrip('/')
+            else:
+                target = posixpath.normpath(posixpath.join(base, reference))
+            asset = assets.get(target)
+            if asset is None or asset.path.endswith('.html'):
+                return match.group(0)
+            return f'{match.group(1)}{match.group(2)}{asset.url}{match.group(2)}'
+
+        return ASSET_REFERENCE.sub(replace, body.decode('utf-8')).encode('utf-8')
+
+
+class ResponseCompression:
+    """Compress JSON and CSV responses on the fly for clients that accept it
+
+    Bodies of known size are compressed when larger than min_size; streamed
+    bodies (exports, backups) are compressed chunk by chunk as they are sent.
+    A compressed response's ETag becomes weak, since it no longer identifies
+    the exact bytes sent.
+    """
+
+    def __init__(self, min_size=COMPRESS_MIN_SIZE, mimetypes=COMPRESSIBLE_TYPES):
+        self.min_size = min_size
+        self.mimetypes = tuple(mimetypes)
+
+    def init_app(self, app):
+        app.after_request(self.compress)
+
+    def compress(self, response):
+        if response.mimetype not in self.mimetypes or 'Content-Encoding' in response.headers:
+            return response
+        response.vary.add('Accept-Encoding')
+
+        if response.status_code != 200 or request.range or response.cache_control.no_transform:
+            return response
+        if response.content_length is not None and response.content_length < self.min_size:
+            return response
+        # Stored files are only compressed for CSV: other downloads (backups) are often compressed already
+        if response.direct_passthrough and response.mimetype != 'text/csv':
+            return response
+        encoding = negotiate_encoding(request.accept_encodings, available_encodings())
+        if encoding is None:
+            return response
+
+        if response.is_streamed or response.direct_passthrough:
+            body = response.response
+            chunks = body if response.direct_passthrough else response.iter_encoded()
+            response.response = iter_compressed(chunks, encoding)
+            response.direct_passthrough = False
+            # The wrapped body must still be closed (generators, file wrappers)
+            if hasattr(body, 'close'):
+                response.call_on_close(body.close)
+            del response.headers['Content-Length']
+        else:
+            response.set_data(compress_bytes(response.get_data(), encoding, dynamic=True))
+
+        response.headers['Content-Encoding'] = encoding
+        del response.headers['Accept-Ranges']
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
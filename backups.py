@@ -0,0 +1,575 @@
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+BACKUP_PREFIX = "backup_data_"
+
+# Backup formats, by file suffix:
+#   .json           plain JSON written by older versions (served as is)
+#   .json.gz        gzip-compressed full snapshot (a "base")
+#   .delta.json.gz  gzip-compressed delta against a base snapshot
+PLAIN_SUFFIX = ".json"
+SNAPSHOT_SUFFIX = ".json.gz"
+DELTA_SUFFIX = ".delta.json.gz"
+
+# Sidecar manifest kept next to the backups
+INDEX_FILENAME = "backup_index.json"
+
+# Bumped whenever the manifest entry layout changes, forcing a rescan
+INDEX_VERSION = 2
+
+# A new base snapshot is written after this many deltas on the same base, or
+# when a delta would inline more than this share of the records
+MAX_DELTAS_PER_BASE = 48
+MAX_DELTA_RATIO = 0.5
+
+# Top-level keys ignored when deciding whether a backup changed anything
+VOLATILE_KEYS = ('timestamp',)
+
+
+def is_backup_filename(filename):
+    """Check whether a file name is a backup written by extract_localstorage"""
+    return filename.startswith(BACKUP_PREFIX) and (
+        filename.endswith(PLAIN_SUFFIX) or filename.endswith(SNAPSHOT_SUFFIX))
+
+
+def backup_format(filename):
+    """Return 'delta', 'snapshot' or 'plain' for a backup file name"""
+    if filename.endswith(DELTA_SUFFIX):
+        return 'delta'
+    if filename.endswith(SNAPSHOT_SUFFIX):
+        return 'snapshot'
+    return 'plain'
+
+
+class InvalidBackupError(ValueError):
+    """Raised when a payload does not have the {cylinders, history} backup shape"""
+
+
+def validate_backup(data):
+    """Check that a payload can be stored and later served without re-parsing"""
+    if not isinstance(data, dict):
+        raise InvalidBackupError('Il backup deve essere un oggetto JSON')
+    for key in ('cylinders', 'history'):
+        records = data.get(key, [])
+        if not isinstance(records, list):
+            raise InvalidBackupError(f"'{key}' deve essere una lista")
+        for i, record in enumerate(records):
+            if not isinstance(record, dict):
+                raise InvalidBackupError(f"'{key}'[{i}] deve essere un oggetto")
+
+
+def encode_payload(data):
+    """Serialize a payload in the compact form stored in compressed backups"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def normalize_payload(data):
+    """Put cylinders and history first so every format serializes a payload the same way"""
+    payload = {'cylinders': data.get('cylinders', []), 'history': data.get('history', [])}
+    payload.update((key, value) for key, value in data.items() if key not in payload)
+    return payload
+
+
+def content_hash(data):
+    """Hash the content of a payload, ignoring volatile keys such as the client timestamp"""
+    content = {key: value for key, value in data.items() if key not in VOLATILE_KEYS}
+    return hashlib.sha256(
+        json.dumps(content, ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    ).hexdigest()
+
+
+def record_digest(record):
+    """Hash a single record, independently of key order"""
+    return hashlib.sha1(
+        json.dumps(record, ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    ).digest()
+
+
+def describe_backup(raw, data):
+    """Return the record counts, hashes and validity of a backup payload"""
+    try:
+        validate_backup(data)
+        valid = True
+    except InvalidBackupError:
+        valid = False
+
+    if valid:
+        cylinders_count = len(data.get('cylinders', []))
+        history_count = len(data.get('history', []))
+    else:
+        cylinders_count = history_count = 0
+
+    return {
+        'cylinders_count': cylinders_count,
+        'history_count': history_count,
+        'sha256': hashlib.sha256(raw).hexdigest(),
+        'content_sha256': content_hash(data) if valid else None,
+        'valid': valid
+    }
+
+
+def write_atomic(path, raw):
+    """Write bytes durably to a file: temp file, fsync, atomic rename, then fsync of the directory"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(raw)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_directory(os.path.dirname(path))
+
+
+def fsync_directory(directory):
+    """Persist a rename in a directory (not possible on Windows, where it is skipped)"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(directory or '.', os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def read_backup_bytes(path):
+    """Return the JSON bytes of a plain or snapshot backup without decoding them"""
+    if backup_format(path) == 'snapshot':
+        with gzip.open(path, 'rb') as f:
+            return f.read()
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def record_positions(records):
+    """Map each record digest to the positions where it occurs"""
+    positions = {}
+    for i, record in enumerate(records):
+        positions.setdefault(record_digest(record), []).append(i)
+    return positions
+
+
+def diff_records(positions, records):
+    """Encode records as ops against a base list, given its record_positions()
+
+    An op is either [start, stop] (a run of base records, in order) or a
+    record object that is not in the base. Each base record is used at most
+    once so duplicates are preserved.
+    """
+    cursors = {}
+
+    ops = []
+    inlined = 0
+    for record in records:
+        digest = record_digest(record)
+        candidates = positions.get(digest)
+        cursor = cursors.get(digest, 0)
+        if candidates and cursor < len(candidates):
+            index = candidates[cursor]
+            cursors[digest] = cursor + 1
+            if ops and isinstance(ops[-1], list) and ops[-1][1] == index:
+                ops[-1][1] = index + 1
+            else:
+                ops.append([index, index + 1])
+        else:
+            ops.append(record)
+            inlined += 1
+    return ops, inlined
+
+
+def apply_ops(base_records, ops):
+    """Rebuild a record list from delta ops"""
+    records = []
+    for op in ops:
+        if isinstance(op, list):
+            records.extend(base_records[op[0]:op[1]])
+        else:
+            records.append(op)
+    return records
+
+
+class BackupIndex:
+    """Persistent manifest of the backups in a directory
+
+    Each entry stores filename, mtime, size, format, record counts and content
+    hashes. Entries are trusted while the file's mtime and size are unchanged,
+    so listing backups only costs a directory scan; a payload is read only for
+    files that were added or modified outside the backup store.
+    """
+
+    def __init__(self, directory, loader, index_name=INDEX_FILENAME):
+        self.directory = directory
+        self.loader = loader
+        self.path = os.path.join(directory, index_name)
+        self._lock = threading.RLock()
+        self._entries = self._load()
+
+    def _load(self):
+        """Read the manifest from disk, starting empty if it is missing, corrupt or outdated"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') != INDEX_VERSION:
+                return {}
+            return manifest.get('backups', {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def _save(self):
+        """Write the manifest atomically (temp file + rename)"""
+        raw = json.dumps({'version': INDEX_VERSION, 'backups': self._entries},
+                         ensure_ascii=False).encode('utf-8')
+        write_atomic(self.path, raw)
+
+    def record(self, filepath, raw, data, base=None):
+        """Add or update the entry of a backup that was just written"""
+        stat = os.stat(filepath)
+        entry = {
+            'filename': os.path.basename(filepath),
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'format': backup_format(filepath),
+            'base': base
+        }
+        entry.update(describe_backup(raw, data))
+
+        with self._lock:
+            self._entries[entry['filename']] = entry
+            self._save()
+        return entry
+
+    def refresh(self):
+        """Reconcile the manifest with the directory and return entries, newest first"""
+        with self._lock:
+            changed = False
+            present = set()
+
+            with os.scandir(self.directory) as it:
+                for dir_entry in it:
+                    if not is_backup_filename(dir_entry.name):
+                        continue
+                    present.add(dir_entry.name)
+                    stat = dir_entry.stat()
+                    entry = self._entries.get(dir_entry.name)
+                    if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                        continue
+                    self._entries[dir_entry.name] = self._scan(dir_entry.path, stat)
+                    changed = True
+
+            for filename in list(self._entries):
+                if filename not in present:
+                    del self._entries[filename]
+                    changed = True
+
+            if changed:
+                self._save()
+
+            return sorted(self._entries.values(), key=lambda e: e['mtime_ns'], reverse=True)
+
+    def _scan(self, filepath, stat):
+        """Build the entry of a backup the manifest does not know yet"""
+        entry = {
+            'filename': os.path.basename(filepath),
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'format': backup_format(filepath)
+        }
+        try:
+            raw, data, base = self.loader(filepath)
+        except (OSError, ValueError, KeyError, TypeError):
+            raw, data, base = b'', None, None
+        entry['base'] = base
+        entry.update(describe_backup(raw, data))
+        return entry
+
+    def get(self, filename):
+        """Return the up-to-date entry of one backup, or None if it does not exist"""
+        path = os.path.join(self.directory, filename)
+        if not is_backup_filename(filename) or os.path.dirname(filename):
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(filename)
+            if not (entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size):
+                entry = self._entries[filename] = self._scan(path, stat)
+                self._save()
+            return entry
+
+    def list(self, page=None, per_page=None):
+        """Return (entries, total) for one page of backups, newest first"""
+        entries = self.refresh()
+        total = len(entries)
+        if page and per_page:
+            start = (page - 1) * per_page
+            entries = entries[start:start + per_page]
+        return entries, total
+
+    def latest(self):
+        """Return the entry of the newest backup, or None"""
+        entries = self.refresh()
+        return entries[0] if entries else None
+
+
+class RetentionPolicy:
+    """Keep the newest backup per hour for `hourly` hours and per day for `daily` days
+
+    The newest backup is always kept, as is every base snapshot that a kept
+    delta depends on.
+    """
+
+    def __init__(self, hourly=24, daily=30):
+        self.hourly = hourly
+        self.daily = daily
+
+    def select(self, entries, now=None):
+        """Return the entries to delete (entries are sorted newest first)"""
+        if not entries:
+            return []
+        now = now or datetime.datetime.now()
+        hourly_since = now - datetime.timedelta(hours=self.hourly)
+        daily_since = now - datetime.timedelta(days=self.daily)
+
+        keep = {entries[0]['filename']}
+        seen_hours = set()
+        seen_days = set()
+        for entry in entries:
+            modified = datetime.datetime.fromtimestamp(entry['mtime_ns'] / 1e9)
+            hour = modified.strftime('%Y%m%d%H')
+            day = modified.strftime('%Y%m%d')
+            if modified >= hourly_since and hour not in seen_hours:
+                seen_hours.add(hour)
+                keep.add(entry['filename'])
+            if modified >= daily_since and day not in seen_days:
+                seen_days.add(day)
+                keep.add(entry['filename'])
+
+        by_name = {entry['filename']: entry for entry in entries}
+        for filename in list(keep):
+            base = by_name[filename].get('base')
+            if base:
+                keep.add(base)
+
+        return [entry for entry in entries if entry['filename'] not in keep]
+
+
+class BackupStore:
+    """Compressed, deduplicated backup storage with delta encoding and retention
+
+    A save whose content matches the newest backup is skipped. Otherwise the
+    payload is written either as a gzip snapshot (a base) or as a gzip delta
+    that references runs of records in the current base and inlines the rest.
+    Readers get the same JSON bytes whatever the format, so older plain .json
+    backups keep working.
+    """
+
+    def __init__(self, directory, retention=None):
+        self.directory = directory
+        self.retention = retention
+        self.index = BackupIndex(directory, self.load)
+        self._lock = threading.Lock()
+        self._base_cache = None
+
+    def path(self, filename):
+        """Return the path of a backup file"""
+        return os.path.join(self.directory, filename)
+
+    def load(self, path):
+        """Read any backup format; return (JSON bytes, parsed data, base filename)"""
+        if backup_format(path) != 'delta':
+            raw = read_backup_bytes(path)
+            return raw, json.loads(raw), None
+
+        with gzip.open(path, 'rb') as f:
+            delta = json.loads(f.read())
+        base_data = self._base_data(delta['base'])
+        data = normalize_payload(dict(
+            delta.get('extra', {}),
+            cylinders=apply_ops(base_data.get('cylinders', []), delta['cylinders']),
+            history=apply_ops(base_data.get('history', []), delta['history'])
+        ))
+        return encode_payload(data), data, delta['base']
+
+    def read_bytes(self, filename):
+        """Return the JSON bytes of a backup; only deltas are decoded and re-encoded"""
+        path = self.path(filename)
+        if backup_format(filename) == 'delta':
+            return self.load(path)[0]
+        return read_backup_bytes(path)
+
+    def save(self, data, stamp):
+        """Store a payload; return (index entry, whether a file was written)"""
+        with self._lock:
+            latest = self.index.latest()
+            digest = content_hash(data)
+            if latest and latest.get('content_sha256') == digest:
+                return latest, False
+
+            base = self._current_base(latest)
+            if base:
+                positions = self._base_positions(base)
+                cylinder_ops, cylinders_inlined = diff_records(positions['cylinders'], data.get('cylinders', []))
+                history_ops, history_inlined = diff_records(positions['history'], data.get('history', []))
+                total = len(data.get('cylinders', [])) + len(data.get('history', []))
+                if cylinders_inlined + history_inlined > MAX_DELTA_RATIO * total:
+                    base = None
+
+            data = normalize_payload(data)
+            raw = encode_payload(data)
+            if base:
+                filepath = self._new_path(stamp, DELTA_SUFFIX)
+                delta = {
+                    'base': base,
+                    'extra': {k: v for k, v in data.items() if k not in ('cylinders', 'history')},
+                    'cylinders': cylinder_ops,
+                    'history': history_ops
+                }
+                write_atomic(filepath, gzip.compress(encode_payload(delta), mtime=0))
+            else:
+                filepath = self._new_path(stamp, SNAPSHOT_SUFFIX)
+                write_atomic(filepath, gzip.compress(raw, mtime=0))
+                self._base_cache = (os.path.basename(filepath), data, None)
+
+            entry = self.index.record(filepath, raw, data, base)
+            self.prune()
+            return entry, True
+
+    def prune(self, now=None):
+        """Delete backups outside the retention policy; return the deleted file names
+
+        Plain .json backups were written before retention existed, when every
+        backup was kept, so they are left alone.
+        """
+        if not self.retention:
+            return []
+        entries = [entry for entry in self.index.refresh() if entry['format'] != 'plain']
+        deleted = []
+        for entry in self.retention.select(entries, now):
+            try:
+                os.remove(self.path(entry['filename']))
+                deleted.append(entry['filename'])
+            except OSError:
+                pass
+        if deleted:
+            self.index.refresh()
+        return deleted
+
+    def _current_base(self, latest):
+        """Return the base snapshot a new delta can reference, or None to write a new base"""
+        if not latest or not latest.get('valid'):
+            return None
+        if latest['format'] == 'snapshot':
+            return latest['filename']
+        if latest['format'] == 'delta':
+            base = latest['base']
+            deltas = sum(1 for e in self.index.refresh() if e.get('base') == base)
+            if deltas < MAX_DELTAS_PER_BASE and os.path.exists(self.path(base)):
+                return base
+        return None
+
+    def _base_data(self, base):
+        """Return the parsed payload of a base snapshot (the current base is cached)"""
+        cached = self._base_cache
+        if cached and cached[0] == base:
+            return cached[1]
+        data = json.loads(read_backup_bytes(self.path(base)))
+        self._base_cache = (base, data, None)
+        return data
+
+    def _base_positions(self, base):
+        """Return the record positions of a base snapshot, computed once per base"""
+        data = self._base_data(base)
+        name, _, positions = self._base_cache
+        if positions is None:
+            positions = {
+                'cylinders': record_positions(data.get('cylinders', [])),
+                'history': record_positions(data.get('history', []))
+            }
+            self._base_cache = (name, data, positions)
+        return positions
+
+    def _new_path(self, stamp, suffix):
+        """Build a backup path that does not collide with an existing file"""
+        filepath = self.path(f"{BACKUP_PREFIX}{stamp}{suffix}")
+        counter = 1
+        while os.path.exists(filepath):
+            filepath = self.path(f"{BACKUP_PREFIX}{stamp}_{counter}{suffix}")
+            counter += 1
+        return filepath
+
+
+class LatestBackupCache:
+    """Process-wide cache of the newest backup's bytes
+
+    The cache is checked against the directory mtime (files added or removed)
+    and the cached file's own mtime/size, so a hit costs two stat calls. Plain
+    and snapshot backups are kept as stored (decompressed); they are never
+    decoded because backups are validated when they are written.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.index = store.index
+        self._lock = threading.Lock()
+        self._state = None
+        self._dir_mtime_ns = None
+
+    def invalidate(self):
+        """Drop the cached backup (called after a new backup is written)"""
+        with self._lock:
+            self._state = None
+            self._dir_mtime_ns = None
+
+    def get(self):
+        """Return the cached state of the newest backup, reloading it if needed
+
+        The state is a dict with filename, raw, valid and etag, or None when
+        there are no backups.
+        """
+        with self._lock:
+            dir_mtime_ns = os.stat(self.index.directory).st_mtime_ns
+            state = self._state
+            if state and dir_mtime_ns == self._dir_mtime_ns and self._unchanged(state):
+                return state
+
+            latest = self.index.latest()
+            if not latest:
+                self._state = None
+                return None
+
+            if not (state and state['filename'] == latest['filename'] and self._unchanged(state)):
+                state = self._load(latest)
+
+            self._state = state
+            self._dir_mtime_ns = dir_mtime_ns
+            return state
+
+    def _unchanged(self, state):
+        """Check that the cached file still has the mtime and size it was read with"""
+        try:
+            stat = os.stat(state['path'])
+        except OSError:
+            return False
+        return stat.st_mtime_ns == state['mtime_ns'] and stat.st_size == state['size']
+
+    def _load(self, entry):
+        """Read a backup's bytes"""
+        path = self.store.path(entry['filename'])
+        stat = os.stat(path)
+        raw = self.store.read_bytes(entry['filename']) if entry['valid'] else b''
+        digest = hashlib.sha256(entry['filename'].encode('utf-8') + b'\0' + raw).hexdigest()
+
+        return {
+            'filename': entry['filename'],
+            'path': path,
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'raw': raw,
+            'valid': entry['valid'],
+            'etag': digest
+        }
@@ -0,0 +1,294 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+ENDPOINTS = ['export_stock', 'export_history', 'export_all', 'extract_localstorage',
+             'load_data', 'list_backups']
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MB, if it can be measured"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+
+def directory_size(path):
+    """Return the total size in bytes of the files under a directory"""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+
+def percentile(samples, p):
+    """Linear-interpolated percentile of a list of samples"""
+    ordered = sorted(samples)
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def tail_percentile(samples, p):
+    """Percentile of the slowest requests, or None when there are too few samples to tell it from the maximum"""
+    if len(samples) < 100 / (100 - p):
+        return None
+    return percentile(samples, p)
+
+
+def scaled(value, factor):
+    """Multiply a number that may be missing"""
+    return value * factor if value is not None else None
+
+
+def optional(value, spec):
+    """Format a number that may be missing"""
+    return format(value, spec) if value is not None else '-'
+
+
+def prepare_case(client, endpoint, dataset, backups):
+    """Return a function that builds the (method, url, body) of the i-th request, and the records each request carries
+
+    Throughput is measured on those records: an export of the stock only
+    handles the cylinders of the dataset. Listing backups handles none.
+    """
+    def encoded(payload):
+        return json.dumps(payload).encode('utf-8')
+
+    total = len(dataset['cylinders']) + len(dataset['history'])
+    if endpoint == 'export_stock':
+        body = encoded(dataset['cylinders'])
+        return (lambda i: ('POST', '/api/export-stock', body)), len(dataset['cylinders'])
+    if endpoint == 'export_history':
+        body = encoded(dataset['history'])
+        return (lambda i: ('POST', '/api/export-history', body)), len(dataset['history'])
+    if endpoint == 'export_all':
+        body = encoded(dataset)
+        return (lambda i: ('POST', '/api/export-all', body)), total
+
+    if endpoint == 'extract_localstorage':
+        # Change one record per save so that deduplication does not skip the write
+        def save(i):
+            cylinders = list(dataset['cylinders'])
+            cylinders[0] = dict(cylinders[0], pressure=str(i))
+            return 'POST', '/api/extract-localstorage', encoded(dict(dataset, cylinders=cylinders))
+        return save, total
+
+    # load_data and list_backups read what earlier saves wrote
+    for i in range(backups):
+        cylinders = list(dataset['cylinders'])
+        cylinders[0] = dict(cylinders[0], pressure=f'setup-{i}')
+        client.post('/api/extract-localstorage', data=encoded(dict(dataset, cylinders=cylinders)),
+                    content_type='application/json')
+
+    if endpoint == 'load_data':
+        return (lambda i: ('GET', '/api/load-data', None)), total
+    if endpoint == 'list_backups':
+        return (lambda i: ('GET', '/api/list-backups', None)), 0
+
+    raise ValueError(f'Unknown endpoint {endpoint}')
+
+
+def run_case(endpoint, records, repeat, seed, backups):
+    """Benchmark one endpoint at one dataset size (runs in its own process)"""
+    workdir = tempfile.mkdtemp(prefix='gas_manager_bench_')
+    os.chdir(workdir)
+    os.environ['GAS_MANAGER_BACKUP_RETENTION'] = '0'
+    # Measure the save itself rather than its acknowledgement
+    os.environ['GAS_MANAGER_SAVE_WINDOW'] = '0'
+    sys.path.insert(0, ROOT_DIR)
+    sys.path.insert(0, BENCH_DIR)
+
+    from synthetic import generate_dataset
+    import app
+
+    client = app.app.test_client()
+    dataset = generate_dataset(records, seed)
+    make_request, case_records = prepare_case(
+        client, endpoint, dataset, backups if endpoint in ('load_data', 'list_backups') else 0)
+    reports_dir = os.path.join(workdir, app.OUTPUT_DIR)
+
+    rss_before = peak_rss_mb()
+    latencies = []
+    bytes_written = []
+    request_bytes = response_bytes = 0
+    for i in range(repeat):
+        method, url, body = make_request(i)
+        size_before = directory_size(reports_dir)
+
+        start = time.perf_counter()
+        response = client.open(url, method=method, data=body, content_type='application/json')
+        payload = response.get_data()
+        elapsed = time.perf_counter() - start
+        response.close()
+
+        if response.status_code >= 400:
+            raise RuntimeError(f'{endpoint} returned {response.status_code}: {payload[:200]!r}')
+        latencies.append(elapsed)
+        bytes_written.append(directory_size(reports_dir) - size_before)
+        request_bytes = len(body or b'')
+        response_bytes = len(payload)
+    rss_after = peak_rss_mb()
+
+    median = percentile(latencies, 50)
+    return {
+        'endpoint': endpoint,
+        'records': records,
+        'case_records': case_records,
+        'repeat': repeat,
+        'latency_ms': {
+            'min': min(latencies) * 1000,
+            'p50': median * 1000,
+            'p90': scaled(tail_percentile(latencies, 90), 1000),
+            'p99': scaled(tail_percentile(latencies, 99), 1000),
+            'max': max(latencies) * 1000,
+            'mean': sum(latencies) / len(latencies) * 1000
+        },
+        'records_per_second': case_records / median if median and case_records else None,
+        'requests_per_second': 1 / median if median else None,
+        'peak_rss_mb': rss_after,
+        'peak_rss_growth_mb': (rss_after - rss_before) if rss_after is not None else None,
+        'bytes_written': sum(bytes_written) / len(bytes_written),
+        'request_bytes': request_bytes,
+        'response_bytes': response_bytes
+    }
+
+
+def run_suite(endpoints, sizes, repeat, seed, backups):
+    """Run every (endpoint, size) case in a fresh interpreter and collect the results"""
+    results = []
+    for records in sizes:
+        for endpoint in endpoints:
+            command = [sys.executable, os.path.abspath(__file__), '--case', f'{endpoint}:{records}',
+                       '--repeat', str(repeat), '--seed', str(seed), '--backups', str(backups)]
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(f'  {endpoint:<22} {records:>9}  FAILED\n{completed.stderr.strip()}')
+                continue
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(f"  {endpoint:<22} {records:>9}  p50 {result['latency_ms']['p50']:>10.1f} ms"
+                  f"  p90 {optional(result['latency_ms']['p90'], '.1f'):>10} ms"
+                  f"  {optional(result['records_per_second'], '.0f'):>12} rec/s"
+                  f"  rss {result['peak_rss_mb'] or 0:>8.1f} MB"
+                  f"  written {result['bytes_written'] / 1024:>10.1f} KB")
+    return results
+
+
+def git_revision():
+    """Return the current git commit of the repository, if available"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """Print p50 latency changes against a previous results file; return the regressions"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(r['endpoint'], r['records']): r for r in json.load(f)['results']}
+
+    regressions = []
+    print(f'\nComparison with {baseline_path} (p50 latency):')
+    for result in results:
+        previous = baseline.get((result['endpoint'], result['records']))
+        if not previous:
+            continue
+        before = previous['latency_ms']['p50']
+        after = result['latency_ms']['p50']
+        change = (after - before) / before * 100 if before else 0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(result)
+        print(f"  {result['endpoint']:<22} {result['records']:>9}  {before:>10.1f} -> {after:>10.1f} ms"
+              f"  {change:+7.1f}%{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the app.py endpoints on synthetic datasets')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                        help='Comma-separated endpoints to run (default: all)')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='Comma-separated dataset sizes in records (default: 1k to 1M)')
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='Requests per case (default: 10; p90 needs 10 and p99 needs 100)')
+    parser.add_argument('--seed', type=int, default=42, help='Dataset generator seed (default: 42)')
+    parser.add_argument('--backups', type=int, default=20,
+                        help='Backups written before load_data/list_backups (default: 20)')
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/bench_<timestamp>.json)')
+    parser.add_argument('--compare', help='Previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='p50 slowdown in percent reported as a regression (default: 10)')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        endpoint, records = args.case.split(':')
+        print(json.dumps(run_case(endpoint, int(records), args.repeat, args.seed, args.backups)))
+        return 0
+
+    endpoints = [e for e in args.endpoints.split(',') if e]
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    print(f'Benchmarking {len(endpoints)} endpoints at sizes {sizes}, {args.repeat} requests each')
+    results = run_suite(endpoints, sizes, args.repeat, args.seed, args.backups)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"bench_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'meta': {
+                'created': datetime.datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'revision': git_revision(),
+                'seed': args.seed,
+                'repeat': args.repeat
+            },
+            'results': results
+        }, f, indent=2)
+    print(f'\nResults saved to {output}')
+
+    if args.compare:
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,229 @@
+import argparse
+import datetime
+import http.client
+import json
+import os
+import platform
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_endpoints import ROOT_DIR, RESULTS_DIR, git_revision, percentile
+
+sys.path.insert(0, ROOT_DIR)
+
+import create_cert
+
+KEY_TYPES = list(create_cert.KEY_TYPES)
+
+# full: new connection and full handshake per request
+# resumed: new connection per request, resuming the previous TLS session
+# keep-alive: every request on one HTTP/1.1 connection
+MODES = ['full', 'resumed', 'keep-alive']
+
+TLS_VERSIONS = {
+    '1.2': ssl.TLSVersion.TLSv1_2,
+    '1.3': ssl.TLSVersion.TLSv1_3
+}
+
+# Seconds to wait for a started server to accept TLS connections
+STARTUP_TIMEOUT = 30
+
+
+def free_port():
+    """Return a TCP port that is free on the loopback interface"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def client_context(tls_version):
+    """Client context pinned to one TLS version, accepting the self-signed certificate"""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    context.minimum_version = context.maximum_version = TLS_VERSIONS[tls_version]
+    return context
+
+
+def start_server(server, cert_path, key_path, port, workdir):
+    """Start app.py on the loopback interface and wait until it completes a TLS handshake"""
+    command = [sys.executable, os.path.join(ROOT_DIR, 'app.py'), '--headless', '--host', '127.0.0.1',
+               '--port', str(port), '--cert', cert_path, '--key', key_path]
+    if server == 'production':
+        command.append('--production')
+    process = subprocess.Popen(command, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    context = client_context('1.3')
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'the {server} server exited with status {process.returncode}')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1) as raw:
+                with context.wrap_socket(raw):
+                    return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'the {server} server did not start within {STARTUP_TIMEOUT} s')
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=20)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def request_on_new_connection(port, path, context, session=None):
+    """Send one request on a new TLS connection; return (handshake s, total s, session, reused)"""
+    start = time.perf_counter()
+    raw = socket.create_connection(('127.0.0.1', port))
+    # Like browsers and http.client, do not delay small writes (Nagle)
+    raw.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock = context.wrap_socket(raw, session=session)
+    handshake = time.perf_counter() - start
+
+    sock.sendall(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n'.encode('ascii'))
+    response = b''
+    try:
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            response += chunk
+    except (ssl.SSLEOFError, ConnectionResetError):
+        pass
+    total = time.perf_counter() - start
+    if not response.startswith(b'HTTP/1.1 200'):
+        raise RuntimeError(f'unexpected response: {response[:100]!r}')
+
+    # TLS 1.3 tickets arrive after the handshake, so the session is taken once the response was read
+    new_session, reused = sock.session, sock.session_reused
+    sock.close()
+    return handshake, total, new_session, reused
+
+
+def run_mode(mode, port, path, context, requests):
+    """Time `requests` requests in one connection mode"""
+    handshakes = []
+    totals = []
+    resumed = 0
+
+    if mode == 'keep-alive':
+        start = time.perf_counter()
+        connection = http.client.HTTPSConnection('127.0.0.1', port, context=context)
+        connection.connect()
+        handshakes.append(time.perf_counter() - start)
+        for i in range(requests):
+            if i:
+                start = time.perf_counter()
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                raise RuntimeError(f'unexpected status {response.status}')
+            totals.append(time.perf_counter() - start)
+        connection.close()
+    else:
+        session = None
+        for _ in range(requests):
+            handshake, total, new_session, reused = request_on_new_connection(port, path, context, session)
+            handshakes.append(handshake)
+            totals.append(total)
+            resumed += reused
+            if mode == 'resumed':
+                session = new_session
+
+    def summary(samples):
+        return {
+            'p50': percentile(samples, 50) * 1000,
+            'p90': percentile(samples, 90) * 1000,
+            'mean': sum(samples) / len(samples) * 1000
+        }
+
+    return {
+        'mode': mode,
+        'requests': requests,
+        'handshakes': len(handshakes),
+        'resumed': resumed,
+        'handshake_ms': summary(handshakes),
+        'request_ms': summary(totals),
+        'requests_per_second': len(totals) / sum(totals)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare TLS handshake and request latency of the app.py server')
+    parser.add_argument('--key-types', default=','.join(KEY_TYPES),
+                        help='Comma-separated certificate key types (default: ecdsa,rsa)')
+    parser.add_argument('--modes', default=','.join(MODES),
+                        help='Comma-separated connection modes: full, resumed, keep-alive (default: all)')
+    parser.add_argument('--tls', choices=sorted(TLS_VERSIONS), default='1.3', help='TLS version (default: 1.3)')
+    parser.add_argument('--server', choices=['production', 'dev'], default='production',
+                        help='Server to benchmark (default: production)')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per mode (default: 200)')
+    parser.add_argument('--path', default='/api/list-exports', help='Requested path (default: /api/list-exports)')
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/tls_<timestamp>.json)')
+    args = parser.parse_args(argv)
+
+    key_types = [k for k in args.key_types.split(',') if k]
+    modes = [m for m in args.modes.split(',') if m]
+    if set(key_types) - set(KEY_TYPES):
+        parser.error(f"unknown key types: {', '.join(sorted(set(key_types) - set(KEY_TYPES)))}")
+    if set(modes) - set(MODES):
+        parser.error(f"unknown modes: {', '.join(sorted(set(modes) - set(MODES)))}")
+
+    print(f'Benchmarking the {args.server} server over TLS {args.tls}, {args.requests} requests per mode')
+    results = []
+    for key_type in key_types:
+        workdir = tempfile.mkdtemp(prefix='gas_manager_tls_')
+        cert_path = os.path.join(workdir, 'cert.pem')
+        key_path = os.path.join(workdir, 'key.pem')
+        create_cert.ensure_certificate(cert_path, key_path, key_type, local_ip='127.0.0.1', force=True)
+
+        port = free_port()
+        process = start_server(args.server, cert_path, key_path, port, workdir)
+        try:
+            context = client_context(args.tls)
+            for mode in modes:
+                result = dict(run_mode(mode, port, args.path, context, args.requests), key_type=key_type)
+                results.append(result)
+                print(f"  {key_type:<6} {mode:<11}  handshake p50 {result['handshake_ms']['p50']:>7.2f} ms"
+                      f"  request p50 {result['request_ms']['p50']:>7.2f} ms"
+                      f"  p90 {result['request_ms']['p90']:>7.2f} ms"
+                      f"  {result['requests_per_second']:>8.0f} req/s"
+                      f"  resumed {result['resumed']}/{result['handshakes']}")
+        finally:
+            stop_server(process)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"tls_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'meta': {
+                'created': datetime.datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'openssl': ssl.OPENSSL_VERSION,
+                'platform': platform.platform(),
+                'revision': git_revision(),
+                'server': args.server,
+                'tls': args.tls,
+                'path': args.path
+            },
+            'results': results
+        }, f, indent=2)
+    print(f'\nResults saved to {output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import datetime
+import random
+
+# Gas types seen in the lab, weighted roughly by how often they are used
+GAS_TYPES = [
+    ('N2', 30), ('Ar', 15), ('O2', 12), ('CO2', 10), ('He', 8), ('H2', 6),
+    ('Air', 5), ('N2O', 3), ('CH4', 3), ('C2H2', 2), ('Ne', 1), ('Kr', 1),
+    ('Xe', 1), ('SF6', 1), ('NH3', 1), ('CO', 1)
+]
+
+PHYSICAL_FORMS = [('gas', 80), ('liquid', 12), ('liquidWithDip', 8)]
+
+CYLINDER_VOLUMES = ['50', '40', '20', '10', '5']
+
+# Share of records that come without cylinderVolume (older clients)
+MISSING_VOLUME_RATE = 0.2
+
+# Share of the records that are cylinders still in stock
+STOCK_RATE = 0.1
+
+START_DATE = datetime.datetime(2019, 1, 1, tzinfo=datetime.timezone.utc)
+SPAN_SECONDS = 6 * 365 * 24 * 3600
+
+
+def iso_z(moment):
+    """Format a datetime like JavaScript's toISOString()"""
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f'{moment.microsecond // 1000:03d}Z'
+
+
+def weighted(rng, choices):
+    """Pick a value from (value, weight) pairs"""
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def cylinder_code(rng):
+    """Generate a 14-digit cylinder code"""
+    return '7563' + ''.join(rng.choice('0123456789') for _ in range(10))
+
+
+def make_cylinder(rng, code):
+    """Generate a cylinder in stock as the client stores it"""
+    cylinder = {
+        'code': code,
+        'gasType': weighted(rng, GAS_TYPES),
+        'pressure': str(rng.randint(20, 300)),
+        'physicalForm': weighted(rng, PHYSICAL_FORMS),
+        'entryDate': iso_z(START_DATE + datetime.timedelta(seconds=rng.randrange(SPAN_SECONDS)))
+    }
+    if rng.random() >= MISSING_VOLUME_RATE:
+        cylinder['cylinderVolume'] = rng.choice(CYLINDER_VOLUMES)
+    return cylinder
+
+
+def make_history_record(rng, code):
+    """Generate a completed operation (a returned cylinder)"""
+    entry = START_DATE + datetime.timedelta(seconds=rng.randrange(SPAN_SECONDS))
+    exit_date = entry + datetime.timedelta(seconds=rng.randrange(3600, 120 * 24 * 3600))
+    pressure_in = rng.randint(150, 300)
+    record = {
+        'code': code,
+        'gasType': weighted(rng, GAS_TYPES),
+        'pressureIn': str(pressure_in),
+        'pressureOut': str(rng.randint(0, pressure_in)),
+        'entryDate': iso_z(entry),
+        'exitDate': iso_z(exit_date)
+    }
+    if rng.random() >= MISSING_VOLUME_RATE:
+        record['cylinderVolume'] = rng.choice(CYLINDER_VOLUMES)
+    return record
+
+
+def generate_dataset(records, seed=42):
+    """Generate a deterministic {cylinders, history} dataset with `records` records in total"""
+    rng = random.Random(seed)
+    stock_count = max(1, int(records * STOCK_RATE))
+
+    codes = set()
+    while len(codes) < stock_count:
+        codes.add(cylinder_code(rng))
+    cylinders = [make_cylinder(rng, code) for code in sorted(codes)]
+
+    # Returned cylinders come back many times, so history reuses a pool of codes
+    pool = [cylinder_code(rng) for _ in range(max(1, (records - stock_count) // 20))]
+    history = [make_history_record(rng, rng.choice(pool)) for _ in range(records - stock_count)]
+
+    return {'cylinders': cylinders, 'history': history, 'timestamp': iso_z(START_DATE)}
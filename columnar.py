@@ -0,0 +1,154 @@
+import datetime
+import os
+
+from consumption import ConsumptionTable, cylinder_volume
+from ingest import batched
+
+# pyarrow is optional: without it only CSV exports are available
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# File suffix of each columnar format
+COLUMNAR_FORMATS = {
+    'parquet': '.parquet',
+    'arrow': '.arrow'
+}
+
+# Records converted and written at a time (one Parquet row group / IPC batch),
+# so memory stays bounded by the batch rather than the whole export
+ROW_GROUP_SIZE = 65536
+
+COMPRESSION = 'zstd'
+
+
+class ColumnarUnavailableError(RuntimeError):
+    """Raised when a columnar export is requested but pyarrow is not installed"""
+
+
+def columnar_available():
+    """Check whether pyarrow is installed"""
+    return pa is not None
+
+
+def stock_schema():
+    """Arrow schema of the stock export"""
+    return pa.schema([
+        ('code', pa.string()),
+        ('gas_type', pa.string()),
+        ('pressure_bar', pa.float64()),
+        ('cylinder_volume_l', pa.float64()),
+        ('physical_form', pa.string()),
+        ('entry_date', pa.timestamp('ms', tz='UTC'))
+    ])
+
+
+def history_schema():
+    """Arrow schema of the history export"""
+    return pa.schema([
+        ('code', pa.string()),
+        ('gas_type', pa.string()),
+        ('pressure_in_bar', pa.float64()),
+        ('cylinder_volume_l', pa.float64()),
+        ('pressure_out_bar', pa.float64()),
+        ('entry_date', pa.timestamp('ms', tz='UTC')),
+        ('exit_date', pa.timestamp('ms', tz='UTC')),
+        ('consumption_bar', pa.float64()),
+        ('consumption_percent', pa.float64()),
+        ('consumption_l', pa.float64())
+    ])
+
+
+def parse_float(value):
+    """Convert a client-side numeric string to a float, or None if it is not a number"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_timestamp(value):
+    """Convert a client-side ISO date to an aware datetime, or None if it cannot be parsed"""
+    try:
+        moment = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment
+
+
+def timestamp_array(values):
+    """Build a UTC timestamp column, letting Arrow parse the ISO strings when it can"""
+    try:
+        return pa.array(values, pa.string()).cast(pa.timestamp('ms', tz='UTC'))
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        return pa.array([parse_timestamp(value) for value in values], pa.timestamp('ms', tz='UTC'))
+
+
+def iter_stock_batches(stock):
+    """Yield the stock (any iterable of records) as typed record batches of ROW_GROUP_SIZE rows"""
+    schema = stock_schema()
+    for chunk in batched(stock, ROW_GROUP_SIZE):
+        yield pa.record_batch([
+            pa.array([cylinder['code'] for cylinder in chunk], pa.string()),
+            pa.array([cylinder['gasType'] for cylinder in chunk], pa.string()),
+            pa.array([parse_float(cylinder['pressure']) for cylinder in chunk], pa.float64()),
+            pa.array([parse_float(cylinder_volume(cylinder)) for cylinder in chunk], pa.float64()),
+            pa.array([cylinder['physicalForm'] for cylinder in chunk], pa.string()),
+            timestamp_array([cylinder['entryDate'] for cylinder in chunk])
+        ], schema=schema)
+
+
+def iter_history_batches(history):
+    """Yield the history (any iterable of records) with its consumption metrics as typed record batches of ROW_GROUP_SIZE rows"""
+    schema = history_schema()
+    for chunk in batched(history, ROW_GROUP_SIZE):
+        table = ConsumptionTable.from_history(chunk)
+        yield pa.record_batch([
+            pa.array([record['code'] for record in chunk], pa.string()),
+            pa.array([record['gasType'] for record in chunk], pa.string()),
+            pa.array(table.pressure_in),
+            pa.array(table.volume),
+            pa.array(table.pressure_out),
+            timestamp_array([record['entryDate'] for record in chunk]),
+            timestamp_array([record['exitDate'] for record in chunk]),
+            pa.array(table.consumption),
+            pa.array(table.percentage),
+            pa.array(table.liters)
+        ], schema=schema)
+
+
+EXPORT_KINDS = {
+    'stock': (stock_schema, iter_stock_batches),
+    'history': (history_schema, iter_history_batches)
+}
+
+
+def write_columnar(filepath, fmt, kind, records):
+    """Write stock or history records to a Parquet or Arrow IPC file, one batch at a time
+
+    The file is written under a temporary name and moved into place once
+    complete, so a listed export is never partial.
+    """
+    if not columnar_available():
+        raise ColumnarUnavailableError('pyarrow is not installed')
+
+    make_schema, iter_batches = EXPORT_KINDS[kind]
+    schema = make_schema()
+    tmp_path = filepath + '.part'
+    try:
+        if fmt == 'parquet':
+            writer = pq.ParquetWriter(tmp_path, schema, compression=COMPRESSION)
+        else:
+            writer = pa.ipc.new_file(tmp_path, schema,
+                                     options=pa.ipc.IpcWriteOptions(compression=COMPRESSION))
+        with writer:
+            for batch in iter_batches(records):
+                writer.write_batch(batch)
+        os.replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,75 @@
+import numpy as np
+
+# Volume used when a record has no cylinderVolume (same default as the client)
+DEFAULT_CYLINDER_VOLUME = 50.0
+
+
+def cylinder_volume(record):
+    """Return the cylinderVolume of a record, or the default when it is missing or null"""
+    volume = record.get('cylinderVolume')
+    return DEFAULT_CYLINDER_VOLUME if volume is None else volume
+
+
+class ConsumptionTable:
+    """Columnar view of a history list with vectorized consumption metrics
+
+    Pressures, volumes and gas types are loaded into NumPy arrays in a single
+    pass over the records; consumption in bar, percent and liters
+    (liters = delta bar x cylinder volume) is then computed for all rows at once.
+    """
+
+    def __init__(self, pressure_in, pressure_out, volume, gas_index, gas_types):
+        self.pressure_in = pressure_in
+        self.pressure_out = pressure_out
+        self.volume = volume
+        self.gas_index = gas_index
+        self.gas_types = gas_types
+
+        self.consumption = pressure_in - pressure_out
+        self.percentage = np.divide(
+            self.consumption * 100, pressure_in,
+            out=np.zeros_like(self.consumption), where=pressure_in > 0)
+        self.liters = self.consumption * volume
+
+    @classmethod
+    def from_history(cls, history):
+        """Load the numeric columns of a history list in one pass"""
+        count = len(history)
+        pressure_in = np.empty(count, dtype=np.float64)
+        pressure_out = np.empty(count, dtype=np.float64)
+        volume = np.empty(count, dtype=np.float64)
+        gas_index = np.empty(count, dtype=np.int64)
+
+        # Gas types are encoded as indexes in first-seen order
+        gas_codes = {}
+        for i, record in enumerate(history):
+            pressure_in[i] = float(record['pressureIn'])
+            pressure_out[i] = float(record['pressureOut'])
+            volume[i] = float(cylinder_volume(record))
+            gas_index[i] = gas_codes.setdefault(record['gasType'], len(gas_codes))
+
+        return cls(pressure_in, pressure_out, volume, gas_index, list(gas_codes))
+
+    def __len__(self):
+        return len(self.pressure_in)
+
+    def iter_metrics(self):
+        """Yield (pressureIn, cylinderVolume, pressureOut, bar, percent, liters) per row as floats"""
+        return zip(
+            self.pressure_in.tolist(),
+            self.volume.tolist(),
+            self.pressure_out.tolist(),
+            self.consumption.tolist(),
+            self.percentage.tolist(),
+            self.liters.tolist()
+        )
+
+    def totals_by_gas(self):
+        """Return {gas type: (bar consumed, liters consumed)} in first-seen order"""
+        size = len(self.gas_types)
+        bar = np.bincount(self.gas_index, weights=self.consumption, minlength=size)
+        liters = np.bincount(self.gas_index, weights=self.liters, minlength=size)
+        return {
+            gas: (bar_total, liters_total)
+            for gas, bar_total, liters_total in zip(self.gas_types, bar.tolist(), liters.tolist())
+        }
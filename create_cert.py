@@ -1,13 +1,29 @@
+import argparse
 import os
 import ipaddress
 import socket
-from datetime import datetime, timedelta
+import sys
+from datetime import datetime, timedelta, timezone
 from cryptography import x509
 from cryptography.x509.oid import NameOID
 from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
 from cryptography.hazmat.primitives import serialization
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SSL_DIR = os.path.join(BASE_DIR, 'ssl')
+
+DEFAULT_HOST = "192.168.1.254"
+
+# ECDSA P-256 signatures are much cheaper to produce than RSA-2048 ones, which
+# shortens every full handshake; RSA stays available for very old clients
+KEY_TYPES = ('ecdsa', 'rsa')
+DEFAULT_KEY_TYPE = 'ecdsa'
+
+# Certificates are valid for 10 years and renewed when less than 30 days remain
+VALIDITY_DAYS = 3650
+RENEW_BEFORE_DAYS = 30
+
 # Get local IP address
 def get_local_ip():
     try:
@@ -19,81 +35,174 @@ def get_local_ip():
         s.close()
         return local_ip
     except Exception:
-        return "192.168.1.254"  # Fallback to localhost if can't determine IP
-
-local_ip = get_local_ip()
-print(f"Local IP detected: {local_ip}")
-
-# Create output directory
-os.makedirs('ssl', exist_ok=True)
-
-# Generate private key
-private_key = rsa.generate_private_key(
-    public_exponent=65537,
-    key_size=2048,
-)
-
-# Create a self-signed certificate
-subject = issuer = x509.Name([
-    x509.NameAttribute(NameOID.COUNTRY_NAME, "IT"),
-    x509.NameAttribute(NameOID.STATE_OR_PROVINCE_NAME, "Italy"),
-    x509.NameAttribute(NameOID.LOCALITY_NAME, "Local"),
-    x509.NameAttribute(NameOID.ORGANIZATION_NAME, "RMIC"),
-    x509.NameAttribute(NameOID.COMMON_NAME, "localhost"),
-])
-
-# Use datetime.now() instead of utcnow()
-now = datetime.now()
-
-# Build the SAN list
-san_list = [
-    x509.DNSName("localhost"),
-    x509.DNSName("192.168.1.254"),
-    x509.IPAddress(ipaddress.IPv4Address("192.168.1.254")),
-]
-
-# Add local IP to SAN list
-if local_ip != "192.168.1.254":
-    san_list.append(x509.IPAddress(ipaddress.IPv4Address(local_ip)))
-    san_list.append(x509.DNSName(local_ip))
-    print(f"Added {local_ip} to certificate SAN")
-
-cert = x509.CertificateBuilder().subject_name(
-    subject
-).issuer_name(
-    issuer
-).public_key(
-    private_key.public_key()
-).serial_number(
-    x509.random_serial_number()
-).not_valid_before(
-    now
-).not_valid_after(
-    now + timedelta(days=3650)  # Extended to 10 years
-).add_extension(
-    x509.SubjectAlternativeName(san_list),
-    critical=False,
-).sign(private_key, hashes.SHA256())
-
-# Write private key to file
-with open("ssl/key.pem", "wb") as f:
-    f.write(private_key.private_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.PrivateFormat.PKCS8,
-        encryption_algorithm=serialization.NoEncryption(),
-    ))
-
-# Write certificate to file
-with open("ssl/cert.pem", "wb") as f:
-    f.write(cert.public_bytes(serialization.Encoding.PEM))
-
-print("SSL certificates generated successfully in 'ssl' directory")
-print("\nIMPORTANT: When accessing the application via HTTPS, you will need to")
-print("manually accept the self-signed certificate in your browser.")
-print("This is normal for development environments.")
-print("\nInstructions:")
-print("1. Open the application URL in your browser")
-print("2. You'll see a security warning")
-print("3. Click 'Advanced' or 'Details'")
-print("4. Click 'Proceed anyway' or 'Accept Risk and Continue'")
-print("5. You only need to do this once per browser session") 
\ No newline at end of file
+        return DEFAULT_HOST  # Fallback to the default address if it can't be determined
+
+def generate_private_key(key_type):
+    """Generate an ECDSA P-256 or RSA-2048 private key"""
+    if key_type == 'ecdsa':
+        return ec.generate_private_key(ec.SECP256R1())
+    return rsa.generate_private_key(
+        public_exponent=65537,
+        key_size=2048,
+    )
+
+def key_type_of(key):
+    """Return 'ecdsa' or 'rsa' for a private or public key"""
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)):
+        return 'ecdsa'
+    if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+        return 'rsa'
+    return None
+
+def san_entries(local_ip):
+    """Build the SAN list: localhost, the default address and the detected local IP"""
+    san_list = [
+        x509.DNSName("localhost"),
+        x509.DNSName(DEFAULT_HOST),
+        x509.IPAddress(ipaddress.IPv4Address(DEFAULT_HOST)),
+    ]
+    if local_ip != DEFAULT_HOST:
+        san_list.append(x509.IPAddress(ipaddress.IPv4Address(local_ip)))
+        san_list.append(x509.DNSName(local_ip))
+    return san_list
+
+def build_certificate(private_key, local_ip, days=VALIDITY_DAYS):
+    """Create a self-signed certificate for the key covering localhost and the local IP"""
+    subject = issuer = x509.Name([
+        x509.NameAttribute(NameOID.COUNTRY_NAME, "IT"),
+        x509.NameAttribute(NameOID.STATE_OR_PROVINCE_NAME, "Italy"),
+        x509.NameAttribute(NameOID.LOCALITY_NAME, "Local"),
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, "RMIC"),
+        x509.NameAttribute(NameOID.COMMON_NAME, "localhost"),
+    ])
+    now = datetime.now(timezone.utc)
+
+    return x509.CertificateBuilder().subject_name(
+        subject
+    ).issuer_name(
+        issuer
+    ).public_key(
+        private_key.public_key()
+    ).serial_number(
+        x509.random_serial_number()
+    ).not_valid_before(
+        now - timedelta(minutes=5)  # Tolerate small clock differences with the clients
+    ).not_valid_after(
+        now + timedelta(days=days)
+    ).add_extension(
+        x509.SubjectAlternativeName(san_entries(local_ip)),
+        critical=False,
+    ).sign(private_key, hashes.SHA256())
+
+def not_valid_after(cert):
+    """Expiry of a certificate as an aware datetime (for old and new cryptography versions)"""
+    expiry = getattr(cert, 'not_valid_after_utc', None)
+    if expiry is None:
+        expiry = cert.not_valid_after.replace(tzinfo=timezone.utc)
+    return expiry
+
+def check_existing(cert_path, key_path, key_type, local_ip):
+    """Return the reason the existing certificate must be regenerated, or None if it can be reused
+
+    A `key_type` of None accepts a valid certificate of either key type.
+    """
+    if not os.path.exists(cert_path) or not os.path.exists(key_path):
+        return "no certificate found"
+    try:
+        with open(cert_path, "rb") as f:
+            cert = x509.load_pem_x509_certificate(f.read())
+        with open(key_path, "rb") as f:
+            private_key = serialization.load_pem_private_key(f.read(), password=None)
+    except (ValueError, TypeError) as e:
+        return f"unreadable certificate or key ({e})"
+
+    public_format = (serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    if cert.public_key().public_bytes(*public_format) != private_key.public_key().public_bytes(*public_format):
+        return "the key does not match the certificate"
+    if key_type is not None and key_type_of(private_key) != key_type:
+        return f"the existing key is {key_type_of(private_key) or 'of another type'}, {key_type} requested"
+    if not_valid_after(cert) - datetime.now(timezone.utc) < timedelta(days=RENEW_BEFORE_DAYS):
+        return f"the certificate expires on {not_valid_after(cert):%Y-%m-%d}"
+
+    try:
+        san = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+    except x509.ExtensionNotFound:
+        return "the certificate has no subject alternative names"
+    if ipaddress.IPv4Address(local_ip) not in san.get_values_for_type(x509.IPAddress):
+        return f"the certificate does not cover {local_ip}"
+    return None
+
+def write_certificate(private_key, cert, cert_path, key_path):
+    """Write the key (readable by the owner only) and the certificate in PEM format"""
+    os.makedirs(os.path.dirname(cert_path) or '.', exist_ok=True)
+
+    # Write private key to file
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption(),
+        ))
+
+    # Write certificate to file
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+
+def ensure_certificate(cert_path, key_path, key_type=None, local_ip=None, force=False):
+    """Reuse the existing certificate if still valid, otherwise generate a new one
+
+    Without a `key_type` an existing certificate is kept whatever its key
+    type, and a new one gets a DEFAULT_KEY_TYPE key. Returns True when a new
+    certificate was written.
+    """
+    local_ip = local_ip or get_local_ip()
+    if not force:
+        reason = check_existing(cert_path, key_path, key_type, local_ip)
+        if reason is None:
+            return False
+        print(f"Generating a new certificate: {reason}")
+
+    private_key = generate_private_key(key_type or DEFAULT_KEY_TYPE)
+    cert = build_certificate(private_key, local_ip)
+    write_certificate(private_key, cert, cert_path, key_path)
+    return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate the self-signed SSL certificate of the report server')
+    parser.add_argument('--key-type', choices=KEY_TYPES,
+                        help='Key algorithm: ecdsa (P-256, faster handshakes) or rsa (2048 bit); '
+                             'without it a valid existing certificate of either type is kept, '
+                             'and new certificates use ecdsa')
+    parser.add_argument('--force', action='store_true',
+                        help='Regenerate the certificate even if the existing one is still valid')
+    parser.add_argument('--output-dir', default=SSL_DIR,
+                        help="Directory of cert.pem and key.pem (default: the 'ssl' directory)")
+    args = parser.parse_args(argv)
+
+    local_ip = get_local_ip()
+    print(f"Local IP detected: {local_ip}")
+
+    cert_path = os.path.join(args.output_dir, "cert.pem")
+    key_path = os.path.join(args.output_dir, "key.pem")
+    if not ensure_certificate(cert_path, key_path, args.key_type, local_ip, args.force):
+        print(f"The existing certificate in '{args.output_dir}' is still valid, "
+              "keeping it (use --force to regenerate)")
+        return 0
+
+    if local_ip != DEFAULT_HOST:
+        print(f"Added {local_ip} to certificate SAN")
+    print(f"SSL certificates ({(args.key_type or DEFAULT_KEY_TYPE).upper()}) generated successfully in '{args.output_dir}'")
+    print("\nIMPORTANT: When accessing the application via HTTPS, you will need to")
+    print("manually accept the self-signed certificate in your browser.")
+    print("This is normal for development environments.")
+    print("\nInstructions:")
+    print("1. Open the application URL in your browser")
+    print("2. You'll see a security warning")
+    print("3. Click 'Advanced' or 'Details'")
+    print("4. Click 'Proceed anyway' or 'Accept Risk and Continue'")
+    print("5. You only need to do this once per browser session")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
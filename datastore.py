@@ -0,0 +1,797 @@
+import base64
+import datetime
+import json
+import logging
+import os
+import pathlib
+import sqlite3
+import threading
+
+from consumption import DEFAULT_CYLINDER_VOLUME
+
+logger = logging.getLogger(__name__)
+
+# Schema for the embedded store. Each record keeps its original JSON in `data`
+# so that the client gets back exactly what it sent; the other columns exist
+# only to be indexed.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS cylinders (
+    code TEXT PRIMARY KEY,
+    gas_type TEXT,
+    physical_form TEXT,
+    entry_date TEXT,
+    version INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cylinders_gas_type ON cylinders(gas_type);
+CREATE INDEX IF NOT EXISTS idx_cylinders_physical_form ON cylinders(physical_form);
+CREATE INDEX IF NOT EXISTS idx_cylinders_entry_date ON cylinders(entry_date);
+CREATE INDEX IF NOT EXISTS idx_cylinders_version ON cylinders(version);
+
+CREATE TABLE IF NOT EXISTS history (
+    record_key TEXT PRIMARY KEY,
+    code TEXT,
+    gas_type TEXT,
+    entry_date TEXT,
+    exit_date TEXT,
+    version INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    physical_form TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_history_code ON history(code);
+CREATE INDEX IF NOT EXISTS idx_history_gas_type ON history(gas_type);
+CREATE INDEX IF NOT EXISTS idx_history_physical_form ON history(physical_form);
+CREATE INDEX IF NOT EXISTS idx_history_entry_date ON history(entry_date);
+CREATE INDEX IF NOT EXISTS idx_history_exit_date ON history(exit_date);
+CREATE INDEX IF NOT EXISTS idx_history_version ON history(version);
+
+CREATE TABLE IF NOT EXISTS tombstones (
+    kind TEXT NOT NULL,
+    record_key TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (kind, record_key)
+);
+CREATE INDEX IF NOT EXISTS idx_tombstones_version ON tombstones(version);
+
+CREATE TABLE IF NOT EXISTS aggregates (
+    scope TEXT NOT NULL,
+    dimension TEXT NOT NULL,
+    value TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    bar REAL NOT NULL,
+    liters REAL NOT NULL,
+    PRIMARY KEY (scope, dimension, value)
+);
+"""
+
+# Columns added after the first release, with the statements that backfill them
+MIGRATIONS = [
+    ('history', 'physical_form',
+     "ALTER TABLE history ADD COLUMN physical_form TEXT NOT NULL DEFAULT ''",
+     "UPDATE history SET physical_form = COALESCE(json_extract(data, '$.physicalForm'), '')"),
+]
+
+KINDS = ('cylinders', 'history')
+
+# Filterable and sortable columns of the query API
+QUERY_COLUMNS = {
+    'cylinders': {
+        'sort': {'code': 'code', 'gas_type': 'gas_type', 'physical_form': 'physical_form',
+                 'entry_date': 'entry_date'},
+        'dates': {'entry': 'entry_date'}
+    },
+    'history': {
+        'sort': {'code': 'code', 'gas_type': 'gas_type', 'physical_form': 'physical_form',
+                 'entry_date': 'entry_date', 'exit_date': 'exit_date'},
+        'dates': {'entry': 'entry_date', 'exit': 'exit_date'}
+    }
+}
+
+MAX_PAGE_SIZE = 1000
+
+# Event types accepted by batch ingest
+EVENT_TYPES = ('entry', 'return')
+
+# Codes looked up per IN (...) query, below SQLite's bound parameter limit
+SQL_VARIABLES_LIMIT = 500
+
+# Materialized aggregates, kept up to date by every write. 'stock' sums the
+# pressure (and pressure x volume) of cylinders in stock, 'consumption' the
+# bar and liters consumed by returned cylinders; 'month' is the entry month
+# for stock and the return month for consumption.
+AGGREGATE_SCOPES = {'cylinders': 'stock', 'history': 'consumption'}
+AGGREGATE_DIMENSIONS = ('gas_type', 'physical_form', 'month')
+
+# Daily consumption buckets, the base of the analytics series, share the
+# aggregates table as (DAILY_SCOPE, gas type, return day) rows
+DAILY_SCOPE = 'daily'
+
+# Bumped when the aggregate layout changes, forcing a rebuild on open
+AGGREGATES_VERSION = 2
+
+# Relative tolerance when checking incrementally maintained sums against a rebuild
+AGGREGATE_TOLERANCE = 1e-6
+
+
+class StoreError(Exception):
+    """Raised when a change set cannot be applied to the store"""
+
+
+def history_key(record):
+    """Build the stable key of a history record (explicit id or code/entry/exit)"""
+    if record.get('id') not in (None, ''):
+        return str(record['id'])
+    return f"{record['code']}|{record['entryDate']}|{record['exitDate']}"
+
+
+def record_key(kind, record):
+    """Return the primary key of a record of the given kind"""
+    if kind == 'cylinders':
+        return str(record['code'])
+    return history_key(record)
+
+
+def encode_record(record):
+    """Serialize a record in the compact form stored in the `data` column"""
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+
+
+def record_aggregates(kind, record):
+    """Return the (scope, dimension, value, bar, liters) aggregate contributions of a record"""
+    volume = _number(record.get('cylinderVolume'), DEFAULT_CYLINDER_VOLUME)
+    if kind == 'cylinders':
+        bar = _number(record.get('pressure'))
+        date = record.get('entryDate')
+    else:
+        bar = _number(record.get('pressureIn')) - _number(record.get('pressureOut'))
+        date = record.get('exitDate')
+
+    values = {
+        'gas_type': record.get('gasType') or '',
+        'physical_form': record.get('physicalForm') or '',
+        'month': date[:7] if isinstance(date, str) else ''
+    }
+    scope = AGGREGATE_SCOPES[kind]
+    contributions = [(scope, dimension, values[dimension], bar, bar * volume)
+                     for dimension in AGGREGATE_DIMENSIONS]
+    if kind == 'history' and _is_day(date):
+        contributions.append((DAILY_SCOPE, values['gas_type'], date[:10], bar, bar * volume))
+    return contributions
+
+
+def _is_day(date):
+    """Check that a date string starts with a valid YYYY-MM-DD day"""
+    try:
+        datetime.date.fromisoformat(date[:10])
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def add_aggregates(totals, kind, record, sign=1):
+    """Add (sign=1) or remove (sign=-1) a record's contributions to a {(scope, dimension, value): [count, bar, liters]} map"""
+    for scope, dimension, value, bar, liters in record_aggregates(kind, record):
+        entry = totals.setdefault((scope, dimension, value), [0, 0.0, 0.0])
+        entry[0] += sign
+        entry[1] += sign * bar
+        entry[2] += sign * liters
+
+
+class CylinderStore:
+    """SQLite (WAL) store for cylinders and history with versioned delta sync"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        conn = self._connection()
+        self._migrate(conn)
+        conn.executescript(SCHEMA)
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)")
+        self._summary = None
+        self._listeners = []
+
+        # Databases created before the current aggregates layout are aggregated once
+        row = conn.execute("SELECT value FROM meta WHERE key = 'aggregates'").fetchone()
+        if not row or row['value'] != AGGREGATES_VERSION:
+            self.rebuild_aggregates()
+
+    def _migrate(self, conn):
+        """Add columns missing from databases created by earlier versions"""
+        for table, column, alter, backfill in MIGRATIONS:
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+            if columns and column not in columns:
+                conn.execute(alter)
+                conn.execute(backfill)
+        # Indexed date columns use '' rather than NULL so cursors compare cleanly
+        for table, column in (('cylinders', 'entry_date'), ('history', 'entry_date'), ('history', 'exit_date')):
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,)).fetchone():
+                conn.execute(f"UPDATE {table} SET {column} = '' WHERE {column} IS NULL")
+
+    def _connection(self):
+        """Return the connection of the current thread, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def current_version(self):
+        """Return the version of the last applied change set"""
+        row = self._connection().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row['value']
+
+    def apply_changes(self, changes):
+        """Apply upserts and deletes for cylinders/history in one transaction
+
+        `changes` has the form {'cylinders': {'upsert': [...], 'delete': [...]},
+        'history': {...}}. Deletes are given as record keys (cylinder codes or
+        history keys). Returns the new store version, or the current one if the
+        change set was empty.
+        """
+        return self._transaction(lambda conn: changes)
+
+    def apply_events(self, events, atomic=True):
+        """Apply a batch of cylinder entry/return events in one transaction
+
+        Each event is {'type': 'entry', 'code', 'gasType', 'pressure',
+        'cylinderVolume', 'physicalForm'[, 'entryDate']} or {'type': 'return',
+        'code', 'pressureOut'[, 'newCode', 'exitDate']}, shaped like the
+        records the client creates. Events are checked in order against a hash
+        index of the codes in stock (looked up once for the whole batch and
+        updated as the batch is applied), so a code entered and returned in the
+        same batch is handled correctly. With `atomic`, one invalid event
+        rejects the whole batch. Returns (version, per-event results).
+        """
+        results = []
+
+        def plan(conn):
+            changes, results[:] = self._plan_events(conn, events)
+            if atomic and any(result['status'] == 'rejected' for result in results):
+                for result in results:
+                    if result['status'] == 'applied':
+                        result['status'] = 'aborted'
+                return None
+            return changes
+
+        return self._transaction(plan), results
+
+    def _transaction(self, plan):
+        """Apply the change set returned by plan(conn) under the write lock in one transaction
+
+        plan runs inside the transaction, so what it reads cannot change
+        before its changes are written; it returns None to abort.
+        """
+        conn = self._connection()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                changes = plan(conn)
+                if changes is None:
+                    conn.execute("ROLLBACK")
+                    return self.current_version()
+
+                version = self.current_version() + 1
+                applied = 0
+                deltas = {}
+                for kind in KINDS:
+                    section = changes.get(kind) or {}
+                    for record in section.get('upsert') or []:
+                        self._upsert(conn, kind, record, version, deltas)
+                        applied += 1
+                    for key in section.get('delete') or []:
+                        applied += self._delete(conn, kind, str(key), version, deltas)
+
+                if not applied:
+                    conn.execute("ROLLBACK")
+                    return version - 1
+
+                self._write_aggregates(conn, deltas)
+                conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (version,))
+                conn.execute("COMMIT")
+            except (KeyError, TypeError, AttributeError) as e:
+                conn.execute("ROLLBACK")
+                raise StoreError(f'Invalid record: missing or malformed field {e}')
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+            # Still under the write lock, so listeners see versions in commit order
+            for listener in self._listeners:
+                try:
+                    listener(version)
+                except Exception:
+                    # A failing listener must not fail a write that is already committed
+                    logger.exception('Store listener failed for version %s', version)
+            return version
+
+    def add_listener(self, callback):
+        """Call callback(version) after every committed change set"""
+        self._listeners.append(callback)
+
+    def replace_all(self, data):
+        """Make the store match a full {cylinders, history} snapshot
+
+        Only records that differ from what is stored are written, so a full
+        snapshot that changes little still produces a small version bump.
+        """
+        changes = {}
+        conn = self._connection()
+        for kind in KINDS:
+            table, key_column = _table(kind)
+            stored = {
+                row[0]: row[1]
+                for row in conn.execute(f"SELECT {key_column}, data FROM {table}")
+            }
+            upsert = []
+            seen = set()
+            for record in data.get(kind, []):
+                key = record_key(kind, record)
+                seen.add(key)
+                if stored.get(key) != encode_record(record):
+                    upsert.append(record)
+            changes[kind] = {
+                'upsert': upsert,
+                'delete': [key for key in stored if key not in seen]
+            }
+        return self.apply_changes(changes)
+
+    def changes_since(self, since):
+        """Return the records changed and deleted after version `since`"""
+        conn = self._connection()
+        result = {'version': self.current_version()}
+        for kind in KINDS:
+            table, _ = _table(kind)
+            upsert = [
+                json.loads(row['data'])
+                for row in conn.execute(
+                    f"SELECT data FROM {table} WHERE version > ? ORDER BY rowid", (since,))
+            ]
+            delete = [
+                row['record_key']
+                for row in conn.execute(
+                    "SELECT record_key FROM tombstones WHERE kind = ? AND version > ?",
+                    (kind, since))
+            ]
+            result[kind] = {'upsert': upsert, 'delete': delete}
+        return result
+
+    def snapshot(self):
+        """Return the full {cylinders, history} dataset in insertion order"""
+        return _snapshot(self._connection())
+
+    def summary(self):
+        """Return the stock and consumption aggregates by gas type, physical form and month
+
+        Reads only the aggregates table, whose size depends on the number of
+        gas types, forms and months rather than on the number of records; the
+        result is also cached until the store version changes.
+        """
+        version = self.current_version()
+        cached = self._summary
+        if cached and cached[0] == version:
+            return cached[1]
+
+        result = {'version': version}
+        for scope in AGGREGATE_SCOPES.values():
+            result[scope] = {
+                'total': {'count': 0, 'bar': 0.0, 'liters': 0.0},
+                **{f'by_{dimension}': {} for dimension in AGGREGATE_DIMENSIONS}
+            }
+        scopes = list(AGGREGATE_SCOPES.values())
+        rows = self._connection().execute(
+            f"""SELECT scope, dimension, value, count, bar, liters FROM aggregates
+                WHERE scope IN ({','.join('?' * len(scopes))}) ORDER BY scope, dimension, value""",
+            scopes)
+        for row in rows:
+            section = result[row['scope']]
+            section[f"by_{row['dimension']}"][row['value']] = {
+                'count': row['count'], 'bar': round(row['bar'], 2), 'liters': round(row['liters'], 2)
+            }
+            # Every record is counted once per dimension, so one dimension gives the totals
+            if row['dimension'] == AGGREGATE_DIMENSIONS[0]:
+                total = section['total']
+                total['count'] += row['count']
+                total['bar'] += row['bar']
+                total['liters'] += row['liters']
+        for scope in AGGREGATE_SCOPES.values():
+            total = result[scope]['total']
+            total['bar'] = round(total['bar'], 2)
+            total['liters'] = round(total['liters'], 2)
+
+        self._summary = (version, result)
+        return result
+
+    def daily_consumption(self, gas_type=None, start=None, end=None):
+        """Return the (day, gas type, count, bar, liters) daily consumption buckets, oldest first
+
+        `start` and `end` are inclusive YYYY-MM-DD days.
+        """
+        where = ["scope = ?"]
+        params = [DAILY_SCOPE]
+        if gas_type:
+            where.append("dimension = ?")
+            params.append(gas_type)
+        if start:
+            where.append("value >= ?")
+            params.append(start)
+        if end:
+            where.append("value <= ?")
+            params.append(end)
+        rows = self._connection().execute(
+            f"""SELECT value AS day, dimension AS gas_type, count, bar, liters FROM aggregates
+                WHERE {' AND '.join(where)} ORDER BY value, dimension""", params)
+        return [tuple(row) for row in rows]
+
+    def compute_aggregates(self):
+        """Aggregate the stored records from scratch; return {(scope, dimension, value): [count, bar, liters]}"""
+        conn = self._connection()
+        totals = {}
+        for kind in KINDS:
+            table, _ = _table(kind)
+            for row in conn.execute(f"SELECT data FROM {table}"):
+                add_aggregates(totals, kind, json.loads(row['data']))
+        return totals
+
+    def rebuild_aggregates(self):
+        """Recompute the aggregates table from the stored records"""
+        conn = self._connection()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                totals = self.compute_aggregates()
+                conn.execute("DELETE FROM aggregates")
+                conn.executemany(
+                    "INSERT INTO aggregates (scope, dimension, value, count, bar, liters) VALUES (?, ?, ?, ?, ?, ?)",
+                    [key + tuple(entry) for key, entry in totals.items() if entry[0]])
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('aggregates', ?)",
+                             (AGGREGATES_VERSION,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._summary = None
+
+    def verify_aggregates(self):
+        """Compare the maintained aggregates with a rebuild; return the mismatching entries"""
+        expected = {key: entry for key, entry in self.compute_aggregates().items() if entry[0]}
+        stored = {
+            (row['scope'], row['dimension'], row['value']): [row['count'], row['bar'], row['liters']]
+            for row in self._connection().execute(
+                "SELECT scope, dimension, value, count, bar, liters FROM aggregates")
+        }
+
+        mismatches = []
+        for key in sorted(set(expected) | set(stored)):
+            want = expected.get(key, [0, 0.0, 0.0])
+            have = stored.get(key, [0, 0.0, 0.0])
+            if want[0] != have[0] or any(
+                    abs(w - h) > AGGREGATE_TOLERANCE * max(1.0, abs(w)) for w, h in zip(want[1:], have[1:])):
+                scope, dimension, value = key
+                mismatches.append({
+                    'scope': scope, 'dimension': dimension, 'value': value,
+                    'stored': have, 'expected': want
+                })
+        return mismatches
+
+    def get_cylinder(self, code):
+        """Look up a cylinder in stock by code (primary key), or None"""
+        row = self._connection().execute("SELECT data FROM cylinders WHERE code = ?", (code,)).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def query(self, kind, filters=None, sort='code', order='asc', limit=100, cursor=None):
+        """Return one page of records matching the filters, and the cursor of the next page
+
+        Supported filters: code, code_prefix, gas_type, physical_form and
+        <entry|exit>_from / <entry|exit>_to (ISO dates; a date-only upper
+        bound includes the whole day). Pages are keyset-paginated on
+        (sort column, record key), so every page is an index range scan.
+        """
+        columns = QUERY_COLUMNS.get(kind)
+        if not columns:
+            raise StoreError(f'Unknown record kind: {kind}')
+        if sort not in columns['sort']:
+            raise StoreError(f"Cannot sort {kind} by '{sort}'")
+        if order not in ('asc', 'desc'):
+            raise StoreError(f"Invalid order '{order}'")
+        filters = filters or {}
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        table, key_column = _table(kind)
+        sort_column = columns['sort'][sort]
+        where = []
+        params = []
+
+        for name, column in (('code', 'code'), ('gas_type', 'gas_type'), ('physical_form', 'physical_form')):
+            if filters.get(name):
+                where.append(f"{column} = ?")
+                params.append(filters[name])
+
+        if filters.get('code_prefix'):
+            # Range on the indexed column instead of LIKE, which cannot use it
+            where.append("code >= ? AND code < ?")
+            params.extend([filters['code_prefix'], filters['code_prefix'] + '\U0010ffff'])
+
+        for prefix, column in columns['dates'].items():
+            if filters.get(f'{prefix}_from'):
+                where.append(f"{column} >= ?")
+                params.append(filters[f'{prefix}_from'])
+            if filters.get(f'{prefix}_to'):
+                where.append(f"{column} < ?")
+                params.append(_upper_date_bound(filters[f'{prefix}_to']))
+
+        if cursor:
+            last_value, last_key = _decode_cursor(cursor)
+            comparison = '>' if order == 'asc' else '<'
+            where.append(f"({sort_column}, {key_column}) {comparison} (?, ?)")
+            params.extend([last_value, last_key])
+
+        sql = f"SELECT {sort_column} AS sort_value, {key_column} AS record_key, data FROM {table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {sort_column} {order}, {key_column} {order} LIMIT ?"
+        params.append(limit + 1)
+
+        rows = self._connection().execute(sql, params).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1]['sort_value'], rows[-1]['record_key'])
+
+        return [json.loads(row['data']) for row in rows], next_cursor
+
+    def _plan_events(self, conn, events):
+        """Validate batch events against the stock; return (changes, per-event results)"""
+        if not isinstance(events, list):
+            raise StoreError("'events' must be a list")
+
+        # Hash index of the stock for the codes this batch touches
+        codes = list({str(event['code']).strip() for event in events
+                      if isinstance(event, dict) and event.get('code') not in (None, '')})
+        in_stock = {}
+        for start in range(0, len(codes), SQL_VARIABLES_LIMIT):
+            chunk = codes[start:start + SQL_VARIABLES_LIMIT]
+            placeholders = ','.join('?' * len(chunk))
+            for row in conn.execute(f"SELECT code, data FROM cylinders WHERE code IN ({placeholders})", chunk):
+                in_stock[row['code']] = json.loads(row['data'])
+
+        now = iso_now()
+        entered = {}
+        returned = []
+        removed = {}
+        results = []
+        for index, event in enumerate(events):
+            result = {'index': index, 'status': 'rejected'}
+            results.append(result)
+            try:
+                record = _event_record(event, in_stock, now)
+            except StoreError as e:
+                if isinstance(event, dict):
+                    result.update(type=event.get('type'), code=event.get('code'))
+                result['error'] = str(e)
+                continue
+
+            code = str(event['code']).strip()
+            result.update(type=event['type'], code=code, status='applied')
+            # A code returned and entered again in the same batch is upserted, not deleted
+            if event['type'] == 'entry':
+                in_stock[code] = record
+                entered[code] = record
+                removed.pop(code, None)
+            else:
+                del in_stock[code]
+                if entered.pop(code, None) is None:
+                    removed[code] = True
+                returned.append(record)
+
+        changes = {
+            'cylinders': {'upsert': list(entered.values()), 'delete': list(removed)},
+            'history': {'upsert': returned, 'delete': []}
+        }
+        return changes, results
+
+    def _upsert(self, conn, kind, record, version, deltas):
+        """Insert or update a single record and clear any tombstone for it"""
+        key = record_key(kind, record)
+        table, key_column = _table(kind)
+        previous = conn.execute(f"SELECT data FROM {table} WHERE {key_column} = ?", (key,)).fetchone()
+        if previous:
+            add_aggregates(deltas, kind, json.loads(previous['data']), -1)
+        add_aggregates(deltas, kind, record)
+
+        if kind == 'cylinders':
+            conn.execute(
+                """INSERT INTO cylinders (code, gas_type, physical_form, entry_date, version, data)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(code) DO UPDATE SET
+                       gas_type = excluded.gas_type,
+                       physical_form = excluded.physical_form,
+                       entry_date = excluded.entry_date,
+                       version = excluded.version,
+                       data = excluded.data""",
+                (key, record['gasType'], record.get('physicalForm') or '', record.get('entryDate') or '',
+                 version, encode_record(record)))
+        else:
+            conn.execute(
+                """INSERT INTO history (record_key, code, gas_type, physical_form, entry_date, exit_date,
+                                        version, data)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(record_key) DO UPDATE SET
+                       code = excluded.code,
+                       gas_type = excluded.gas_type,
+                       physical_form = excluded.physical_form,
+                       entry_date = excluded.entry_date,
+                       exit_date = excluded.exit_date,
+                       version = excluded.version,
+                       data = excluded.data""",
+                (key, record['code'], record['gasType'], record.get('physicalForm') or '',
+                 record.get('entryDate') or '', record.get('exitDate') or '', version,
+                 encode_record(record)))
+        conn.execute("DELETE FROM tombstones WHERE kind = ? AND record_key = ?", (kind, key))
+
+    def _delete(self, conn, kind, key, version, deltas):
+        """Delete a single record, leaving a tombstone; return 1 if it existed"""
+        table, key_column = _table(kind)
+        row = conn.execute(f"SELECT data FROM {table} WHERE {key_column} = ?", (key,)).fetchone()
+        if not row:
+            return 0
+        conn.execute(f"DELETE FROM {table} WHERE {key_column} = ?", (key,))
+        add_aggregates(deltas, kind, json.loads(row['data']), -1)
+        conn.execute(
+            "INSERT OR REPLACE INTO tombstones (kind, record_key, version) VALUES (?, ?, ?)",
+            (kind, key, version))
+        return 1
+
+    def _write_aggregates(self, conn, deltas):
+        """Apply the aggregate changes accumulated by a change set"""
+        conn.executemany(
+            """INSERT INTO aggregates (scope, dimension, value, count, bar, liters)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT(scope, dimension, value) DO UPDATE SET
+                   count = count + excluded.count,
+                   bar = bar + excluded.bar,
+                   liters = liters + excluded.liters""",
+            [key + tuple(entry) for key, entry in deltas.items()
+             if entry[0] or entry[1] or entry[2]])
+        conn.execute("DELETE FROM aggregates WHERE count <= 0")
+
+
+def read_snapshot(path):
+    """Return the {cylinders, history} dataset of a store file, opened read-only
+
+    For readers in other processes (report workers): the file is neither
+    created nor migrated, and WAL readers do not block the writing process.
+    """
+    uri = pathlib.Path(os.path.abspath(path)).as_uri() + '?mode=ro'
+    conn = sqlite3.connect(uri, uri=True)
+    try:
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA busy_timeout=5000")
+        return _snapshot(conn)
+    finally:
+        conn.close()
+
+
+def _snapshot(conn):
+    data = {}
+    for kind in KINDS:
+        table, _ = _table(kind)
+        data[kind] = [
+            json.loads(row['data'])
+            for row in conn.execute(f"SELECT data FROM {table} ORDER BY rowid")
+        ]
+    return data
+
+
+def iso_now():
+    """Return the current UTC time formatted like JavaScript's toISOString()"""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return now.strftime('%Y-%m-%dT%H:%M:%S.') + f'{now.microsecond // 1000:03d}Z'
+
+
+def _event_record(event, in_stock, now):
+    """Build the cylinder (entry) or history record (return) of a batch event, or raise StoreError"""
+    if not isinstance(event, dict):
+        raise StoreError('Event must be an object')
+    if event.get('type') not in EVENT_TYPES:
+        raise StoreError(f"Unknown event type '{event.get('type')}' (use entry or return)")
+    code = str(event.get('code') or '').strip()
+    if not code:
+        raise StoreError('Missing cylinder code')
+
+    if event['type'] == 'entry':
+        if code in in_stock:
+            raise StoreError(f'Cylinder {code} is already in stock')
+        for field in ('gasType', 'pressure', 'cylinderVolume'):
+            if event.get(field) in (None, ''):
+                raise StoreError(f"Missing field '{field}'")
+        _require_number(event, 'pressure')
+        _require_number(event, 'cylinderVolume')
+        return {
+            'code': code,
+            'gasType': event['gasType'],
+            'pressure': str(event['pressure']),
+            'cylinderVolume': str(event['cylinderVolume']),
+            'physicalForm': event.get('physicalForm') or 'gas',
+            'entryDate': event.get('entryDate') or now
+        }
+
+    cylinder = in_stock.get(code)
+    if cylinder is None:
+        raise StoreError(f'Cylinder {code} is not in stock')
+    if event.get('pressureOut') in (None, ''):
+        raise StoreError("Missing field 'pressureOut'")
+    _require_number(event, 'pressureOut')
+    return {
+        'code': str(event.get('newCode') or code).strip(),
+        'gasType': cylinder['gasType'],
+        'pressureIn': cylinder['pressure'],
+        'cylinderVolume': cylinder.get('cylinderVolume') or '50',
+        'pressureOut': str(event['pressureOut']),
+        'entryDate': cylinder['entryDate'],
+        'exitDate': event.get('exitDate') or now
+    }
+
+
+def _require_number(event, field):
+    """Check that an event field holds a non-negative number"""
+    try:
+        value = float(event[field])
+    except (TypeError, ValueError):
+        raise StoreError(f"'{field}' must be a number")
+    if value < 0:
+        raise StoreError(f"'{field}' must not be negative")
+
+
+def _number(value, default=0.0):
+    """Convert a client-side numeric field to a float, falling back to a default"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _upper_date_bound(value):
+    """Turn an inclusive upper date bound into an exclusive one"""
+    if len(value) == 10:
+        try:
+            day = datetime.date.fromisoformat(value)
+        except ValueError:
+            raise StoreError(f"Invalid date '{value}'")
+        return (day + datetime.timedelta(days=1)).isoformat()
+    # Full timestamps: include values equal to the bound
+    return value + '\x00'
+
+
+def _encode_cursor(sort_value, key):
+    """Encode the position after the last returned record as an opaque token"""
+    raw = json.dumps([sort_value, key], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    """Decode a cursor produced by _encode_cursor"""
+    try:
+        sort_value, key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        raise StoreError('Invalid cursor')
+    return sort_value, key
+
+
+def _table(kind):
+    """Return (table name, key column) for a record kind"""
+    if kind == 'cylinders':
+        return 'cylinders', 'code'
+    if kind == 'history':
+        return 'history', 'record_key'
+    raise StoreError(f'Unknown record kind: {kind}')
@@ -0,0 +1,171 @@
+import json
+import threading
+from collections import deque
+
+# Recent change events kept in memory for clients resuming after a reconnect
+FEED_BUFFER_EVENTS = 256
+
+# A client further behind than this many changed records is told to reload
+# the full snapshot instead of replaying the changes
+FEED_MAX_CATCH_UP_RECORDS = 5000
+
+# Seconds between keep-alive comments on an idle stream
+FEED_HEARTBEAT = 15
+
+# Milliseconds EventSource clients wait before reconnecting
+FEED_RETRY_MS = 3000
+
+
+class FeedFull(Exception):
+    """Raised when the maximum number of feed subscribers is already connected"""
+
+
+def format_event(event, data, seq=None):
+    """Encode one server-sent event"""
+    lines = []
+    if seq is not None:
+        lines.append(f'id: {seq}')
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
+
+
+def count_records(changes):
+    """Count the records upserted or deleted in a changes_since() result"""
+    return sum(len(changes[kind][op]) for kind in ('cylinders', 'history') for op in ('upsert', 'delete'))
+
+
+class ChangeFeed:
+    """Broadcast store changes to server-sent event streams
+
+    Sequence numbers are store versions. After each committed change set the
+    records changed since the previous event are published once into a ring
+    buffer shared by all streams. A stream resuming from a sequence number
+    still in the buffer replays it; an older one is caught up from the store
+    (changes_since), or sent a 'reset' event when that would be more records
+    than FEED_MAX_CATCH_UP_RECORDS, meaning the client should reload
+    /api/load-data.
+    """
+
+    def __init__(self, store, max_subscribers=32):
+        self.store = store
+        self.max_subscribers = max_subscribers
+        self.subscribers = 0
+        self._events = deque(maxlen=FEED_BUFFER_EVENTS)
+        self._last = store.current_version()
+        self._closed = False
+        self._cond = threading.Condition()
+        store.add_listener(self.publish)
+
+    def publish(self, version):
+        """Record the changes committed up to `version` (called by the store after each commit)"""
+        with self._cond:
+            if version <= self._last:
+                return
+            if not self.subscribers:
+                # Nobody is listening: drop the buffer rather than query for changes
+                self._events.clear()
+                self._last = version
+                return
+
+            changes = self.store.changes_since(self._last)
+            if count_records(changes) > FEED_MAX_CATCH_UP_RECORDS:
+                message = format_event('reset', {'version': changes['version']}, changes['version'])
+            else:
+                message = format_event('change', changes, changes['version'])
+            self._events.append((self._last, changes['version'], message))
+            self._last = changes['version']
+            self._cond.notify_all()
+
+    def close(self):
+        """End all streams (on shutdown)"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def subscribe(self, since=None):
+        """Register a stream starting after sequence `since`; raise FeedFull if at capacity"""
+        with self._cond:
+            if self.subscribers >= self.max_subscribers:
+                raise FeedFull()
+            self.subscribers += 1
+        return FeedStream(self, since)
+
+    def _unsubscribe(self):
+        with self._cond:
+            self.subscribers -= 1
+
+    def _stream(self, since):
+        """Yield the SSE messages of one stream until the client goes away or the feed closes"""
+        yield f'retry: {FEED_RETRY_MS}\n\n'
+        position = yield from self._catch_up(since)
+
+        while True:
+            with self._cond:
+                pending = [event for event in self._events if event[1] > position]
+                if not pending and not self._closed:
+                    self._cond.wait(FEED_HEARTBEAT)
+                    pending = [event for event in self._events if event[1] > position]
+                closed = self._closed
+
+            if closed:
+                return
+            if not pending:
+                yield ': keep-alive\n\n'
+                continue
+            if pending[0][0] > position:
+                # The buffer moved past this stream (slow reader): catch up from the store
+                position = yield from self._catch_up(position)
+                continue
+            for _, seq, message in pending:
+                yield message
+                position = seq
+
+    def _catch_up(self, since):
+        """Yield what a stream starting after `since` is missing; return its new position"""
+        current = self.store.current_version()
+        if since is None:
+            yield format_event('hello', {'version': current}, current)
+            return current
+        if since > current:
+            # The client knows a version this store never had (e.g. a restored database)
+            yield format_event('reset', {'version': current}, current)
+            return current
+
+        with self._cond:
+            buffered = [event for event in self._events if event[1] > since]
+        if buffered and buffered[0][0] <= since:
+            for _, seq, message in buffered:
+                yield message
+            return buffered[-1][1]
+
+        if since == current:
+            return current
+        changes = self.store.changes_since(since)
+        if count_records(changes) > FEED_MAX_CATCH_UP_RECORDS:
+            yield format_event('reset', {'version': changes['version']}, changes['version'])
+        else:
+            yield format_event('change', changes, changes['version'])
+        return changes['version']
+
+
+class FeedStream:
+    """Response body of one feed subscriber; closing it releases the subscription
+
+    The WSGI server closes the body when the client disconnects, even if the
+    stream never started, so the subscriber count cannot leak.
+    """
+
+    def __init__(self, feed, since):
+        self._feed = feed
+        self._messages = feed._stream(since)
+        self._open = True
+
+    def __iter__(self):
+        return self._messages
+
+    def close(self):
+        self._messages.close()
+        if self._open:
+            self._open = False
+            self._feed._unsubscribe()
@@ -10,6 +10,22 @@ const gasManager = {
     cylinders: [],
     history: [],
     
+    // Site (inventory) selected with ?site= in the page URL; empty for the default site
+    site: new URLSearchParams(window.location.search).get('site') || '',
+    
+    // Add the selected site to an API URL
+    apiUrl: function(path) {
+        if (!this.site) {
+            return path;
+        }
+        return `${path}${path.includes('?') ? '&' : '?'}site=${encodeURIComponent(this.site)}`;
+    },
+    
+    // localStorage key of a dataset, separate for each site
+    storageKey: function(name) {
+        return this.site ? `gasManager_${this.site}_${name}` : `gasManager_${name}`;
+    },
+    
     // Initialize application
     init: function() {
         console.log('Initializing Gas Manager System');
@@ -36,6 +52,9 @@ const gasManager = {
                 // Initialize Tesseract worker
                 this.initTesseractWorker();
                 
+                // Receive changes made on other devices
+                this.startChangeFeed();
+                
                 // Remove automatic backup
                 // setInterval(() => this.backupToServer(), 5 * 60 * 1000);
                 
@@ -56,6 +75,7 @@ const gasManager = {
                 this.renderStockTable();
                 this.renderHistoryTable();
                 this.initTesseractWorker();
+                this.startChangeFeed();
             });
     },
     
@@ -2052,27 +2072,7 @@ const gasManager = {
             return;
         }
         
-        fetch('/api/export-stock', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify(this.cylinders)
-        })
-        .then(response => response.json())
-        .then(data => {
-            if (data.success) {
-                this.showNotification(data.message, 'success');
-                // Open the file
-                window.open('/download/' + data.filepath.split('\\').pop(), '_blank');
-            } else {
-                this.showNotification(data.message, 'error');
-            }
-        })
-        .catch(error => {
-            console.error('Export error:', error);
-            this.showNotification('Error during export', 'error');
-        });
+        this.streamExport('/api/export-stock', JSON.stringify(this.cylinders), 'cylinder_stock.csv');
     },
     
     // Export history to CSV
@@ -2082,27 +2082,7 @@ const gasManager = {
             return;
         }
         
-        fetch('/api/export-history', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify(this.history)
-        })
-        .then(response => response.json())
-        .then(data => {
-            if (data.success) {
-                this.showNotification(data.message, 'success');
-                // Open the file
-                window.open('/download/' + data.filepath.split('\\').pop(), '_blank');
-            } else {
-                this.showNotification(data.message, 'error');
-            }
-        })
-        .catch(error => {
-            console.error('Export error:', error);
-            this.showNotification('Error during export', 'error');
-        });
+        this.streamExport('/api/export-history', JSON.stringify(this.history), 'cylinder_history.csv');
     },
     
     // Export all data to CSV
@@ -2112,29 +2092,81 @@ const gasManager = {
             return;
         }
         
-        fetch('/api/export-all', {
+        this.streamExport('/api/export-all', JSON.stringify({
+            cylinders: this.cylinders,
+            history: this.history
+        }), 'complete_cylinder_report.csv');
+    },
+    
+    // Post `body` to a streamed CSV export endpoint and save the response as a file
+    streamExport: function(path, body, suggestedName) {
+        // Where the browser can write a stream to disk, the file is chosen
+        // first (while the click still counts as a user gesture) and the rows
+        // are written to it as they arrive
+        const target = window.showSaveFilePicker
+            ? window.showSaveFilePicker({ suggestedName: suggestedName }).then(handle => handle.createWritable())
+            : Promise.resolve(null);
+        
+        target
+        .then(writable => fetch(this.apiUrl(`${path}?stream=1&save=1`), {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({
-                cylinders: this.cylinders,
-                history: this.history
-            })
+            body: body
         })
-        .then(response => response.json())
-        .then(data => {
-            if (data.success) {
-                this.showNotification(data.message, 'success');
-                // Open the file
-                window.open('/download/' + data.filepath.split('\\').pop(), '_blank');
-            } else {
-                this.showNotification(data.message, 'error');
+        .then(response => this.downloadStreamedCsv(response, writable))
+        .catch(error => {
+            // Leave no partial file behind
+            if (writable) {
+                writable.abort().catch(() => {});
             }
-        })
+            throw error;
+        }))
         .catch(error => {
+            if (error.name === 'AbortError') {
+                return; // Save dialog cancelled
+            }
             console.error('Export error:', error);
-            this.showNotification('Error during export', 'error');
+            this.showNotification(error.message || 'Error during export', 'error');
+        });
+    },
+    
+    // Save a streamed CSV export response to `writable`, or as a file download without one
+    downloadStreamedCsv: function(response, writable) {
+        if (!response.ok) {
+            // Invalid bodies are answered with a JSON message naming the
+            // offending record (kind[index])
+            return response.json()
+                .catch(() => ({}))
+                .then(error => {
+                    throw new Error(error.message || `Export failed with status ${response.status}`);
+                });
+        }
+        
+        // The server sends the file name in the Content-Disposition header
+        const disposition = response.headers.get('Content-Disposition') || '';
+        const match = disposition.match(/filename=([^;]+)/);
+        const filename = match ? match[1] : 'export.csv';
+        
+        if (writable) {
+            return response.body.pipeTo(writable).then(() => {
+                this.showNotification(`Exported ${filename}`, 'success');
+            });
+        }
+        
+        // Browsers without a save dialog API get the whole file in memory
+        return response.blob().then(blob => {
+            const url = URL.createObjectURL(blob);
+            const link = document.createElement('a');
+            link.href = url;
+            link.download = filename;
+            document.body.appendChild(link);
+            link.click();
+            link.remove();
+            URL.revokeObjectURL(url);
+            
+            this.showNotification(`Exported ${filename}`, 'success');
         });
     },
     
@@ -2146,7 +2178,7 @@ const gasManager = {
             timestamp: new Date().toISOString()
         };
         
-        return fetch('/api/extract-localstorage', {
+        return fetch(this.apiUrl('/api/extract-localstorage'), {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -2188,7 +2220,7 @@ const gasManager = {
         const backupsList = document.getElementById('backupsList');
         backupsList.innerHTML = '<tr><td colspan="5" class="text-center">Loading backups...</td></tr>';
         
-        fetch('/api/list-backups')
+        fetch(this.apiUrl('/api/list-backups'))
             .then(response => response.json())
             .then(result => {
                 if (result.success && result.backups.length > 0) {
@@ -2245,7 +2277,7 @@ const gasManager = {
         
         this.showNotification(`Loading backup ${filename}...`, 'info');
         
-        fetch(`/api/load-backup/${filename}`)
+        fetch(this.apiUrl(`/api/load-backup/${filename}`))
             .then(response => response.json())
             .then(result => {
                 if (result.success && result.data) {
@@ -2284,7 +2316,7 @@ const gasManager = {
     // Load data from server
     loadFromServer: function() {
         return new Promise((resolve, reject) => {
-            fetch('/api/load-data')
+            fetch(this.apiUrl('/api/load-data'))
                 .then(response => response.json())
                 .then(result => {
                     if (result.success && result.data) {
@@ -2334,6 +2366,63 @@ const gasManager = {
             });
     },
     
+    // Follow server-side changes (other devices, batch scans) through the change feed
+    startChangeFeed: function() {
+        if (!window.EventSource || this.changeFeed) {
+            return;
+        }
+        
+        // EventSource reconnects by itself and resumes with Last-Event-ID
+        this.changeFeed = new EventSource(this.apiUrl('/api/changes'));
+        
+        this.changeFeed.addEventListener('change', event => {
+            this.applyServerChanges(JSON.parse(event.data));
+        });
+        
+        // Too far behind to replay the changes: reload the full data
+        this.changeFeed.addEventListener('reset', () => {
+            this.refreshFromServer();
+        });
+    },
+    
+    // Merge a change event (upserted and deleted records) into the local data
+    applyServerChanges: function(changes) {
+        const historyKey = record => (record.id !== undefined && record.id !== null && record.id !== '')
+            ? String(record.id)
+            : `${record.code}|${record.entryDate}|${record.exitDate}`;
+        
+        const merge = (records, section, keyOf) => {
+            const deleted = new Set(section.delete);
+            const upserted = new Map(section.upsert.map(record => [keyOf(record), record]));
+            const merged = [];
+            
+            records.forEach(record => {
+                const key = keyOf(record);
+                if (deleted.has(key)) {
+                    return;
+                }
+                if (upserted.has(key)) {
+                    merged.push(upserted.get(key));
+                    upserted.delete(key);
+                } else {
+                    merged.push(record);
+                }
+            });
+            
+            // Records new to this device go at the end, as if added locally
+            upserted.forEach(record => merged.push(record));
+            return merged;
+        };
+        
+        this.cylinders = merge(this.cylinders, changes.cylinders, cylinder => String(cylinder.code));
+        this.history = merge(this.history, changes.history, historyKey);
+        
+        this.saveToLocalStorage();
+        this.updateFilterOptions();
+        this.renderStockTable();
+        this.renderHistoryTable();
+    },
+    
     // Update data source information display
     updateDataSourceInfo: function(message) {
         const infoElement = document.getElementById('dataSourceInfo');
@@ -2346,14 +2435,14 @@ const gasManager = {
     
     // Save data to localStorage
     saveToLocalStorage: function() {
-        localStorage.setItem('gasManager_cylinders', JSON.stringify(this.cylinders));
-        localStorage.setItem('gasManager_history', JSON.stringify(this.history));
+        localStorage.setItem(this.storageKey('cylinders'), JSON.stringify(this.cylinders));
+        localStorage.setItem(this.storageKey('history'), JSON.stringify(this.history));
     },
     
     // Load data from localStorage
     loadFromLocalStorage: function() {
-        const savedCylinders = localStorage.getItem('gasManager_cylinders');
-        const savedHistory = localStorage.getItem('gasManager_history');
+        const savedCylinders = localStorage.getItem(this.storageKey('cylinders'));
+        const savedHistory = localStorage.getItem(this.storageKey('history'));
         
         if (savedCylinders) {
             this.cylinders = JSON.parse(savedCylinders);
@@ -0,0 +1,387 @@
+import codecs
+import itertools
+import json
+import re
+import tempfile
+
+# Bytes read from a request body at a time
+READ_SIZE = 64 * 1024
+
+# Largest encoded size of one record (or of any other member of the body);
+# the parser never buffers more than this beyond the current read
+MAX_RECORD_SIZE = 1024 * 1024
+
+# Members of a body that are arrays of records, parsed one record at a time
+RECORD_KINDS = ('cylinders', 'history')
+
+# Fields checked in each kind of record: name -> (type, required). A null
+# counts as a missing field. Other fields are accepted and kept as they are.
+RECORD_SCHEMAS = {
+    'cylinders': {
+        'code': ('string', True),
+        'gasType': ('string', True),
+        'pressure': ('number', True),
+        'cylinderVolume': ('number', False),
+        'physicalForm': ('string', True),
+        'entryDate': ('string', True)
+    },
+    'history': {
+        'code': ('string', True),
+        'gasType': ('string', True),
+        'pressureIn': ('number', True),
+        'pressureOut': ('number', True),
+        'cylinderVolume': ('number', False),
+        'entryDate': ('string', True),
+        'exitDate': ('string', True)
+    }
+}
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# What may follow the part of a number cut by a read ('12' of '12.75', '1' of '1e5')
+NUMBER_TAIL = re.compile(r'[0-9.eE+-]*\Z')
+
+
+class IngestError(ValueError):
+    """Raised for a malformed request body or a record that does not match its schema
+
+    `kind` and `index` locate the offending record, when there is one.
+    """
+
+    def __init__(self, message, kind=None, index=None):
+        if kind is not None:
+            message = f'{kind}[{index}]: {message}'
+        super().__init__(message)
+        self.kind = kind
+        self.index = index
+
+
+def is_numeric_string(value):
+    """Check for a string holding a number (form inputs send pressures and volumes as strings)"""
+    try:
+        float(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def never(value):
+    return False
+
+
+# Field types: (Python types accepted as they are, check of other values, description)
+FIELD_TYPES = {
+    'string': ((str,), never, 'a string'),
+    'number': ((int, float), is_numeric_string, 'a number')
+}
+
+# The schemas unrolled into (field, required, types, check, description) rows
+SCHEMA_CHECKS = {
+    kind: [(field, required) + FIELD_TYPES[field_type] for field, (field_type, required) in schema.items()]
+    for kind, schema in RECORD_SCHEMAS.items()
+}
+
+
+def validate_record(kind, record, index, check_fields=True):
+    """Check a record against the schema of its kind (or only that it is an object); raise IngestError naming its index"""
+    if type(record) is not dict:
+        raise IngestError('must be an object', kind, index)
+    if not check_fields:
+        return
+    for field, required, types, check, description in SCHEMA_CHECKS[kind]:
+        value = record.get(field)
+        if value is None:
+            if required:
+                raise IngestError(f"'{field}' is required", kind, index)
+        elif type(value) not in types and not check(value):
+            raise IngestError(f"'{field}' must be {description}, not {value!r:.40}", kind, index)
+
+
+def batched(records, size):
+    """Group an iterable of records into lists of at most `size`"""
+    iterator = iter(records)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class TeeReader:
+    """Readable stream copying what is read from another stream to a file and a hash"""
+
+    def __init__(self, stream, copy, digest):
+        self.stream = stream
+        self.copy = copy
+        self.digest = digest
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.copy.write(data)
+        self.digest.update(data)
+        return data
+
+
+class JSONStreamParser:
+    """Incremental parser of a JSON document read from a binary stream
+
+    Values are decoded one at a time with the json module's raw_decode, so
+    the elements of an array can be consumed as the body arrives while only
+    the current read and the value being decoded are buffered.
+    """
+
+    def __init__(self, stream, read_size=READ_SIZE, max_value_size=MAX_RECORD_SIZE):
+        self.stream = stream
+        self.read_size = read_size
+        self.max_value_size = max_value_size
+        self._scan = json.JSONDecoder().scan_once
+        self._text = codecs.getincrementaldecoder('utf-8-sig')()
+        self._buffer = ''
+        self._pos = 0
+        self._offset = 0
+        self._eof = False
+
+    def error(self, message):
+        return IngestError(f'Invalid JSON at character {self._offset + self._pos}: {message}')
+
+    def _fill(self):
+        """Read more of the body; return False at its end"""
+        if self._eof:
+            return False
+        data = self.stream.read(self.read_size)
+
+        # Drop what was consumed before appending
+        self._offset += self._pos
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+        try:
+            self._buffer += self._text.decode(data, final=not data)
+        except UnicodeDecodeError:
+            raise IngestError('The request body is not valid UTF-8')
+        if not data:
+            self._eof = True
+            return False
+        return True
+
+    def _read_more(self):
+        """Read more for a value that may continue past the buffer; False at the end of the body"""
+        if len(self._buffer) - self._pos > self.max_value_size:
+            raise self.error(f'value larger than {self.max_value_size} bytes')
+        return self._fill()
+
+    def peek(self):
+        """Skip whitespace and return the next character ('' at the end of the body)"""
+        while True:
+            self._pos = WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise self.error(f"expected '{char}'")
+        self._pos += 1
+
+    def value(self):
+        """Decode the next value"""
+        if self._pos >= len(self._buffer) or self._buffer[self._pos] in ' \t\n\r':
+            self.peek()
+        while True:
+            try:
+                try:
+                    value, end = self._scan(self._buffer, self._pos)
+                except StopIteration as e:
+                    raise json.JSONDecodeError('Expecting value', self._buffer, e.value)
+            except json.JSONDecodeError as e:
+                # Only an error at the end of the buffer (or an unterminated
+                # string) may come from a value that continues in the next read
+                truncated = e.pos >= len(self._buffer) - 8 or e.msg.startswith('Unterminated string')
+                if truncated and self._read_more():
+                    continue
+                raise IngestError(f'Invalid JSON at character {self._offset + e.pos}: {e.msg}')
+            # A number followed by nothing but number characters up to the end
+            # of the buffer ('12' read from '12.') may continue in the next read
+            if NUMBER_TAIL.match(self._buffer, end) and self._read_more():
+                continue
+            self._pos = end
+            return value
+
+    def _separator(self, close):
+        """Consume the ',' between two items; return False after the closing character"""
+        char = self.peek()
+        if char not in (',', close):
+            raise self.error(f"expected ',' or '{close}'")
+        self._pos += 1
+        return char == ','
+
+    def iter_array(self):
+        """Yield the elements of the array at the current position"""
+        self.expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        scan = self._scan
+        while True:
+            # Most elements end within the buffer and are followed by a ','
+            # (which no number can contain, so the element is complete)
+            buffer, pos = self._buffer, self._pos
+            try:
+                value, end = scan(buffer, pos)
+            except (StopIteration, json.JSONDecodeError):
+                end = None
+            if end is not None and buffer.startswith(',', end):
+                self._pos = WHITESPACE.match(buffer, end + 1).end()
+                yield value
+                continue
+
+            # Otherwise decode it again, reading more of the body as needed
+            yield self.value()
+            if not self._separator(']'):
+                return
+            self.peek()
+
+    def iter_object(self):
+        """Yield the keys of the object at the current position; each value must be consumed before the next key"""
+        self.expect('{')
+        if self.peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise self.error('expected a member name')
+            key = self.value()
+            self.expect(':')
+            yield key
+            if not self._separator('}'):
+                return
+
+    def end(self):
+        """Check that nothing but whitespace follows the document"""
+        if self.peek() != '':
+            raise self.error('unexpected data after the end of the body')
+
+
+class RecordStream:
+    """The validated records of a JSON request body, parsed while they are consumed
+
+    With `kind` set, the body is an array of records of that kind; otherwise
+    it is an object whose 'cylinders' and 'history' members are arrays of
+    records. `records(kind)` yields one kind at a time. An array met before
+    the one being read is spooled to a temporary file, one record per line,
+    and replayed when its turn comes, so memory never holds more than a
+    record whatever the order of the members. The other members of the
+    object are kept in `extras`; `counts` is the number of records read of
+    each kind. Without `check_fields`, records are only checked to be
+    objects.
+    """
+
+    def __init__(self, stream, kind=None, max_record_size=MAX_RECORD_SIZE, check_fields=True, read_size=READ_SIZE):
+        self.kind = kind
+        self.check_fields = check_fields
+        self.counts = dict.fromkeys(RECORD_KINDS, 0)
+        self.extras = {}
+        self._parser = JSONStreamParser(stream, read_size, max_record_size)
+        self._keys = None
+        self._seen = set()
+        self._spools = {}
+        self._finished = False
+
+    def _open(self):
+        if self._keys is not None:
+            return
+        char = self._parser.peek()
+        if char == '':
+            raise IngestError('The request body is empty')
+        if self.kind is not None:
+            if char != '[':
+                raise IngestError(f'The request body must be a JSON array of {self.kind}')
+            self._keys = iter([self.kind])
+        else:
+            if char != '{':
+                raise IngestError('The request body must be a JSON object')
+            self._keys = self._parser.iter_object()
+
+    def _is_records(self, key):
+        """Check whether a member holds records; the parser is then at its array"""
+        if key not in RECORD_KINDS:
+            return False
+        if key in self._seen:
+            raise IngestError(f"'{key}' appears more than once")
+        if self._parser.peek() != '[':
+            raise IngestError(f"'{key}' must be an array")
+        self._seen.add(key)
+        return True
+
+    def _validated(self, kind):
+        for index, record in enumerate(self._parser.iter_array()):
+            validate_record(kind, record, index, self.check_fields)
+            self.counts[kind] += 1
+            yield record
+
+    def _advance(self, wanted):
+        """Parse the body up to the array of `wanted` and return True, or to its end and return False
+
+        Record arrays passed on the way are spooled, or only validated and
+        counted when `wanted` is None.
+        """
+        self._open()
+        for key in self._keys:
+            if not self._is_records(key):
+                self.extras[key] = self._parser.value()
+            elif key == wanted:
+                return True
+            elif wanted is None:
+                for _ in self._validated(key):
+                    pass
+            else:
+                spool = self._spools[key] = tempfile.TemporaryFile('w+', encoding='utf-8')
+                for record in self._validated(key):
+                    spool.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+                    spool.write('\n')
+        if not self._finished:
+            self._parser.end()
+            self._finished = True
+        return False
+
+    def records(self, kind):
+        """Yield the validated records of one kind in body order (none if the body has no such array)"""
+        spool = self._spools.pop(kind, None)
+        if spool is not None:
+            with spool:
+                spool.seek(0)
+                for line in spool:
+                    yield json.loads(line)
+            return
+        if kind in self._seen:
+            raise RuntimeError(f'The {kind} records were already read')
+        if self._advance(kind):
+            yield from self._validated(kind)
+
+    def consume(self, iterable):
+        """Yield from an iterable built on the records, then read and validate the rest of the body"""
+        yield from iterable
+        self.finish()
+
+    def finish(self):
+        """Read and validate the rest of the body, dropping records that were not read"""
+        self._advance(None)
+        self.close()
+
+    def close(self):
+        for spool in self._spools.values():
+            spool.close()
+        self._spools.clear()
+
+    def load(self):
+        """Read the whole body into a dict of its members in body order, validating every record"""
+        self._open()
+        data = {}
+        for key in self._keys:
+            if self._is_records(key):
+                data[key] = list(self._validated(key))
+            else:
+                data[key] = self._parser.value()
+        self._parser.end()
+        self._finished = True
+        return data
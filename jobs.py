@@ -0,0 +1,158 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Finished jobs kept in memory for polling and downloads
+MAX_FINISHED_JOBS = 100
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's task when the job has been cancelled"""
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already queued or running"""
+
+
+class Job:
+    """State and progress of one background job"""
+
+    def __init__(self, kind, digest, total):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.digest = digest
+        self.status = 'queued'
+        self.total = total
+        self.processed = 0
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self._cancel = threading.Event()
+
+    def advance(self, count=1):
+        """Record progress and stop the task if the job was cancelled"""
+        self.processed += count
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def cancel(self):
+        """Ask the job to stop; a queued job never starts"""
+        self._cancel.set()
+        if self.status == 'queued':
+            self._finish('cancelled')
+
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+    def _finish(self, status):
+        self.status = status
+        self.finished = time.time()
+
+    def to_dict(self):
+        """Describe the job for the polling API"""
+        if self.status == 'done':
+            percent = 100
+        elif self.total:
+            percent = min(99, round(self.processed * 100 / self.total, 1))
+        else:
+            percent = 0
+
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'rows_processed': self.processed,
+            'rows_total': self.total,
+            'percent': percent,
+            'result': self.result,
+            'error': self.error
+        }
+
+
+class JobQueue:
+    """Bounded thread pool running background jobs, deduplicated by input digest
+
+    Submitting a dataset whose digest matches a queued, running or completed
+    job (whose result is still valid) returns that job instead of starting a
+    new one.
+    """
+
+    def __init__(self, max_workers=2, max_pending=8):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='export-job')
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def submit(self, kind, digest, total, task, is_valid=None, cleanup=None):
+        """Queue task(job) unless an equivalent job exists; return (job, created)
+
+        `cleanup()` releases what the task was given: it is called once the
+        job has finished, whatever its outcome, or right away when no job is
+        started.
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.kind != kind or job.digest != digest:
+                    continue
+                if job.active or (job.status == 'done' and (is_valid is None or is_valid(job))):
+                    if cleanup:
+                        cleanup()
+                    return job, False
+
+            if sum(1 for job in self._jobs.values() if job.active) >= self.max_pending:
+                if cleanup:
+                    cleanup()
+                raise JobQueueFull()
+
+            job = Job(kind, digest, total)
+            self._jobs[job.id] = job
+            self._prune()
+
+        self._executor.submit(self._run, job, task, cleanup)
+        return job, True
+
+    def get(self, job_id):
+        """Return a job by id, or None"""
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a job; return it, or None if it does not exist"""
+        job = self._jobs.get(job_id)
+        if job and job.active:
+            job.cancel()
+        return job
+
+    def shutdown(self, wait=True):
+        """Cancel pending jobs and stop the pool"""
+        for job in list(self._jobs.values()):
+            if job.status == 'queued':
+                job.cancel()
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job, task, cleanup=None):
+        """Execute a job's task and record its outcome"""
+        try:
+            if job.status != 'queued':
+                return
+            job.status = 'running'
+            try:
+                job.result = task(job)
+                job._finish('done')
+            except JobCancelled:
+                job._finish('cancelled')
+            except Exception as e:
+                job.error = str(e)
+                job._finish('failed')
+        finally:
+            if cleanup:
+                cleanup()
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond MAX_FINISHED_JOBS"""
+        finished = sorted((job for job in self._jobs.values() if not job.active),
+                          key=lambda job: job.finished)
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.id]
@@ -0,0 +1,481 @@
+import datetime
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+
+from backups import fsync_directory, write_atomic
+from columnar import COLUMNAR_FORMATS
+
+# Archives and their index live in a subdirectory of each site's directory
+ARCHIVE_DIRNAME = 'archive'
+ARCHIVE_INDEX_FILENAME = 'archive_index.json'
+
+# Bumped whenever the index entry layout changes
+ARCHIVE_INDEX_VERSION = 1
+
+# Exports rolled into the archives, by file name prefix; the date in the name
+# (generate_timestamp) decides the month. Columnar exports of a complete report
+# are split into _stock and _history files.
+EXPORT_TYPES = {
+    'cylinder_stock': 'stock',
+    'cylinder_history': 'history',
+    'complete_cylinder_report': 'report',
+    'cross_site_report': 'sites_report'
+}
+EXPORT_SUFFIXES = ('.csv',) + tuple(COLUMNAR_FORMATS.values())
+EXPORT_FILENAME = re.compile(
+    r'^(' + '|'.join(EXPORT_TYPES) + r')_(\d{4})(\d{2})(\d{2})_\d{6}(?:_\d{6})?(?:_stock|_history)?'
+    r'(' + '|'.join(re.escape(suffix) for suffix in EXPORT_SUFFIXES) + r')$')
+
+# A month is archived once it is over and its newest day is this many days old
+ARCHIVE_AFTER_DAYS = 30
+
+# Seconds between two passes of the lifecycle worker, and before the first one
+ARCHIVE_INTERVAL = 3600
+ARCHIVE_START_DELAY = 60
+
+# Share of wall time the worker may spend working (reading, compressing,
+# writing); it sleeps for the rest
+ARCHIVE_BUDGET = 0.1
+
+# Bytes copied per step of the duty cycle
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+
+# Longest wait for live requests to finish before taking the next step anyway
+ARCHIVE_MAX_YIELD = 5
+ARCHIVE_YIELD_POLL = 0.05
+
+
+def archive_filename(month):
+    """Name of the archive of one month (YYYY-MM)"""
+    return f'exports_{month}.zip'
+
+
+def parse_export_filename(filename):
+    """Return (type, date) of an archivable export file name, or None"""
+    match = EXPORT_FILENAME.match(filename)
+    if not match:
+        return None
+    prefix, year, month, day, _ = match.groups()
+    try:
+        date = datetime.date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+    return EXPORT_TYPES[prefix], date
+
+
+def month_end(date):
+    """First day of the month after `date`"""
+    return (date.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+
+class RecordCounter:
+    """Count the cylinder and history rows of an export while its bytes stream past
+
+    Stock and history exports have one header row; reports have a CURRENT
+    STOCK and an OPERATION HISTORY section per site, each a title, a header
+    and rows up to the next empty line.
+    """
+
+    SECTIONS = {b'CURRENT STOCK': 'cylinders', b'OPERATION HISTORY': 'history'}
+
+    def __init__(self, export_type):
+        self.export_type = export_type
+        self.counts = {'cylinders': 0, 'history': 0}
+        self._rest = b''
+        self._section = None
+        self._skip_header = False
+        self._lines = 0
+
+    def feed(self, chunk):
+        lines = (self._rest + chunk).split(b'\n')
+        self._rest = lines.pop()
+        for line in lines:
+            self._line(line.rstrip(b'\r'))
+
+    def result(self):
+        """Return (cylinders_count, history_count); None for a count the export does not have"""
+        if self._rest:
+            self._line(self._rest.rstrip(b'\r'))
+            self._rest = b''
+        if self.export_type == 'stock':
+            return max(self._lines - 1, 0), None
+        if self.export_type == 'history':
+            return None, max(self._lines - 1, 0)
+        return self.counts['cylinders'], self.counts['history']
+
+    def _line(self, line):
+        self._lines += 1
+        if self.export_type in ('stock', 'history'):
+            return
+        if self._section:
+            if self._skip_header:
+                self._skip_header = False
+            elif line.strip(b',') == b'':
+                self._section = None
+            else:
+                self.counts[self._section] += 1
+        elif line in self.SECTIONS:
+            self._section = self.SECTIONS[line]
+            self._skip_header = True
+
+
+class DutyCycle:
+    """Keep background work to a share of wall time and out of the way of live requests
+
+    Each step waits (up to max_yield seconds) while `is_busy()` reports
+    requests being served, then runs, then sleeps long enough that work takes
+    at most `budget` of the elapsed time. Sleeps end early when `stop` is set.
+    """
+
+    def __init__(self, budget=ARCHIVE_BUDGET, is_busy=None, stop=None, max_yield=ARCHIVE_MAX_YIELD):
+        self.budget = min(max(budget, 0.01), 1.0)
+        self.is_busy = is_busy
+        self.stop = stop or threading.Event()
+        self.max_yield = max_yield
+        self.worked = 0.0
+        self.yielded = 0.0
+
+    @contextmanager
+    def step(self):
+        if self.is_busy:
+            deadline = time.monotonic() + self.max_yield
+            start = time.monotonic()
+            while self.is_busy() and time.monotonic() < deadline and not self.stop.is_set():
+                self.stop.wait(ARCHIVE_YIELD_POLL)
+            self.yielded += time.monotonic() - start
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.worked += elapsed
+            if self.budget < 1:
+                self.stop.wait(elapsed * (1 - self.budget) / self.budget)
+
+
+class ReportArchive:
+    """Monthly zip archives of old exports in a site's directory, with a searchable index
+
+    Stock, history and report exports (CSV, Parquet or Arrow) of a month are moved into
+    archive/exports_<YYYY-MM>.zip once the month is over and ARCHIVE_AFTER_DAYS
+    old. The index records, per archived file, its type, date, sizes and
+    record counts, so archived files can be listed and served without opening
+    every archive. An archive is written to a temporary file and renamed into
+    place; originals are deleted only once the index lists them.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.archive_dir = os.path.join(directory, ARCHIVE_DIRNAME)
+        self.index_path = os.path.join(self.archive_dir, ARCHIVE_INDEX_FILENAME)
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        """Read the index, starting empty if it is missing, corrupt or outdated"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') != ARCHIVE_INDEX_VERSION:
+                return {}
+            return index.get('files', {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def _save(self, entries):
+        raw = json.dumps({'version': ARCHIVE_INDEX_VERSION, 'files': entries},
+                         ensure_ascii=False).encode('utf-8')
+        write_atomic(self.index_path, raw)
+
+    def get(self, filename):
+        """Return the index entry of an archived file, or None"""
+        with self._lock:
+            return self._entries.get(filename)
+
+    def search(self, export_type=None, month=None, name=None, page=None, per_page=None):
+        """Return (entries, total) of archived files matching the filters, newest first"""
+        with self._lock:
+            entries = list(self._entries.values())
+        entries = [
+            entry for entry in entries
+            if (not export_type or entry['type'] == export_type)
+            and (not month or entry['month'] == month)
+            and (not name or name.lower() in entry['filename'].lower())
+        ]
+        entries.sort(key=lambda entry: (entry['date'], entry['filename']), reverse=True)
+        total = len(entries)
+        if page and per_page:
+            start = (page - 1) * per_page
+            entries = entries[start:start + per_page]
+        return entries, total
+
+    def open(self, filename):
+        """Open an archived file for reading; return (entry, file object) or None
+
+        The returned file object closes its archive when it is closed.
+        """
+        entry = self.get(filename)
+        if entry is None:
+            return None
+        try:
+            archive = zipfile.ZipFile(os.path.join(self.archive_dir, entry['archive']))
+        except (OSError, zipfile.BadZipFile):
+            return None
+        try:
+            member = archive.open(filename)
+        except KeyError:
+            archive.close()
+            return None
+        return entry, ArchivedFile(archive, member)
+
+    def candidates(self, now=None, after_days=ARCHIVE_AFTER_DAYS):
+        """Group the exports due for archiving by month: {month: [(filename, type, date, stat)]}"""
+        now = now or datetime.datetime.now()
+        today = now.date()
+        cutoff = now.timestamp() - after_days * 86400
+        due = {}
+        with os.scandir(self.directory) as entries:
+            for dir_entry in entries:
+                parsed = parse_export_filename(dir_entry.name)
+                if not parsed or not dir_entry.is_file():
+                    continue
+                export_type, date = parsed
+                stat = dir_entry.stat()
+                last_day = month_end(date) - datetime.timedelta(days=1)
+                if (today - last_day).days < after_days or stat.st_mtime > cutoff:
+                    continue
+                due.setdefault(date.strftime('%Y-%m'), []).append((dir_entry.name, export_type, date, stat))
+        return due
+
+    def compact(self, now=None, after_days=ARCHIVE_AFTER_DAYS, duty=None):
+        """Archive every month due; return the number of files archived and the bytes read and written"""
+        duty = duty or DutyCycle(1.0)
+        result = {'files': 0, 'bytes_read': 0, 'bytes_written': 0, 'archives': []}
+        with self._compact_lock:
+            for month, files in sorted(self.candidates(now, after_days).items()):
+                if duty.stop.is_set():
+                    break
+                archived = self._archive_month(month, files, duty)
+                result['files'] += archived['files']
+                result['bytes_read'] += archived['bytes_read']
+                result['bytes_written'] += archived['bytes_written']
+                result['archives'].append(archive_filename(month))
+        return result
+
+    def _archive_month(self, month, files, duty):
+        name = archive_filename(month)
+        path = os.path.join(self.archive_dir, name)
+        os.makedirs(self.archive_dir, exist_ok=True)
+
+        with self._lock:
+            entries = dict(self._entries)
+        # Files already archived by an interrupted pass only need deleting
+        pending = [f for f in files if not self._archived(entries.get(f[0]), f[3], name)]
+        done = [f for f in files if f not in pending]
+        bytes_read = bytes_written = 0
+
+        if pending:
+            tmp_path = path + '.part'
+            new_names = {f[0] for f in pending}
+            try:
+                with open(tmp_path, 'wb') as raw:
+                    with zipfile.ZipFile(raw, 'w', zipfile.ZIP_DEFLATED) as archive:
+                        # Files archived in an earlier pass of the same month are carried over
+                        if os.path.exists(path):
+                            with zipfile.ZipFile(path) as previous:
+                                for info in previous.infolist():
+                                    if info.filename not in new_names:
+                                        bytes_read += self._copy_member(previous, info, archive, duty)
+                        for filename, export_type, date, stat in pending:
+                            entry, size = self._add(archive, filename, export_type, date, stat, duty)
+                            entry['archive'] = name
+                            entries[filename] = entry
+                            bytes_read += size
+                        for filename, _, _, _ in pending:
+                            entries[filename]['compressed_size'] = archive.getinfo(filename).compress_size
+                    raw.flush()
+                    os.fsync(raw.fileno())
+                os.replace(tmp_path, path)
+                fsync_directory(self.archive_dir)
+                bytes_written = os.path.getsize(path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+            with self._lock:
+                self._entries.update({f[0]: entries[f[0]] for f in pending})
+                self._save(self._entries)
+
+        # The originals go only once the index serves them from the archive
+        for filename, _, _, _ in pending + done:
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except OSError:
+                pass  # Still open elsewhere (Windows): removed by the next pass
+
+        return {'files': len(pending), 'bytes_read': bytes_read, 'bytes_written': bytes_written}
+
+    def _archived(self, entry, stat, name):
+        """Check whether an index entry already holds this version of a file"""
+        return bool(entry and entry['archive'] == name and entry['size'] == stat.st_size
+                    and entry['mtime_ns'] == stat.st_mtime_ns)
+
+    def _add(self, archive, filename, export_type, date, stat, duty):
+        """Compress one export into the archive in budgeted steps, counting its records
+
+        Columnar exports are stored as they are: they are compressed already,
+        and their records are not counted.
+        """
+        csv = filename.endswith('.csv')
+        info = zipfile.ZipInfo(filename, time.localtime(stat.st_mtime)[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED if csv else zipfile.ZIP_STORED
+        info.file_size = stat.st_size
+        counter = RecordCounter(export_type) if csv else None
+        size = 0
+        with open(os.path.join(self.directory, filename), 'rb') as src, archive.open(info, 'w') as dst:
+            while True:
+                with duty.step():
+                    chunk = src.read(ARCHIVE_CHUNK_SIZE)
+                    if counter:
+                        counter.feed(chunk)
+                    dst.write(chunk)
+                if not chunk:
+                    break
+                size += len(chunk)
+        cylinders_count, history_count = counter.result() if counter else (None, None)
+        return {
+            'filename': filename,
+            'type': export_type,
+            'date': date.isoformat(),
+            'month': date.strftime('%Y-%m'),
+            'size': size,
+            'mtime_ns': stat.st_mtime_ns,
+            'cylinders_count': cylinders_count,
+            'history_count': history_count
+        }, size
+
+    @staticmethod
+    def _copy_member(source, info, archive, duty):
+        """Copy a member of an older archive of the month into the new one"""
+        size = 0
+        with source.open(info) as src, archive.open(info, 'w') as dst:
+            while True:
+                with duty.step():
+                    chunk = src.read(ARCHIVE_CHUNK_SIZE)
+                    dst.write(chunk)
+                if not chunk:
+                    break
+                size += len(chunk)
+        return size
+
+
+class ArchivedFile:
+    """A member of an archive being read; closing it closes the archive"""
+
+    def __init__(self, archive, member):
+        self.archive = archive
+        self.member = member
+
+    def read(self, size=-1):
+        return self.member.read(size)
+
+    def close(self):
+        self.member.close()
+        self.archive.close()
+
+
+class LifecycleWorker:
+    """Background thread archiving old exports of every site within a CPU/IO budget
+
+    A pass runs every `interval` seconds (or on `trigger()`), calling
+    compact() on each archive returned by `archives()` with a shared
+    DutyCycle, so the pass as a whole uses at most `budget` of the wall time
+    and steps aside while `is_busy()` reports live requests.
+    """
+
+    def __init__(self, archives, after_days=ARCHIVE_AFTER_DAYS, interval=ARCHIVE_INTERVAL,
+                 budget=ARCHIVE_BUDGET, is_busy=None, start_delay=ARCHIVE_START_DELAY):
+        self.archives = archives
+        self.after_days = after_days
+        self.interval = interval
+        self.budget = budget
+        self.is_busy = is_busy
+        self.running = False
+        self.last_run = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._next_run = time.monotonic() + start_delay
+        self._thread = threading.Thread(target=self._run, name='report-lifecycle', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def trigger(self):
+        """Start a pass now (if one is already running, another follows it)"""
+        self._wake.set()
+
+    def status(self):
+        return {
+            'running': self.running,
+            'after_days': self.after_days,
+            'interval': self.interval,
+            'budget': self.budget,
+            'next_run_in': max(self._next_run - time.monotonic(), 0) if not self.running else 0,
+            'last_run': dict(self.last_run) if self.last_run else None
+        }
+
+    def close(self):
+        """Stop the worker, interrupting a pass between two steps"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def run_once(self, now=None):
+        """Archive the exports due in every site; return the pass summary"""
+        duty = DutyCycle(self.budget, self.is_busy, self._stop)
+        started = time.time()
+        start = time.perf_counter()
+        summary = {'files': 0, 'bytes_read': 0, 'bytes_written': 0, 'archives': [], 'errors': []}
+        self.running = True
+        try:
+            for archive in self.archives():
+                if self._stop.is_set():
+                    break
+                try:
+                    result = archive.compact(now, self.after_days, duty)
+                except Exception as e:
+                    summary['errors'].append(f'{archive.directory}: {e}')
+                    continue
+                summary['files'] += result['files']
+                summary['bytes_read'] += result['bytes_read']
+                summary['bytes_written'] += result['bytes_written']
+                summary['archives'] += [os.path.join(archive.archive_dir, name) for name in result['archives']]
+        except Exception as e:
+            summary['errors'].append(str(e))
+        finally:
+            self.running = False
+        summary.update({
+            'started': started,
+            'duration': time.perf_counter() - start,
+            'work_seconds': duty.worked,
+            'yield_seconds': duty.yielded
+        })
+        self.last_run = summary
+        return summary
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(max(self._next_run - time.monotonic(), 0))
+            if self._stop.is_set():
+                return
+            self._wake.clear()
+            self.run_once()
+            self._next_run = time.monotonic() + self.interval
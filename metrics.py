@@ -0,0 +1,297 @@
+import datetime
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, request
+from flask.json.provider import DefaultJSONProvider
+
+# Histogram buckets: latencies in seconds, payload sizes in bytes
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864, 268435456)
+
+# Seconds between two stack samples of a profiled request
+PROFILE_INTERVAL = 0.005
+
+
+def format_labels(names, values):
+    """Render a Prometheus label set such as {route="/",method="GET"}"""
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def format_value(value):
+    """Render a sample value the way Prometheus expects it"""
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield self.name, format_labels(self.labels, label_values), value
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    kind = 'gauge'
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram:
+    """Cumulative bucket histogram, optionally split by labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            counts, total = self._values.get(label_values) or ([0] * len(self.buckets), 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[label_values] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for label_values, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield (f'{self.name}_bucket',
+                       format_labels(self.labels + ('le',), label_values + (format_value(float(bound)),)),
+                       cumulative)
+            labels = format_labels(self.labels, label_values)
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, cumulative
+
+
+class MetricsRegistry:
+    """Set of metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format (0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """Periodically sample the stack of one thread and fold the samples for flame graphs"""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)})')
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def save(self, filepath):
+        """Write the samples in the folded format read by flamegraph.pl and speedscope"""
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f'{stack} {count}\n')
+
+
+class RequestMetrics:
+    """Per-route request metrics, internal phase timers and an on-demand request profiler
+
+    Requests are measured until their response is closed, so streamed
+    responses include the time spent generating the body. When a profile
+    directory is set, a request carrying ?profile=1 (or an X-Profile: 1
+    header) is sampled and its folded stacks saved there.
+    """
+
+    def __init__(self, profile_dir=None):
+        self.profile_dir = profile_dir
+        self.registry = MetricsRegistry()
+        self.requests = self.registry.register(Counter(
+            'gas_manager_http_requests_total', 'HTTP requests handled',
+            ('method', 'route', 'status')))
+        self.errors = self.registry.register(Counter(
+            'gas_manager_http_request_errors_total', 'HTTP requests answered with a 5xx status',
+            ('method', 'route', 'status')))
+        self.in_flight = self.registry.register(Gauge(
+            'gas_manager_http_requests_in_flight', 'HTTP requests being handled'))
+        self.latency = self.registry.register(Histogram(
+            'gas_manager_http_request_duration_seconds', 'Time from request start to response close',
+            LATENCY_BUCKETS, ('method', 'route')))
+        self.request_size = self.registry.register(Histogram(
+            'gas_manager_http_request_size_bytes', 'Request body size',
+            SIZE_BUCKETS, ('method', 'route')))
+        self.response_size = self.registry.register(Histogram(
+            'gas_manager_http_response_size_bytes', 'Response body size',
+            SIZE_BUCKETS, ('method', 'route')))
+        self.phases = self.registry.register(Histogram(
+            'gas_manager_phase_duration_seconds', 'Time spent in internal phases of request handling',
+            LATENCY_BUCKETS, ('phase',)))
+        self.in_flight.inc(amount=0)
+
+    def init_app(self, app):
+        """Install the request hooks and time JSON decoding/encoding through the app's JSON provider"""
+        metrics = self
+
+        class TimedJSONProvider(DefaultJSONProvider):
+            def loads(self, s, **kwargs):
+                with metrics.phase('json_decode'):
+                    return super().loads(s, **kwargs)
+
+            def dumps(self, obj, **kwargs):
+                with metrics.phase('json_encode'):
+                    return super().dumps(obj, **kwargs)
+
+        app.json = TimedJSONProvider(app)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block of code as an internal phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.observe(time.perf_counter() - start, name)
+
+    def observe_phase(self, name, seconds):
+        """Record time measured elsewhere (e.g. accumulated across a generator) for a phase"""
+        self.phases.observe(seconds, name)
+
+    def render(self):
+        return self.registry.render()
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        self.in_flight.inc()
+
+        if self.profile_dir and (request.args.get('profile', type=int)
+                                 or request.headers.get('X-Profile') == '1'):
+            g.profiler = SamplingProfiler(threading.get_ident())
+            g.profiler.start()
+
+    def _after_request(self, response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+
+        method = request.method
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        status = response.status_code
+        self.request_size.observe(request.content_length or 0, method, route)
+
+        profiler = g.pop('profiler', None)
+        profile_path = None
+        if profiler:
+            stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+            profile_name = f'profile_{stamp}_{request.endpoint or "unmatched"}.folded'
+            profile_path = os.path.join(self.profile_dir, profile_name)
+            response.headers['X-Profile'] = profile_name
+
+        # Streamed bodies of unknown length are counted while they are sent
+        sent = [response.content_length]
+        if sent[0] is None and response.is_streamed and not response.direct_passthrough:
+            body = response.response
+            response.response = self._count_bytes(response.iter_encoded(), sent)
+            # The wrapped body must still be closed (generators, file wrappers, streams)
+            if hasattr(body, 'close'):
+                response.call_on_close(body.close)
+
+        def finish():
+            self.in_flight.dec()
+            self.latency.observe(time.perf_counter() - start, method, route)
+            self.response_size.observe(sent[0] or 0, method, route)
+            self.requests.inc(method, route, status)
+            if status >= 500:
+                self.errors.inc(method, route, status)
+            if profiler:
+                profiler.stop()
+                profiler.save(profile_path)
+
+        response.call_on_close(finish)
+        return response
+
+    @staticmethod
+    def _count_bytes(iterable, sent):
+        sent[0] = 0
+        for chunk in iterable:
+            sent[0] += len(chunk)
+            yield chunk
@@ -0,0 +1,286 @@
+import csv
+import datetime
+import os
+import shutil
+import tempfile
+
+from consumption import ConsumptionTable
+from datastore import read_snapshot
+from ingest import batched
+
+# Title rows of the complete report and of the cross-site report
+REPORT_TITLE = 'PRESSURE CYLINDER MANAGEMENT COMPLETE REPORT'
+SITES_REPORT_TITLE = 'PRESSURE CYLINDER MANAGEMENT CROSS-SITE REPORT'
+
+# CSV row generators shared by file exports and streaming exports
+STOCK_HEADER = ['Cylinder Code', 'Gas Type', 'Pressure (bar)',
+                'Cylinder Volume (L)', 'Physical Form', 'Entry Date']
+
+HISTORY_HEADER = ['Cylinder Code', 'Gas Type', 'Entry Pressure (bar)',
+                  'Cylinder Volume (L)', 'Exit Pressure (bar)', 'Entry Date', 'Exit Date',
+                  'Consumption (bar)', 'Consumption (%)', 'Consumption (L)']
+
+SITES_SUMMARY_HEADER = ['Site', 'Cylinders in stock', 'Completed operations',
+                        'Total Consumption (bar)', 'Total Consumption (L)']
+
+# Rows of the complete report besides the stock and history records and the
+# per gas type rows of its two summaries (titles, headers, totals, blank rows)
+REPORT_FIXED_ROWS = 20
+
+# History records whose consumption is computed at a time, so that rows can be
+# built from a stream of records without holding all of them
+HISTORY_BATCH_SIZE = 1024
+
+def format_date(iso_date):
+    """Format ISO date string to DD/MM/YYYY format"""
+    try:
+        date_obj = datetime.datetime.fromisoformat(iso_date.replace('Z', '+00:00'))
+        return date_obj.strftime("%d/%m/%Y")
+    except Exception:
+        return iso_date
+
+def get_physical_form_label(form):
+    """Convert physical form code to readable label"""
+    labels = {
+        'gas': 'Gas',
+        'liquid': 'Liquid',
+        'liquidWithDip': 'Liquid with dip tube'
+    }
+    return labels.get(form, form)
+
+def stock_row(cylinder):
+    """Build the CSV row of a cylinder in stock"""
+    volume = cylinder.get('cylinderVolume')
+    return [
+        cylinder['code'],
+        cylinder['gasType'],
+        cylinder['pressure'],
+        '50' if volume is None else volume,
+        get_physical_form_label(cylinder['physicalForm']),
+        format_date(cylinder['entryDate'])
+    ]
+
+def iter_history_table_rows(history, table):
+    """Yield the CSV rows of history records from their precomputed consumption table"""
+    for record, metrics in zip(history, table.iter_metrics()):
+        pressureIn, cylinderVolume, pressureOut, consumption, consumption_percentage, consumed_liters = metrics
+        yield [
+            record['code'],
+            record['gasType'],
+            pressureIn,
+            cylinderVolume,
+            pressureOut,
+            format_date(record['entryDate']),
+            format_date(record['exitDate']),
+            round(consumption, 2),
+            round(consumption_percentage, 2) if pressureIn > 0 else 0,
+            round(consumed_liters, 2)
+        ]
+
+def iter_stock_rows(stock):
+    """Yield the rows of the stock export"""
+    yield STOCK_HEADER
+    for cylinder in stock:
+        yield stock_row(cylinder)
+
+def iter_history_batches(history):
+    """Yield (records, consumption table) for batches of HISTORY_BATCH_SIZE history records"""
+    for batch in batched(history, HISTORY_BATCH_SIZE):
+        yield batch, ConsumptionTable.from_history(batch)
+
+def iter_history_rows(history):
+    """Yield the rows of the history export"""
+    yield HISTORY_HEADER
+    for batch, table in iter_history_batches(history):
+        yield from iter_history_table_rows(batch, table)
+
+def iter_report_header(title):
+    """Yield the title and generation date rows of a report"""
+    yield [title]
+    yield ['Generation date:', datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")]
+    yield []
+
+def iter_gas_type_summary(gas_types):
+    """Yield the cylinders in stock per gas type"""
+    yield ['GAS TYPE SUMMARY']
+    yield ['Gas Type', 'Quantity']
+    for gas, count in gas_types.items():
+        yield [gas, count]
+
+def iter_consumption_summary(gas_totals):
+    """Yield the consumption per gas type (bar and liters) and the overall total"""
+    yield ['GAS CONSUMPTION SUMMARY']
+    yield ['Gas Type', 'Total Consumption (bar)', 'Total Consumption (L)']
+
+    for gas, (bar_total, liters_total) in gas_totals.items():
+        yield [
+            gas,
+            round(bar_total, 2),
+            round(liters_total, 2)
+        ]
+
+    # Add overall total consumption
+    total_bar_consumption = sum(bar for bar, _ in gas_totals.values())
+    total_liter_consumption = sum(liters for _, liters in gas_totals.values())
+
+    yield []
+    yield ['TOTAL CONSUMPTION',
+           round(total_bar_consumption, 2),
+           round(total_liter_consumption, 2)]
+
+def iter_report_sections(stock, history, summary=None):
+    """Yield the stock, history and summary sections of the complete report
+
+    `stock` and `history` may be any iterables of records; each is read
+    once, in order. When given, `summary` is filled with the section's counts and per gas
+    type totals once all rows were yielded.
+    """
+    # Stock section
+    yield ['CURRENT STOCK']
+    yield STOCK_HEADER
+
+    gas_types = {}
+    stock_count = 0
+    for cylinder in stock:
+        yield stock_row(cylinder)
+        gas = cylinder['gasType']
+        gas_types[gas] = gas_types.get(gas, 0) + 1
+        stock_count += 1
+
+    yield []
+    yield ['Total cylinders in stock:', stock_count]
+
+    # Gas type summary
+    yield []
+    yield from iter_gas_type_summary(gas_types)
+
+    yield []
+
+    # History section, with the consumption by gas type (bar and liters)
+    # added up batch by batch
+    yield ['OPERATION HISTORY']
+    yield HISTORY_HEADER
+
+    gas_totals = {}
+    history_count = 0
+    for batch, table in iter_history_batches(history):
+        yield from iter_history_table_rows(batch, table)
+        history_count += len(batch)
+        for gas, (bar, liters) in table.totals_by_gas().items():
+            totals = gas_totals.setdefault(gas, [0.0, 0.0])
+            totals[0] += bar
+            totals[1] += liters
+
+    yield []
+    yield ['Total completed operations:', history_count]
+
+    # Consumption summary by gas type (bar and liters)
+
+    yield []
+    yield from iter_consumption_summary(gas_totals)
+
+    if summary is not None:
+        summary.update({
+            'stock': stock_count,
+            'history': history_count,
+            'gas_types': gas_types,
+            'consumption': {gas: [bar, liters] for gas, (bar, liters) in gas_totals.items()}
+        })
+
+def iter_report_rows(stock, history):
+    """Yield the rows of the complete report (stock, history and summaries)"""
+    yield from iter_report_header(REPORT_TITLE)
+    yield from iter_report_sections(stock, history)
+
+def report_row_count(stock_count, history_count, stock_gas_types, history_gas_types):
+    """Number of rows iter_report_rows yields for the given record and distinct gas type counts"""
+    return REPORT_FIXED_ROWS + stock_count + history_count + stock_gas_types + history_gas_types
+
+def write_site_section(site, database_path, part_path):
+    """Write the report section of one site to a part file and return its summary
+
+    Runs in the report worker processes: the site's records are read from
+    its database file, so only the small summary travels back.
+    """
+    data = read_snapshot(database_path)
+    summary = {}
+    with open(part_path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['SITE:', site])
+        writer.writerows(iter_report_sections(data['cylinders'], data['history'], summary))
+        writer.writerow([])
+    return summary
+
+def merge_summaries(summaries):
+    """Add up site summaries: counts, cylinders per gas type and consumption per gas type"""
+    merged = {'stock': 0, 'history': 0, 'gas_types': {}, 'consumption': {}}
+    for summary in summaries:
+        merged['stock'] += summary['stock']
+        merged['history'] += summary['history']
+        for gas, count in summary['gas_types'].items():
+            merged['gas_types'][gas] = merged['gas_types'].get(gas, 0) + count
+        for gas, (bar, liters) in summary['consumption'].items():
+            totals = merged['consumption'].setdefault(gas, [0.0, 0.0])
+            totals[0] += bar
+            totals[1] += liters
+    return merged
+
+def iter_sites_summary_rows(sites, summaries, merged):
+    """Yield the per-site totals and the gas type and consumption summaries of all sites"""
+    yield ['ALL SITES']
+    yield SITES_SUMMARY_HEADER
+    for site, summary in zip(sites, summaries):
+        consumption = summary['consumption'].values()
+        yield [
+            site,
+            summary['stock'],
+            summary['history'],
+            round(sum(bar for bar, _ in consumption), 2),
+            round(sum(liters for _, liters in consumption), 2)
+        ]
+
+    yield []
+    yield ['Total cylinders in stock:', merged['stock']]
+    yield ['Total completed operations:', merged['history']]
+
+    yield []
+    yield from iter_gas_type_summary(merged['gas_types'])
+
+    yield []
+    yield from iter_consumption_summary(merged['consumption'])
+
+def write_sites_report(filepath, sites, map_sections=map, progress=None):
+    """Write the cross-site report of (site, database path) pairs; return the merged summary
+
+    `map_sections` runs write_site_section over the sites, in order (e.g.
+    the map of a process pool, so that sections are built in parallel).
+    The parts are then concatenated after the report header and followed by
+    the summaries of all sites. `progress` is called after each section.
+    """
+    names = [site for site, _ in sites]
+    part_dir = tempfile.mkdtemp(prefix='.sites_report_', dir=os.path.dirname(filepath) or '.')
+    part_paths = [os.path.join(part_dir, f'{i}.csv') for i in range(len(sites))]
+    tmp_path = filepath + '.part'
+    try:
+        summaries = []
+        for summary in map_sections(write_site_section, names, [path for _, path in sites], part_paths):
+            summaries.append(summary)
+            if progress:
+                progress()
+        merged = merge_summaries(summaries)
+
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerows(iter_report_header(SITES_REPORT_TITLE))
+            writer.writerow(['Sites:'] + names)
+            writer.writerow([])
+            for part_path in part_paths:
+                with open(part_path, newline='', encoding='utf-8') as part:
+                    shutil.copyfileobj(part, csvfile)
+            writer.writerows(iter_sites_summary_rows(names, summaries, merged))
+        os.replace(tmp_path, filepath)
+        return dict(merged, sites=dict(zip(names, summaries)))
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,164 @@
+import os
+import re
+import threading
+
+from analytics import ConsumptionAnalytics
+from backups import BackupStore, LatestBackupCache
+from datastore import CylinderStore
+from feed import ChangeFeed
+from lifecycle import ReportArchive
+from writebehind import DEFAULT_WINDOW, WriteBehind
+
+# Site used by requests that do not name one; its data stays directly in the
+# reports directory, where single-site installations already have it
+DEFAULT_SITE = 'default'
+
+# Other sites are partitioned into reports/sites/<name>/
+SITES_DIRNAME = 'sites'
+
+# Site names are also directory names: lowercase letters, digits, '-' and '_'
+SITE_NAME = re.compile(r'^[a-z0-9][a-z0-9_-]{0,63}$')
+
+DATABASE_FILENAME = 'gas_manager.db'
+
+# Sites held open (store, feed, save queue) by one server
+MAX_SITES = 64
+
+
+class InvalidSiteError(ValueError):
+    """Raised for a site name that cannot be used"""
+
+
+class UnknownSiteError(LookupError):
+    """Raised when reading from a site that has no data yet"""
+
+
+class Site:
+    """The data partition of one site: store, change feed, analytics, backups, archives and save queue
+
+    `save(site, data)` writes a client snapshot of the site; saves go
+    through the site's own write-behind queue.
+    """
+
+    def __init__(self, name, directory, save, retention=None, max_subscribers=32, save_window=DEFAULT_WINDOW,
+                 archive=None):
+        self.name = name
+        self.directory = directory
+        self.database_path = os.path.join(directory, DATABASE_FILENAME)
+        self.store = CylinderStore(self.database_path)
+        self.change_feed = ChangeFeed(self.store, max_subscribers)
+        self.analytics = ConsumptionAnalytics(self.store)
+        self.backup_store = BackupStore(directory, retention)
+        self.backup_index = self.backup_store.index
+        self.latest_backup_cache = LatestBackupCache(self.backup_store)
+        self.archive = archive or ReportArchive(directory)
+        self.save_writer = WriteBehind(lambda data: save(self, data), save_window)
+        # Held while a write updates both the store and the backups, so that
+        # the newest backup and the store always hold the same records
+        self.write_lock = threading.Lock()
+
+    def file_path(self, filename):
+        """Return the path of a file of this site, or None if it lies outside the site's directory"""
+        parts = filename.replace('\\', '/').split('/')
+        if any(part in ('', '.', '..') for part in parts):
+            return None
+        # The default site's directory holds the other sites' directories
+        if self.name == DEFAULT_SITE and parts[0] == SITES_DIRNAME:
+            return None
+        return os.path.join(self.directory, *parts)
+
+    def close(self):
+        """End the feed streams and write the saves still pending"""
+        self.change_feed.close()
+        self.save_writer.close()
+
+
+class SiteRegistry:
+    """Open sites on first use and keep them open
+
+    Sites are created by writing to them: reading from a site that has no
+    directory yet raises UnknownSiteError, so that a mistyped name is not
+    silently answered with an empty dataset. Keyword options are passed on
+    to every Site.
+    """
+
+    def __init__(self, root, max_sites=MAX_SITES, **options):
+        self.root = root
+        self.max_sites = max_sites
+        self.options = options
+        self._sites = {}
+        self._archives = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def validate(name):
+        """Return the normalized site name, or raise InvalidSiteError"""
+        normalized = (name or '').strip().lower()
+        if not SITE_NAME.match(normalized):
+            raise InvalidSiteError(f'Nome del sito non valido: {name!r}')
+        return normalized
+
+    def directory(self, name):
+        """Directory of a site's database, backups and exports"""
+        if name == DEFAULT_SITE:
+            return self.root
+        return os.path.join(self.root, SITES_DIRNAME, name)
+
+    def exists(self, name):
+        return name == DEFAULT_SITE or name in self._sites or os.path.isdir(self.directory(name))
+
+    def get(self, name, create=False):
+        """Return an open site; create its directory only when `create` is set"""
+        name = self.validate(name)
+        site = self._sites.get(name)
+        if site is not None:
+            return site
+
+        with self._lock:
+            site = self._sites.get(name)
+            if site is not None:
+                return site
+            if not create and not self.exists(name):
+                raise UnknownSiteError(f'Sito {name} non trovato')
+            if len(self._sites) >= self.max_sites:
+                raise InvalidSiteError(f'Troppi siti aperti (massimo {self.max_sites})')
+            directory = self.directory(name)
+            os.makedirs(directory, exist_ok=True)
+            site = self._sites[name] = Site(name, directory, archive=self._archive(name), **self.options)
+            return site
+
+    def archive(self, name):
+        """Return the export archive of a site without opening the site
+
+        The archive only reads archive/archive_index.json, so archiving does
+        not open stores or count towards max_sites. An open site shares the
+        same ReportArchive, which keeps its index in memory.
+        """
+        name = self.validate(name)
+        with self._lock:
+            return self._archive(name)
+
+    def _archive(self, name):
+        archive = self._archives.get(name)
+        if archive is None:
+            archive = self._archives[name] = ReportArchive(self.directory(name))
+        return archive
+
+    def names(self):
+        """Names of all sites with data, the default site first"""
+        names = {DEFAULT_SITE} | set(self._sites)
+        sites_dir = os.path.join(self.root, SITES_DIRNAME)
+        if os.path.isdir(sites_dir):
+            with os.scandir(sites_dir) as entries:
+                names.update(entry.name for entry in entries
+                             if entry.is_dir() and SITE_NAME.match(entry.name))
+        return [DEFAULT_SITE] + sorted(names - {DEFAULT_SITE})
+
+    def open_sites(self):
+        """The sites opened so far"""
+        return list(self._sites.values())
+
+    def close(self):
+        """Close every open site (on shutdown)"""
+        for site in self.open_sites():
+            site.close()
@@ -14,11 +14,12 @@ if %errorlevel% neq 0 (
     goto :end
 )
 
-REM Check if dependencies are installed
+REM Check if dependencies are installed (every package of requirements.txt,
+REM so that an upgrade adding one installs it)
 echo [*] Verifica delle dipendenze...
-pip show flask > nul 2>&1
+python -c "import flask, flask_cors, numpy, cheroot" > nul 2>&1
 if %errorlevel% neq 0 (
-    echo [!] Flask non trovato. Installazione in corso...
+    echo [!] Dipendenze mancanti. Installazione in corso...
     pip install -r requirements.txt
 ) else (
     echo [+] Dipendenze trovate.
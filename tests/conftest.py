@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+
+@pytest.fixture(scope='session')
+def server(tmp_path_factory):
+    """The app module, importing it in a temporary directory (its reports directory is relative)"""
+    os.environ['GAS_MANAGER_SAVE_WINDOW'] = '0'
+    os.environ['GAS_MANAGER_ARCHIVE_AFTER_DAYS'] = '0'
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('server'))
+    try:
+        import app
+        app.app.root_path = os.getcwd()
+        app.start_services()
+        yield app
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
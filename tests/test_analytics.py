@@ -0,0 +1,79 @@
+import datetime
+
+import pytest
+
+from analytics import consumption_series, depletion_forecast
+
+SITE = '?site=analytics'
+
+
+def returned(code, gas, day, bar, volume='10'):
+    return {'code': code, 'gasType': gas, 'pressureIn': str(200), 'pressureOut': str(200 - bar),
+            'cylinderVolume': volume, 'entryDate': '2026-01-01T00:00:00.000Z',
+            'exitDate': f'{day}T10:00:00.000Z'}
+
+
+@pytest.fixture(scope='module')
+def history(server):
+    client = server.app.test_client()
+    records = [
+        returned('H1', 'N2', '2026-03-02', 100),
+        returned('H2', 'N2', '2026-03-04', 50),
+        returned('H3', 'O2', '2026-03-10', 20),
+        returned('H4', 'N2', '2026-04-01', 10)
+    ]
+    stock = {'code': 'C1', 'gasType': 'N2', 'pressure': '150', 'cylinderVolume': '10',
+             'physicalForm': 'gas', 'entryDate': '2026-03-01T00:00:00.000Z'}
+    response = client.post(f'/api/sync{SITE}', json={'history': {'upsert': records},
+                                                    'cylinders': {'upsert': [stock]}})
+    assert response.status_code == 200
+    return records
+
+
+def test_monthly_series_is_dense_per_gas_type(client, history):
+    result = client.get(f'/api/analytics/consumption{SITE}&granularity=month&rolling=2').get_json()
+    assert result['buckets'] == ['2026-03', '2026-04']
+    assert result['series']['N2']['liters'] == [1500.0, 100.0]
+    assert result['series']['N2']['rolling_liters'] == [1500.0, 800.0]
+    assert result['series']['O2']['liters'] == [200.0, 0.0]
+
+
+def test_weekly_series_starts_on_monday(client, history):
+    result = client.get(f'/api/analytics/consumption{SITE}&granularity=week&gas_type=N2').get_json()
+    assert result['buckets'][0] == '2026-03-02'
+    assert result['series']['N2']['count'][0] == 2
+    assert len(result['buckets']) == 5
+
+
+def test_series_can_be_limited_to_dates(client, history):
+    result = client.get(f'/api/analytics/consumption{SITE}&granularity=day&from=2026-03-03&to=2026-03-10').get_json()
+    assert result['buckets'][0] == '2026-03-04' and result['buckets'][-1] == '2026-03-10'
+    assert sum(result['series']['N2']['liters']) == 500.0
+
+
+@pytest.mark.parametrize('query', ['rolling=0', 'rolling=-1', 'granularity=year', 'from=03/01/2026'])
+def test_invalid_series_arguments_are_rejected(client, history, query):
+    assert client.get(f'/api/analytics/consumption{SITE}&{query}').status_code == 400
+
+
+def test_rolling_window_of_zero_is_not_replaced_by_the_default():
+    with pytest.raises(ValueError):
+        consumption_series([], 'day', 0)
+    assert consumption_series([], 'day', None)['rolling_window'] == 7
+
+
+def test_forecast_divides_the_stock_by_the_recent_rate(client, history):
+    result = client.get(f'/api/analytics/forecast{SITE}&window=31&as_of=2026-04-01').get_json()
+    n2 = result['gas_types']['N2']
+    # 1600 liters in 31 days against 1500 liters in stock
+    assert n2['stock_liters'] == 1500.0
+    assert n2['daily_rate_liters'] == round(1600 / 31, 2)
+    assert n2['empty_date'] == '2026-04-30'
+    assert result['gas_types']['O2']['days_until_empty'] == 0.0
+
+
+def test_forecast_without_consumption_has_no_date():
+    forecast = depletion_forecast([], {'N2': {'count': 1, 'liters': 100.0}}, datetime.date(2026, 1, 1))
+    assert forecast['N2']['days_until_empty'] is None and forecast['N2']['empty_date'] is None
+    with pytest.raises(ValueError):
+        depletion_forecast([], {}, datetime.date(2026, 1, 1), 0)
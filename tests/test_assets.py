@@ -0,0 +1,104 @@
+import gzip
+import os
+import re
+
+import pytest
+from flask import Flask, abort, jsonify
+
+from assets import IMMUTABLE_CACHE_CONTROL, AssetPipeline, ResponseCompression
+
+SCRIPT = b'console.log("gas manager");\n' * 50
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'css' / 'style.css').write_bytes(b'body { color: black; }\n' * 50)
+    (tmp_path / 'app.js').write_bytes(SCRIPT)
+    (tmp_path / 'page.html').write_text(
+        '<link href="css/style.css" rel="stylesheet"><script src="app.js"></script>'
+        '<a href="https://example.com/app.js">x</a>', encoding='utf-8')
+    pipeline = AssetPipeline(str(tmp_path))
+    pipeline.refresh(force=True)
+    return pipeline
+
+
+@pytest.fixture
+def static_client(pipeline):
+    app = Flask(__name__)
+    ResponseCompression(min_size=1024).init_app(app)
+
+    @app.route('/assets/<path:path>')
+    def fingerprinted(path):
+        return pipeline.fingerprinted_response(path) or abort(404)
+
+    @app.route('/items/<int:count>')
+    def items(count):
+        return jsonify({'items': list(range(count))})
+
+    @app.route('/<path:path>')
+    def static_file(path):
+        return pipeline.response(path) or abort(404)
+
+    return app.test_client()
+
+
+def test_pages_reference_fingerprinted_urls(pipeline, static_client):
+    page = static_client.get('/page.html').get_data(as_text=True)
+    script = pipeline.get('app.js')
+    assert f'src="/assets/app.{script.digest}.js"' in page
+    assert re.search(r'href="/assets/css/style\.[0-9a-f]{12}\.css"', page)
+    # Other hosts are left alone
+    assert 'href="https://example.com/app.js"' in page
+
+
+def test_fingerprinted_urls_are_immutable(pipeline, static_client):
+    url = pipeline.get('app.js').url
+    response = static_client.get(url)
+    assert response.data == SCRIPT
+    assert response.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+
+    # A stale fingerprint still gets the current file, but revalidated
+    response = static_client.get('/assets/app.000000000000.js')
+    assert response.data == SCRIPT
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert static_client.get('/assets/missing.000000000000.js').status_code == 404
+
+
+def test_precompressed_variant_and_etag_revalidation(static_client):
+    response = static_client.get('/app.js', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == SCRIPT
+    assert 'Accept-Encoding' in response.headers['Vary']
+    etag = response.headers['ETag']
+
+    response = static_client.get('/app.js', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304
+    # The identity body has its own ETag
+    response = static_client.get('/app.js', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_changed_files_get_a_new_fingerprint(pipeline, static_client):
+    old_url = pipeline.get('app.js').url
+    with open(os.path.join(pipeline.root, 'app.js'), 'wb') as f:
+        f.write(SCRIPT + b'// v2\n')
+    pipeline.refresh(force=True)
+    new_url = pipeline.get('app.js').url
+    assert new_url != old_url
+    assert new_url in static_client.get('/page.html').get_data(as_text=True)
+
+
+def test_large_json_responses_are_compressed(static_client):
+    response = static_client.get('/items/2000', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert len(gzip.decompress(response.data)) > 1024
+
+    response = static_client.get('/items/3', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_index_page_uses_the_pipeline(client):
+    page = client.get('/').get_data(as_text=True)
+    assert re.search(r'/assets/gas_manager\.[0-9a-f]{12}\.js', page)
@@ -0,0 +1,246 @@
+import datetime
+import json
+import os
+
+from backups import BackupStore, LatestBackupCache, RetentionPolicy
+
+
+def test_backup_accepts_history_with_empty_exit_pressure(client):
+    # A batch return stores the raw input, which may still be empty
+    record = {'code': 'C1', 'gasType': 'N2', 'pressureIn': '200', 'cylinderVolume': '50',
+              'pressureOut': '', 'entryDate': '2026-01-01T00:00:00.000Z',
+              'exitDate': '2026-01-02T00:00:00.000Z'}
+    response = client.post('/api/extract-localstorage', json={'cylinders': [], 'history': [record]})
+    assert response.status_code == 200
+    assert response.get_json()['success']
+
+    loaded = client.get('/api/load-data').get_json()
+    assert loaded['data']['history'] == [record]
+
+
+def test_backup_rejects_records_that_are_not_objects(client):
+    response = client.post('/api/extract-localstorage', json={'cylinders': [{'code': 'C1'}, 'C2']})
+    assert response.status_code == 400
+    assert 'cylinders[1]' in response.get_json()['message']
+
+
+def test_export_still_checks_fields(client):
+    record = {'code': 'C1', 'gasType': 'N2', 'pressureIn': '200', 'pressureOut': '',
+              'entryDate': '2026-01-01T00:00:00.000Z', 'exitDate': '2026-01-02T00:00:00.000Z'}
+    response = client.post('/api/export-history', json=[record])
+    assert response.status_code == 400
+    assert response.get_json()['index'] == 0
+
+
+def age(path, now, **delta):
+    stamp = (now - datetime.timedelta(**delta)).timestamp()
+    os.utime(path, (stamp, stamp))
+
+
+def test_retention_keeps_one_backup_per_hour_then_per_day(tmp_path):
+    now = datetime.datetime(2026, 3, 1, 12, 0)
+    store = BackupStore(str(tmp_path))
+    ages = {'a': {'minutes': 10}, 'b': {'minutes': 20}, 'c': {'hours': 1, 'minutes': 5},
+            'd': {'days': 1, 'hours': 1}, 'e': {'days': 1, 'hours': 2}, 'f': {'days': 10}}
+    for i, name in enumerate(ages):
+        entry, _ = store.save({'cylinders': [{'code': name * 40}] * (i + 1), 'history': []}, name)
+        age(store.path(entry['filename']), now, **ages[name])
+
+    store.retention = RetentionPolicy(hourly=2, daily=3)
+    deleted = store.prune(now)
+    kept = sorted(entry['filename'][len('backup_data_'):][0] for entry in store.index.refresh())
+    # b: same hour as a; e: same day as d; f: older than the daily window
+    assert kept == ['a', 'c', 'd']
+    assert len(deleted) == 3
+
+
+def test_retention_keeps_the_base_of_a_kept_delta(tmp_path):
+    now = datetime.datetime(2026, 3, 1, 12, 0)
+    store = BackupStore(str(tmp_path), RetentionPolicy(hourly=1, daily=1))
+    records = [{'code': f'C{i}'} for i in range(20)]
+    base, _ = store.save({'cylinders': records, 'history': []}, 'base')
+    delta, _ = store.save({'cylinders': records + [{'code': 'new'}], 'history': []}, 'delta')
+    assert delta['format'] == 'delta' and delta['base'] == base['filename']
+    age(store.path(base['filename']), now, days=5)
+
+    assert store.prune(now) == []
+    assert json.loads(store.read_bytes(delta['filename']))['cylinders'][-1] == {'code': 'new'}
+
+
+def test_retention_leaves_plain_backups_of_earlier_versions(tmp_path):
+    now = datetime.datetime(2026, 3, 1, 12, 0)
+    legacy = tmp_path / 'backup_data_20250101_120000.json'
+    legacy.write_text(json.dumps({'cylinders': [], 'history': []}), encoding='utf-8')
+    age(str(legacy), now, days=400)
+
+    store = BackupStore(str(tmp_path), RetentionPolicy(hourly=1, daily=1))
+    store.save({'cylinders': [{'code': 'C1'}], 'history': []}, 'new')
+    assert store.prune(now) == []
+    assert legacy.exists()
+
+
+def payload(*codes):
+    return {'cylinders': [{'code': code, 'gasType': 'N2'} for code in codes], 'history': []}
+
+
+def codes_of(data):
+    return [record['code'] for record in data['cylinders']]
+
+
+def counting_loader(index):
+    """Count the backups whose payload the index reads"""
+    loaded = []
+    loader = index.loader
+
+    def load(path):
+        loaded.append(os.path.basename(path))
+        return loader(path)
+    index.loader = load
+    return loaded
+
+
+def test_manifest_lists_backups_without_reading_them(tmp_path):
+    store = BackupStore(str(tmp_path))
+    store.save(payload('A'), '20260101_080000')
+    store.save(payload('A', 'B'), '20260101_090000')
+
+    index = BackupStore(str(tmp_path)).index
+    loaded = counting_loader(index)
+    entries, total = index.list()
+    assert total == 2
+    assert [entry['cylinders_count'] for entry in entries] == [2, 1]
+    assert loaded == []
+
+
+def test_manifest_rescans_only_files_changed_on_disk(tmp_path):
+    store = BackupStore(str(tmp_path))
+    store.save(payload('A'), '20260101_080000')
+    index = store.index
+    loaded = counting_loader(index)
+
+    # A plain backup copied in by hand is read once
+    path = tmp_path / 'backup_data_20250101_080000.json'
+    path.write_text(json.dumps(payload('X', 'Y', 'Z')), encoding='utf-8')
+    os.utime(path, (0, 0))
+    assert [entry['cylinders_count'] for entry in index.list()[0]] == [1, 3]
+    index.list()
+    assert loaded == ['backup_data_20250101_080000.json']
+
+    # Rewriting it changes its size and mtime, so it is read again
+    path.write_text(json.dumps(payload('X')), encoding='utf-8')
+    os.utime(path, (0, 0))
+    assert index.get(path.name)['cylinders_count'] == 1
+    assert loaded == [path.name, path.name]
+
+    path.unlink()
+    assert index.list()[1] == 1
+    with open(tmp_path / 'backup_index.json', encoding='utf-8') as f:
+        assert list(json.load(f)['backups']) == [entry['filename'] for entry in index.list()[0]]
+
+
+def test_list_backups_pages_newest_first(server, client):
+    site = '?site=backups-list'
+    client.post(f'/api/extract-localstorage{site}', json=payload('A', 'B', 'C'))
+    # Plain backups of earlier versions, which retention leaves alone
+    directory = server.site_registry.directory('backups-list')
+    for stamp, codes in (('20250101_080000', ['A']), ('20250102_080000', ['A', 'B'])):
+        path = os.path.join(directory, f'backup_data_{stamp}.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(payload(*codes), f)
+        moment = datetime.datetime.strptime(stamp, '%Y%m%d_%H%M%S').timestamp()
+        os.utime(path, (moment, moment))
+
+    body = client.get(f'/api/list-backups{site}&page=1&per_page=2').get_json()
+    assert body['total'] == 3
+    assert [backup['cylinders_count'] for backup in body['backups']] == [3, 2]
+    body = client.get(f'/api/list-backups{site}&page=2&per_page=2').get_json()
+    assert [backup['cylinders_count'] for backup in body['backups']] == [1]
+
+
+def test_load_data_revalidates_with_the_etag(client):
+    site = '?site=backups-etag'
+    client.post(f'/api/extract-localstorage{site}', json=payload('A'))
+    response = client.get(f'/api/load-data{site}')
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert codes_of(response.get_json()['data']) == ['A']
+
+    response = client.get(f'/api/load-data{site}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    # A new backup changes the ETag, so the client gets it in full
+    client.post(f'/api/extract-localstorage{site}', json=payload('A', 'B'))
+    response = client.get(f'/api/load-data{site}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert codes_of(response.get_json()['data']) == ['A', 'B']
+
+
+def test_latest_backup_cache_sees_files_written_by_others(tmp_path):
+    store = BackupStore(str(tmp_path))
+    store.save(payload('A'), '20260101_080000')
+    cache = LatestBackupCache(store)
+    first = cache.get()
+    assert cache.get() is first
+
+    # Another server process sharing the directory writes a newer backup
+    BackupStore(str(tmp_path)).save(payload('A', 'B'), '20260101_090000')
+    latest = cache.get()
+    assert latest['filename'] == 'backup_data_20260101_090000.delta.json.gz'
+    assert codes_of(json.loads(latest['raw'])) == ['A', 'B']
+    assert latest['etag'] != first['etag']
+
+
+def test_load_backup_serves_every_format(server, client):
+    site = '?site=backups-formats'
+    client.post(f'/api/extract-localstorage{site}', json=payload('A', 'B', 'C', 'D'))
+    client.post(f'/api/extract-localstorage{site}', json=payload('A', 'B', 'C', 'D', 'E'))
+    directory = server.site_registry.directory('backups-formats')
+    with open(os.path.join(directory, 'backup_data_20250101_080000.json'), 'w', encoding='utf-8') as f:
+        json.dump(payload('P'), f)
+
+    backups = client.get(f'/api/list-backups{site}').get_json()['backups']
+    formats = {backup['filename'].split('.', 1)[1]: backup['filename'] for backup in backups}
+    assert set(formats) == {'json', 'json.gz', 'delta.json.gz'}
+
+    expected = {'json': ['P'], 'json.gz': ['A', 'B', 'C', 'D'], 'delta.json.gz': ['A', 'B', 'C', 'D', 'E']}
+    for suffix, filename in formats.items():
+        response = client.get(f'/api/load-backup/{filename}{site}')
+        assert response.status_code == 200
+        assert response.content_length == len(response.data)
+        body = response.get_json()
+        assert body['success'] is True
+        assert codes_of(body['data']) == expected[suffix]
+
+
+def test_load_backup_refuses_paths_outside_the_site(client):
+    site = '?site=backups-formats'
+    for filename in ('backup_data_missing.json', '../backup_data_x.json', 'sites/x/backup_data_x.json'):
+        assert client.get(f'/api/load-backup/{filename}{site}').status_code == 404
+
+
+def test_unchanged_content_is_not_written_again(tmp_path):
+    store = BackupStore(str(tmp_path))
+    entry, written = store.save(dict(payload('A'), timestamp='2026-01-01T08:00:00.000Z'), '20260101_080000')
+    assert written
+    # Only the client timestamp differs
+    again, written = store.save(dict(payload('A'), timestamp='2026-01-01T09:00:00.000Z'), '20260101_090000')
+    assert not written
+    assert again['filename'] == entry['filename']
+    assert store.index.list()[1] == 1
+
+
+def test_small_changes_are_stored_as_deltas(tmp_path):
+    store = BackupStore(str(tmp_path))
+    many = [chr(ord('A') + i) for i in range(10)]
+    base, _ = store.save(payload(*many), '20260101_080000')
+    delta, _ = store.save(payload(*many, 'Z'), '20260101_090000')
+    assert (base['format'], delta['format'], delta['base']) == ('snapshot', 'delta', base['filename'])
+
+    # A delta reads back as the payload it was saved from
+    assert json.loads(store.read_bytes(delta['filename'])) == payload(*many, 'Z')
+    assert json.loads(BackupStore(str(tmp_path)).read_bytes(delta['filename'])) == payload(*many, 'Z')
+
+    # Rewriting most of the records starts a new base
+    rebased, _ = store.save(payload('X', 'Y'), '20260101_100000')
+    assert rebased['format'] == 'snapshot'
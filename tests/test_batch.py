@@ -0,0 +1,65 @@
+import pytest
+
+
+def entry(code, gas='N2'):
+    return {'type': 'entry', 'code': code, 'gasType': gas, 'pressure': 200, 'cylinderVolume': 50,
+            'physicalForm': 'gas'}
+
+
+def codes(records):
+    return [record['code'] for record in records]
+
+
+@pytest.mark.parametrize('body', [[entry('A')], {'events': []}, {'events': 'A'}])
+def test_batch_needs_a_list_of_events(client, body):
+    response = client.post('/api/batch?site=batch-shape', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_batch_applies_entries_and_returns_in_order(client):
+    site = '?site=batch-order'
+    response = client.post(f'/api/batch{site}', json={'events': [
+        entry('A'), entry('B'),
+        {'type': 'return', 'code': 'A', 'pressureOut': 20, 'exitDate': '2026-02-01T00:00:00.000Z'},
+        # Entered again after its return in the same batch
+        entry('A')
+    ]})
+    assert response.status_code == 200
+    assert [result['status'] for result in response.get_json()['results']] == ['applied'] * 4
+
+    stock = client.get(f'/api/stock{site}').get_json()['items']
+    assert codes(stock) == ['A', 'B']
+    history = client.get(f'/api/history{site}').get_json()['items']
+    assert codes(history) == ['A']
+    assert (history[0]['pressureIn'], history[0]['pressureOut']) == ('200', '20')
+
+
+def test_atomic_batch_is_rejected_by_one_invalid_event(client):
+    site = '?site=batch-atomic'
+    client.post(f'/api/batch{site}', json={'events': [entry('A')]})
+
+    events = [entry('B'), entry('A'), {'type': 'return', 'code': 'Z', 'pressureOut': 1}]
+    response = client.post(f'/api/batch{site}', json={'events': events})
+    assert response.status_code == 400
+    results = response.get_json()['results']
+    assert [result['status'] for result in results] == ['aborted', 'rejected', 'rejected']
+    assert 'already in stock' in results[1]['error']
+    assert codes(client.get(f'/api/stock{site}').get_json()['items']) == ['A']
+
+    response = client.post(f'/api/batch{site}', json={'events': events, 'atomic': False})
+    assert response.status_code == 200
+    assert [result['status'] for result in response.get_json()['results']] == ['applied', 'rejected', 'rejected']
+    assert codes(client.get(f'/api/stock{site}').get_json()['items']) == ['A', 'B']
+
+
+def test_batch_is_backed_up_and_survives_a_snapshot_save(client):
+    site = '?site=batch-backup'
+    client.post(f'/api/batch{site}', json={'events': [entry('A')]})
+    client.post(f'/api/batch{site}', json={'events': [entry('B')]})
+
+    # A client loading after the batch gets B, so its next save keeps it
+    loaded = client.get(f'/api/load-data{site}').get_json()['data']
+    assert codes(loaded['cylinders']) == ['A', 'B']
+    client.post(f'/api/extract-localstorage{site}', json=loaded)
+    assert codes(client.get(f'/api/stock{site}').get_json()['items']) == ['A', 'B']
@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip('cryptography')
+
+import create_cert
+from cryptography.hazmat.primitives import serialization
+
+
+def key_type(key_path):
+    with open(key_path, 'rb') as f:
+        return create_cert.key_type_of(serialization.load_pem_private_key(f.read(), password=None))
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / 'cert.pem'), str(tmp_path / 'key.pem')
+
+
+def test_new_certificates_use_the_default_key_type(paths):
+    assert create_cert.ensure_certificate(*paths, local_ip='127.0.0.1')
+    assert key_type(paths[1]) == create_cert.DEFAULT_KEY_TYPE
+    assert not create_cert.ensure_certificate(*paths, local_ip='127.0.0.1')
+
+
+def test_a_valid_certificate_is_kept_whatever_its_key_type(tmp_path, paths, monkeypatch):
+    monkeypatch.setattr(create_cert, 'get_local_ip', lambda: '127.0.0.1')
+    assert create_cert.ensure_certificate(*paths, 'rsa')
+    with open(paths[0], 'rb') as f:
+        cert = f.read()
+
+    assert create_cert.main(['--output-dir', str(tmp_path)]) == 0
+    with open(paths[0], 'rb') as f:
+        assert f.read() == cert
+    assert key_type(paths[1]) == 'rsa'
+
+
+def test_an_explicit_key_type_replaces_a_certificate_of_another_type(paths):
+    create_cert.ensure_certificate(*paths, 'rsa', local_ip='127.0.0.1')
+    assert create_cert.ensure_certificate(*paths, 'ecdsa', local_ip='127.0.0.1')
+    assert key_type(paths[1]) == 'ecdsa'
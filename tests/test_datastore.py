@@ -0,0 +1,161 @@
+import pytest
+
+from datastore import CylinderStore, StoreError
+
+
+def cylinder(code, gas='N2', pressure='200'):
+    return {'code': code, 'gasType': gas, 'pressure': pressure, 'cylinderVolume': '50',
+            'physicalForm': 'gas', 'entryDate': '2026-01-05T08:00:00.000Z'}
+
+
+def returned(code, gas='N2', exit_date='2026-01-20T08:00:00.000Z'):
+    return {'code': code, 'gasType': gas, 'pressureIn': '200', 'pressureOut': '20', 'cylinderVolume': '50',
+            'physicalForm': 'gas', 'entryDate': '2026-01-05T08:00:00.000Z', 'exitDate': exit_date}
+
+
+def codes(records):
+    return [record['code'] for record in records]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CylinderStore(str(tmp_path / 'gas_manager.db'))
+
+
+def test_changes_since_round_trip(store):
+    assert store.current_version() == 0
+    first = store.apply_changes({'cylinders': {'upsert': [cylinder('A'), cylinder('B')]}})
+    second = store.apply_changes({
+        'cylinders': {'upsert': [cylinder('B', pressure='150')], 'delete': ['A']},
+        'history': {'upsert': [returned('A')]}
+    })
+    assert (first, second) == (1, 2)
+
+    # A client at version 1 gets only what changed after it, deletes included
+    delta = store.changes_since(first)
+    assert delta['version'] == 2
+    assert delta['cylinders'] == {'upsert': [cylinder('B', pressure='150')], 'delete': ['A']}
+    assert codes(delta['history']['upsert']) == ['A']
+
+    # Replaying every delta from 0 rebuilds the store
+    full = store.changes_since(0)
+    assert codes(full['cylinders']['upsert']) == ['B']
+    assert full['cylinders']['delete'] == ['A']
+    assert store.changes_since(second) == {
+        'version': 2,
+        'cylinders': {'upsert': [], 'delete': []},
+        'history': {'upsert': [], 'delete': []}
+    }
+
+
+def test_empty_change_sets_keep_the_version(store):
+    store.apply_changes({'cylinders': {'upsert': [cylinder('A')]}})
+    assert store.apply_changes({}) == 1
+    # Deleting a record that is not stored changes nothing
+    assert store.apply_changes({'cylinders': {'delete': ['Z']}}) == 1
+
+
+def test_reentered_cylinder_clears_its_tombstone(store):
+    store.apply_changes({'cylinders': {'upsert': [cylinder('A')]}})
+    store.apply_changes({'cylinders': {'delete': ['A']}})
+    store.apply_changes({'cylinders': {'upsert': [cylinder('A', gas='O2')]}})
+
+    delta = store.changes_since(1)
+    assert delta['cylinders']['delete'] == []
+    assert delta['cylinders']['upsert'][0]['gasType'] == 'O2'
+
+
+def test_replace_all_writes_only_the_differences(store):
+    data = {'cylinders': [cylinder('A'), cylinder('B')], 'history': [returned('C')]}
+    assert store.replace_all(data) == 1
+    # The same snapshot again is not a change
+    assert store.replace_all(data) == 1
+
+    data = {'cylinders': [cylinder('A'), cylinder('D')], 'history': [returned('C')]}
+    assert store.replace_all(data) == 2
+    delta = store.changes_since(1)
+    assert codes(delta['cylinders']['upsert']) == ['D']
+    assert delta['cylinders']['delete'] == ['B']
+    assert delta['history'] == {'upsert': [], 'delete': []}
+    assert store.snapshot() == data
+
+
+def test_malformed_record_rolls_back_the_change_set(store):
+    store.apply_changes({'cylinders': {'upsert': [cylinder('A')]}})
+    with pytest.raises(StoreError):
+        store.apply_changes({'cylinders': {'upsert': [cylinder('B'), {'gasType': 'N2'}]}})
+    assert store.current_version() == 1
+    assert codes(store.snapshot()['cylinders']) == ['A']
+
+
+def test_listeners_see_committed_versions(store):
+    versions = []
+    store.add_listener(versions.append)
+    store.add_listener(lambda version: 1 / 0)  # A failing listener does not fail the write
+    store.apply_changes({'cylinders': {'upsert': [cylinder('A')]}})
+    store.apply_changes({})
+    store.apply_changes({'cylinders': {'delete': ['A']}})
+    assert versions == [1, 2]
+
+
+def test_sync_endpoint_returns_the_delta_since_the_client_version(client):
+    site = '?site=datastore-sync'
+    response = client.post(f'/api/sync{site}', json={'since': 0, 'cylinders': {'upsert': [cylinder('A')]}})
+    body = response.get_json()
+    assert body['version'] == 1
+    assert codes(body['changes']['cylinders']['upsert']) == ['A']
+
+    response = client.post(f'/api/sync{site}', json={'since': 1, 'cylinders': {'delete': ['A']}})
+    body = response.get_json()
+    assert body['changes']['cylinders'] == {'upsert': [], 'delete': ['A']}
+
+    response = client.get(f'/api/sync{site}&since=0')
+    assert response.get_json()['changes']['cylinders']['delete'] == ['A']
+
+
+def test_aggregates_follow_upserts_and_deletes(store):
+    store.apply_changes({
+        'cylinders': {'upsert': [cylinder('A'), cylinder('B', gas='O2', pressure='100')]},
+        'history': {'upsert': [returned('C'), returned('D', gas='O2', exit_date='2026-02-03T08:00:00.000Z')]}
+    })
+    store.apply_changes({
+        'cylinders': {'upsert': [cylinder('A', pressure='150')], 'delete': ['B']},
+        'history': {'delete': ['C|2026-01-05T08:00:00.000Z|2026-01-20T08:00:00.000Z']}
+    })
+    assert store.verify_aggregates() == []
+
+    summary = store.summary()
+    assert summary['version'] == 2
+    assert summary['stock']['total'] == {'count': 1, 'bar': 150.0, 'liters': 7500.0}
+    assert summary['stock']['by_gas_type'] == {'N2': {'count': 1, 'bar': 150.0, 'liters': 7500.0}}
+    assert summary['consumption']['by_month'] == {'2026-02': {'count': 1, 'bar': 180.0, 'liters': 9000.0}}
+    assert store.daily_consumption() == [('2026-02-03', 'O2', 1, 180.0, 9000.0)]
+
+
+def test_summary_is_cached_until_the_version_changes(store):
+    store.apply_changes({'cylinders': {'upsert': [cylinder('A')]}})
+    first = store.summary()
+    assert store.summary() is first
+    store.apply_changes({'cylinders': {'upsert': [cylinder('B')]}})
+    assert store.summary()['stock']['total']['count'] == 2
+
+
+def test_aggregates_are_rebuilt_for_databases_of_earlier_versions(tmp_path):
+    path = str(tmp_path / 'gas_manager.db')
+    store = CylinderStore(path)
+    store.apply_changes({'cylinders': {'upsert': [cylinder('A')]}})
+    conn = store._connection()
+    conn.execute("DELETE FROM aggregates")
+    conn.execute("DELETE FROM meta WHERE key = 'aggregates'")
+    assert store.verify_aggregates() != []
+
+    assert CylinderStore(path).verify_aggregates() == []
+
+
+def test_summary_endpoint_verifies_the_aggregates(client):
+    site = '?site=datastore-summary'
+    client.post(f'/api/sync{site}', json={'cylinders': {'upsert': [cylinder('A'), cylinder('B')]}})
+    client.post(f'/api/sync{site}', json={'cylinders': {'delete': ['A']}})
+    body = client.get(f'/api/summary{site}&verify=1').get_json()
+    assert (body['verified'], body['mismatches']) == (True, [])
+    assert body['stock']['total']['count'] == 1
@@ -0,0 +1,106 @@
+import csv
+import datetime
+import io
+
+import pytest
+
+from columnar import columnar_available
+
+HISTORY = {'code': 'H1', 'gasType': 'N2', 'pressureIn': '200', 'pressureOut': '50', 'cylinderVolume': None,
+           'entryDate': '2026-01-01T00:00:00.000Z', 'exitDate': '2026-01-02T00:00:00.000Z'}
+
+STOCK = {'code': 'C1', 'gasType': 'N2', 'pressure': '200', 'cylinderVolume': None, 'physicalForm': 'gas',
+         'entryDate': '2026-01-01T00:00:00.000Z'}
+
+
+def read_rows(filepath):
+    with open(filepath, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+
+def test_null_volume_counts_as_the_default(client):
+    response = client.post('/api/export-history', json=[HISTORY])
+    assert response.status_code == 200
+    rows = read_rows(response.get_json()['filepath'])
+    assert rows[1][:4] == ['H1', 'N2', '200.0', '50.0']
+    assert float(rows[1][-1]) == 150 * 50
+
+    response = client.post('/api/export-stock', json=[STOCK])
+    assert read_rows(response.get_json()['filepath'])[1][3] == '50'
+
+
+def test_null_volume_in_a_streamed_export(client):
+    response = client.post('/api/export-all?stream=1', json={'cylinders': [STOCK], 'history': [HISTORY]})
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert any(row[:1] == ['H1'] and float(row[-1]) == 7500 for row in rows)
+
+
+@pytest.mark.skipif(not columnar_available(), reason='pyarrow is not installed')
+def test_null_volume_in_a_columnar_export(client):
+    import pyarrow.parquet as pq
+    response = client.post('/api/export-all?format=parquet', json={'cylinders': [STOCK], 'history': [HISTORY]})
+    assert response.status_code == 200, response.get_json()
+    stock_file, history_file = response.get_json()['files']
+    directory = response.get_json()['filepath'].rsplit(stock_file, 1)[0]
+    assert pq.read_table(directory + stock_file).column('cylinder_volume_l').to_pylist() == [50.0]
+    assert pq.read_table(directory + history_file).column('consumption_l').to_pylist() == [7500.0]
+
+
+columnar = pytest.mark.skipif(not columnar_available(), reason='pyarrow is not installed')
+
+
+@columnar
+def test_parquet_stock_export_is_typed(client):
+    import pyarrow.parquet as pq
+    stock = dict(STOCK, cylinderVolume='40', pressure='180.5')
+    response = client.post('/api/export-stock?format=parquet&site=exports-columnar', json=[stock])
+    assert response.status_code == 200
+    table = pq.read_table(response.get_json()['filepath'])
+    assert table.schema.field('pressure_bar').type == 'double'
+    row = table.to_pylist()[0]
+    assert (row['code'], row['pressure_bar'], row['cylinder_volume_l']) == ('C1', 180.5, 40.0)
+    assert row['entry_date'] == datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+@columnar
+def test_arrow_report_export_writes_stock_and_history(client):
+    import pyarrow as pa
+    response = client.post('/api/export-all?format=arrow&site=exports-columnar',
+                           json={'cylinders': [STOCK], 'history': [HISTORY, dict(HISTORY, code='H2')]})
+    body = response.get_json()
+    assert [name.rsplit('_', 1)[1] for name in body['files']] == ['stock.arrow', 'history.arrow']
+    directory = body['filepath'].rsplit(body['files'][0], 1)[0]
+    with pa.ipc.open_file(directory + body['files'][1]) as reader:
+        assert reader.read_all().column('code').to_pylist() == ['H1', 'H2']
+
+
+@columnar
+def test_invalid_record_leaves_no_columnar_file(client):
+    before = client.get('/api/list-exports?site=exports-columnar&format=parquet').get_json()['total']
+    response = client.post('/api/export-history?format=parquet&site=exports-columnar',
+                           json=[HISTORY, dict(HISTORY, pressureOut='lots')])
+    assert response.status_code == 400
+    assert response.get_json()['index'] == 1
+    assert client.get('/api/list-exports?site=exports-columnar&format=parquet').get_json()['total'] == before
+
+
+def test_unknown_export_format_is_rejected(client):
+    response = client.post('/api/export-stock?format=xlsx', json=[STOCK])
+    assert response.status_code == 400
+    assert 'xlsx' in response.get_json()['message']
+
+
+def test_list_exports_filters_by_format(client):
+    site = 'site=exports-list'
+    client.post(f'/api/export-stock?{site}', json=[STOCK])
+    client.post(f'/api/export-history?{site}', json=[HISTORY])
+    if columnar_available():
+        client.post(f'/api/export-stock?format=parquet&{site}', json=[STOCK])
+
+    exports = client.get(f'/api/list-exports?{site}').get_json()['exports']
+    assert len(exports) == (3 if columnar_available() else 2)
+    assert all(export['download_url'].endswith('?site=exports-list') for export in exports)
+    csv_exports = client.get(f'/api/list-exports?{site}&format=csv').get_json()['exports']
+    assert sorted(export['filename'].split('_2')[0] for export in csv_exports) == ['cylinder_history', 'cylinder_stock']
+    assert {export['format'] for export in csv_exports} == {'csv'}
@@ -0,0 +1,121 @@
+import json
+
+import pytest
+
+import feed
+from datastore import CylinderStore
+from feed import ChangeFeed, FeedFull
+
+
+def cylinder(code):
+    return {'code': code, 'gasType': 'N2', 'pressure': '200', 'cylinderVolume': '50', 'physicalForm': 'gas',
+            'entryDate': '2026-01-05T08:00:00.000Z'}
+
+
+def add(store, *codes):
+    return store.apply_changes({'cylinders': {'upsert': [cylinder(code) for code in codes]}})
+
+
+def parse(message):
+    """Return (id, event, data) of a server-sent event"""
+    fields = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+    return int(fields['id']), fields['event'], json.loads(fields['data'])
+
+
+def events(stream, count):
+    """Read the next `count` events of a stream, skipping the retry line"""
+    result = []
+    for message in stream:
+        if message.startswith('retry:'):
+            continue
+        result.append(parse(message))
+        if len(result) == count:
+            return result
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CylinderStore(str(tmp_path / 'gas_manager.db'))
+
+
+def test_new_stream_gets_hello_then_live_changes(store):
+    add(store, 'A')
+    change_feed = ChangeFeed(store)
+    stream = change_feed.subscribe()
+    try:
+        assert events(stream, 1) == [(1, 'hello', {'version': 1})]
+        add(store, 'B')
+        seq, event, data = events(stream, 1)[0]
+        assert (seq, event) == (2, 'change')
+        assert [c['code'] for c in data['cylinders']['upsert']] == ['B']
+    finally:
+        stream.close()
+    assert change_feed.subscribers == 0
+
+
+def test_resuming_stream_replays_the_buffer(store):
+    change_feed = ChangeFeed(store)
+    listener = change_feed.subscribe()
+    try:
+        for code in 'ABC':
+            add(store, code)
+        stream = change_feed.subscribe(since=1)
+        try:
+            assert [(seq, data['cylinders']['upsert'][0]['code']) for seq, _, data in events(stream, 2)] == [
+                (2, 'B'), (3, 'C')]
+        finally:
+            stream.close()
+    finally:
+        listener.close()
+
+
+def test_stream_behind_the_buffer_catches_up_from_the_store(store):
+    change_feed = ChangeFeed(store)
+    # Nobody was listening, so nothing was buffered
+    for code in 'ABC':
+        add(store, code)
+    stream = change_feed.subscribe(since=1)
+    try:
+        seq, event, data = events(stream, 1)[0]
+        assert (seq, event) == (3, 'change')
+        assert [c['code'] for c in data['cylinders']['upsert']] == ['B', 'C']
+    finally:
+        stream.close()
+
+
+def test_stream_too_far_behind_is_reset(store, monkeypatch):
+    monkeypatch.setattr(feed, 'FEED_MAX_CATCH_UP_RECORDS', 1)
+    change_feed = ChangeFeed(store)
+    add(store, 'A', 'B')
+    for since in (0, 7):
+        stream = change_feed.subscribe(since=since)
+        try:
+            assert events(stream, 1) == [(1, 'reset', {'version': 1})]
+        finally:
+            stream.close()
+
+
+def test_subscribers_are_limited_and_released_on_close(store):
+    change_feed = ChangeFeed(store, max_subscribers=1)
+    stream = change_feed.subscribe()
+    with pytest.raises(FeedFull):
+        change_feed.subscribe()
+    # Closed before it was ever read
+    stream.close()
+    change_feed.subscribe().close()
+    assert change_feed.subscribers == 0
+
+
+def test_change_stream_endpoint(client):
+    site = '?site=feed'
+    client.post(f'/api/sync{site}', json={'cylinders': {'upsert': [cylinder('A'), cylinder('B')]}})
+    assert client.get(f'/api/changes{site}&since=abc').status_code == 400
+
+    response = client.get(f'/api/changes{site}', headers={'Last-Event-ID': '0'}, buffered=False)
+    try:
+        assert response.mimetype == 'text/event-stream'
+        seq, event, data = events((chunk.decode() for chunk in response.response), 1)[0]
+        assert (seq, event) == (1, 'change')
+        assert [c['code'] for c in data['cylinders']['upsert']] == ['A', 'B']
+    finally:
+        response.close()
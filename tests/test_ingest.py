@@ -0,0 +1,75 @@
+import io
+import json
+
+import pytest
+
+from ingest import READ_SIZE, IngestError, JSONStreamParser, RecordStream
+
+NUMBERS = [0, -0.5, 12.75, 1e5, 2.5E-3, -7e+2, 123456789.125, 1.0, 6.02e23]
+
+DOCUMENT = {
+    'scale': 12.75,
+    'cylinders': [
+        {'code': f'C{i}', 'gasType': 'N2', 'pressure': number, 'cylinderVolume': 50.5,
+         'physicalForm': 'gas', 'entryDate': '2026-01-01T00:00:00Z'}
+        for i, number in enumerate(NUMBERS)
+    ],
+    'ratio': -3.5e-2,
+    'history': [
+        {'code': f'H{i}', 'gasType': 'O2', 'pressureIn': 200.25, 'pressureOut': number,
+         'entryDate': '2026-01-01', 'exitDate': '2026-01-02'}
+        for i, number in enumerate(NUMBERS)
+    ],
+    'last': 1e-7
+}
+
+
+def encodings(document):
+    yield json.dumps(document).encode('utf-8')
+    yield json.dumps(document, separators=(',', ':')).encode('utf-8')
+    yield json.dumps(document, indent=2).encode('utf-8')
+
+
+@pytest.mark.parametrize('read_size', [1, 2, 3])
+def test_parser_reads_numbers_cut_by_reads(read_size):
+    for raw in encodings(NUMBERS):
+        parser = JSONStreamParser(io.BytesIO(raw), read_size)
+        assert list(parser.iter_array()) == NUMBERS
+        parser.end()
+
+
+@pytest.mark.parametrize('read_size', [1, 2, 3])
+def test_record_stream_with_tiny_reads(read_size):
+    for raw in encodings(DOCUMENT):
+        body = RecordStream(io.BytesIO(raw), read_size=read_size)
+        assert list(body.records('history')) == DOCUMENT['history']
+        assert list(body.records('cylinders')) == DOCUMENT['cylinders']
+        body.finish()
+        assert body.extras == {'scale': 12.75, 'ratio': -3.5e-2, 'last': 1e-7}
+
+
+@pytest.mark.parametrize('cut, rest', [
+    ('12.', '75}'), ('12', '.75}'), ('1', '2.75}'), ('1e', '5}'), ('1e-', '5}'), ('1.5e', '+2}')
+])
+def test_number_cut_at_the_read_boundary(cut, rest):
+    # The first read ends right after `cut`, the rest of the number follows
+    head = '{"pad": "' + 'x' * (READ_SIZE - 17 - len(cut)) + '", "v": ' + cut
+    assert len(head.encode()) == READ_SIZE
+    document = (head + rest).encode()
+    body = RecordStream(io.BytesIO(document))
+    body.finish()
+    assert body.extras['v'] == json.loads(document)['v']
+
+
+def test_invalid_number_is_still_reported():
+    with pytest.raises(IngestError, match='character'):
+        RecordStream(io.BytesIO(b'{"v": 12.x}'), read_size=2).finish()
+
+
+def test_record_errors_name_the_record():
+    history = [dict(record) for record in DOCUMENT['history']]
+    history[4]['pressureOut'] = 'n/a'
+    body = RecordStream(io.BytesIO(json.dumps(history).encode()), 'history', read_size=3)
+    with pytest.raises(IngestError) as error:
+        list(body.records('history'))
+    assert (error.value.kind, error.value.index) == ('history', 4)
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from jobs import JobQueue, JobQueueFull
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(max_workers=1, max_pending=2)
+    yield queue
+    queue.shutdown()
+
+
+def blocked_task(started, release, total=3):
+    """Task that reports progress once released"""
+    def task(job):
+        started.set()
+        release.wait(5)
+        for _ in range(total):
+            job.advance()
+        return {'rows': total}
+    return task
+
+
+def wait_for(job, timeout=5):
+    deadline = time.monotonic() + timeout
+    while job.active:
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+    return job
+
+
+def test_same_input_returns_the_existing_job(queue):
+    started, release = threading.Event(), threading.Event()
+    job, created = queue.submit('report', 'abc', 3, blocked_task(started, release))
+    assert created
+    cleaned = []
+    again, created = queue.submit('report', 'abc', 3, blocked_task(started, release), cleanup=lambda: cleaned.append(1))
+    assert (again, created, cleaned) == (job, False, [1])
+
+    release.set()
+    wait_for(job)
+    assert job.to_dict()['status'] == 'done'
+    assert (job.to_dict()['percent'], job.result) == (100, {'rows': 3})
+
+    # A finished job is reused while its result is valid
+    assert queue.submit('report', 'abc', 3, blocked_task(started, release))[1] is False
+    assert queue.submit('report', 'abc', 3, blocked_task(started, release), is_valid=lambda job: False)[1] is True
+
+
+def test_queue_is_bounded(queue):
+    started, release = threading.Event(), threading.Event()
+    try:
+        queue.submit('report', 'a', 3, blocked_task(started, release))
+        queue.submit('report', 'b', 3, blocked_task(started, release))
+        cleaned = []
+        with pytest.raises(JobQueueFull):
+            queue.submit('report', 'c', 3, blocked_task(started, release), cleanup=lambda: cleaned.append(1))
+        assert cleaned == [1]
+    finally:
+        release.set()
+
+
+def test_cancel_stops_running_and_queued_jobs(queue):
+    started, release = threading.Event(), threading.Event()
+    running, _ = queue.submit('report', 'a', 3, blocked_task(started, release))
+    queued, _ = queue.submit('report', 'b', 3, blocked_task(threading.Event(), release))
+    assert started.wait(5)
+
+    assert queue.cancel(queued.id).status == 'cancelled'
+    queue.cancel(running.id)
+    release.set()
+    assert wait_for(running).status == 'cancelled'
+    assert running.processed == 1
+    assert queue.cancel('missing') is None
+
+
+def test_failed_job_reports_its_error(queue):
+    def task(job):
+        raise ValueError('bad row')
+    job, _ = queue.submit('report', 'a', 1, task)
+    assert wait_for(job).to_dict()['error'] == 'bad row'
+    assert job.status == 'failed'
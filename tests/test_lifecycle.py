@@ -0,0 +1,111 @@
+import datetime
+import json
+import os
+import zipfile
+
+import pytest
+
+from lifecycle import ReportArchive, parse_export_filename
+
+# A day whose month is long over, and the time the archiving pass runs
+OLD = datetime.datetime(2025, 3, 14, 12, 0)
+NOW = datetime.datetime(2026, 10, 1)
+
+STOCK_CSV = b'code,gasType\r\nA,N2\r\nB,O2\r\n'
+
+
+def write_export(directory, filename, content):
+    path = os.path.join(directory, filename)
+    with open(path, 'wb') as f:
+        f.write(content)
+    os.utime(path, (OLD.timestamp(), OLD.timestamp()))
+    return path
+
+
+@pytest.mark.parametrize('filename, expected', [
+    ('cylinder_stock_20250314_120000.csv', 'stock'),
+    ('cylinder_history_20250314_120000.parquet', 'history'),
+    ('complete_cylinder_report_20250314_120000_stock.arrow', 'report'),
+    ('cross_site_report_20250314_120000.csv', 'sites_report'),
+    ('cylinder_stock_20250314_120000.json', None),
+    ('backup_20250314_120000.json.gz', None)
+])
+def test_export_filenames(filename, expected):
+    parsed = parse_export_filename(filename)
+    assert (parsed[0] if parsed else None) == expected
+
+
+def test_csv_and_columnar_exports_are_archived(tmp_path):
+    write_export(tmp_path, 'cylinder_stock_20250314_120000.csv', STOCK_CSV)
+    write_export(tmp_path, 'cylinder_stock_20250314_120000.parquet', b'PAR1' + b'\0' * 64 + b'PAR1')
+    write_export(tmp_path, 'cylinder_stock_20260930_120000.csv', STOCK_CSV)  # Month not over yet
+
+    archive = ReportArchive(str(tmp_path))
+    assert archive.compact(NOW, after_days=30)['files'] == 2
+    assert sorted(os.listdir(tmp_path)) == ['archive', 'cylinder_stock_20260930_120000.csv']
+
+    entries, total = archive.search(month='2025-03')
+    assert total == 2
+    counts = {entry['filename']: entry['cylinders_count'] for entry in entries}
+    assert counts == {'cylinder_stock_20250314_120000.csv': 2, 'cylinder_stock_20250314_120000.parquet': None}
+
+    # Parquet is compressed already and is stored as it is
+    with zipfile.ZipFile(tmp_path / 'archive' / 'exports_2025-03.zip') as zf:
+        assert zf.getinfo('cylinder_stock_20250314_120000.parquet').compress_type == zipfile.ZIP_STORED
+
+    entry, f = archive.open('cylinder_stock_20250314_120000.csv')
+    try:
+        assert f.read() == STOCK_CSV
+    finally:
+        f.close()
+
+    # A new instance reads the same index from disk
+    assert ReportArchive(str(tmp_path)).search()[1] == 2
+
+
+def test_originals_stay_until_the_index_lists_them(tmp_path, monkeypatch):
+    write_export(tmp_path, 'cylinder_stock_20250314_120000.csv', STOCK_CSV)
+    archive = ReportArchive(str(tmp_path))
+
+    def interrupted(entries):
+        raise OSError('disk full')
+    monkeypatch.setattr(archive, '_save', interrupted)
+    with pytest.raises(OSError):
+        archive.compact(NOW, after_days=30)
+    assert os.path.exists(tmp_path / 'cylinder_stock_20250314_120000.csv')
+    assert not os.path.exists(tmp_path / 'archive' / 'archive_index.json')
+
+    # The next pass completes the archive and only then removes the original
+    monkeypatch.undo()
+    archive = ReportArchive(str(tmp_path))
+    assert archive.compact(NOW, after_days=30)['files'] == 1
+    assert not os.path.exists(tmp_path / 'cylinder_stock_20250314_120000.csv')
+    with open(tmp_path / 'archive' / 'archive_index.json', encoding='utf-8') as f:
+        assert list(json.load(f)['files']) == ['cylinder_stock_20250314_120000.csv']
+
+
+def test_archiving_does_not_open_sites(server, client):
+    client.post('/api/extract-localstorage?site=lifecycle-closed', json={'cylinders': [], 'history': []})
+    directory = server.site_registry.directory('lifecycle-idle')
+    os.makedirs(directory)
+    write_export(directory, 'cylinder_stock_20250314_120000.csv', STOCK_CSV)
+
+    archives = server.lifecycle_worker.archives()
+    assert [archive.directory for archive in archives] == [
+        server.site_registry.directory(name) for name in server.site_registry.names()]
+    assert 'lifecycle-idle' not in {site.name for site in server.site_registry.open_sites()}
+
+    # An open site shares the archive the worker compacts
+    open_site = server.site_registry.get('lifecycle-closed')
+    assert server.site_registry.archive('lifecycle-closed') is open_site.archive
+
+    summary = server.lifecycle_worker.run_once(NOW)
+    assert summary['errors'] == []
+    assert 'lifecycle-idle' not in {site.name for site in server.site_registry.open_sites()}
+
+    # Reading the archive opens the site, which sees the archived file
+    response = client.get('/api/archive?site=lifecycle-idle&month=2025-03')
+    assert [entry['filename'] for entry in response.get_json()['files']] == ['cylinder_stock_20250314_120000.csv']
+    response = client.get('/download/cylinder_stock_20250314_120000.csv?site=lifecycle-idle')
+    assert response.status_code == 200
+    assert response.data == STOCK_CSV
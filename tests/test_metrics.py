@@ -0,0 +1,92 @@
+import os
+
+import pytest
+from flask import Flask, Response, jsonify
+
+from metrics import Counter, Histogram, MetricsRegistry, RequestMetrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.register(Histogram('latency_seconds', 'Latency', (0.1, 1), ('route',)))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value, '/a')
+    counter = registry.register(Counter('requests_total', 'Requests', ('route',)))
+    counter.inc('/"quoted"')
+
+    lines = registry.render().splitlines()
+    assert lines[:6] == [
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{route="/a",le="0.1"} 1',
+        'latency_seconds_bucket{route="/a",le="1"} 3',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 4',
+        'latency_seconds_sum{route="/a"} 6.05',
+    ]
+    assert lines[6] == 'latency_seconds_count{route="/a"} 4'
+    assert lines[-1] == 'requests_total{route="/\\"quoted\\""} 1'
+
+
+@pytest.fixture
+def metrics(tmp_path):
+    app = Flask(__name__)
+    metrics = RequestMetrics(profile_dir=str(tmp_path))
+    metrics.init_app(app)
+
+    @app.route('/items/<int:item>')
+    def item(item):
+        with metrics.phase('lookup'):
+            return jsonify({'item': item})
+
+    @app.route('/stream')
+    def stream():
+        return Response((b'x' * 100 for _ in range(3)), mimetype='text/plain')
+
+    @app.route('/fail')
+    def fail():
+        return jsonify({'success': False}), 503
+
+    metrics.client = app.test_client()
+    return metrics
+
+
+def test_requests_are_counted_by_route_and_status(metrics):
+    for item in (1, 2):
+        metrics.client.get(f'/items/{item}').close()
+    metrics.client.get('/fail').close()
+    metrics.client.get('/missing').close()
+
+    assert metrics.requests.value('GET', '/items/<int:item>', 200) == 2
+    assert metrics.errors.value('GET', '/fail', 503) == 1
+    assert metrics.requests.value('GET', 'unmatched', 404) == 1
+    assert metrics.in_flight.value() == 0
+    rendered = metrics.render()
+    assert 'gas_manager_phase_duration_seconds_count{phase="lookup"} 2' in rendered
+    assert 'gas_manager_phase_duration_seconds_count{phase="json_encode"} 3' in rendered
+
+
+def test_streamed_bodies_are_measured_once_sent(metrics):
+    response = metrics.client.get('/stream')
+    assert response.data == b'x' * 300
+    response.close()
+    assert 'gas_manager_http_response_size_bytes_sum{method="GET",route="/stream"} 300' in metrics.render()
+
+
+def test_profiled_request_saves_its_stacks(metrics):
+    response = metrics.client.get('/items/1?profile=1')
+    response.close()
+    name = response.headers['X-Profile']
+    assert name.endswith('_item.folded')
+    assert os.path.exists(os.path.join(metrics.profile_dir, name))
+
+    response = metrics.client.get('/items/1')
+    assert 'X-Profile' not in response.headers
+
+
+def test_metrics_endpoint(client):
+    client.post('/api/extract-localstorage?site=metrics', json={'cylinders': [], 'history': []}).close()
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert 'gas_manager_http_requests_total{method="POST",route="/api/extract-localstorage",status="200"}' in text
+    assert 'gas_manager_save_queue_depth{site="metrics"} 0' in text
@@ -0,0 +1,78 @@
+import pytest
+
+SITE = '?site=query'
+
+
+def cylinder(code, gas, day):
+    return {'code': code, 'gasType': gas, 'pressure': '200', 'cylinderVolume': '50', 'physicalForm': 'gas',
+            'entryDate': f'2026-01-{day:02d}T08:00:00.000Z'}
+
+
+def returned(code, gas, day):
+    return dict(cylinder(code, gas, 1), pressureIn='200', pressureOut='20',
+                exitDate=f'2026-02-{day:02d}T17:30:00.000Z')
+
+
+@pytest.fixture(scope='module')
+def client(server):
+    client = server.app.test_client()
+    client.post(f'/api/sync{SITE}', json={
+        'cylinders': {'upsert': [
+            cylinder('N-1', 'N2', 3), cylinder('N-2', 'N2', 1), cylinder('O-1', 'O2', 2),
+            cylinder('N-3', 'N2', 2), cylinder('AR-1', 'Ar', 5)
+        ]},
+        'history': {'upsert': [returned('H-1', 'N2', 10), returned('H-2', 'O2', 11), returned('H-3', 'N2', 12)]}
+    })
+    return client
+
+
+def codes(body):
+    return [item['code'] for item in body['items']]
+
+
+def pages(client, url):
+    """Follow the cursors of a query; return the codes of every page"""
+    result = []
+    cursor = None
+    while True:
+        body = client.get(url + (f'&cursor={cursor}' if cursor else '')).get_json()
+        result.append(codes(body))
+        cursor = body['next_cursor']
+        if not cursor:
+            return result
+
+
+def test_cursor_pages_cover_every_record_once(client):
+    assert pages(client, f'/api/stock{SITE}&limit=2') == [['AR-1', 'N-1'], ['N-2', 'N-3'], ['O-1']]
+    assert pages(client, f'/api/stock{SITE}&limit=2&order=desc') == [['O-1', 'N-3'], ['N-2', 'N-1'], ['AR-1']]
+
+
+def test_sorting_on_a_column_with_ties_pages_by_code(client):
+    # N-3 and O-1 share their entry date
+    assert pages(client, f'/api/stock{SITE}&sort=entry_date&limit=2') == [['N-2', 'N-3'], ['O-1', 'N-1'], ['AR-1']]
+
+
+def test_filters(client):
+    assert codes(client.get(f'/api/stock{SITE}&gas_type=N2').get_json()) == ['N-1', 'N-2', 'N-3']
+    assert codes(client.get(f'/api/stock{SITE}&code_prefix=N-').get_json()) == ['N-1', 'N-2', 'N-3']
+    # A date-only upper bound includes the whole day
+    assert codes(client.get(f'/api/stock{SITE}&entry_from=2026-01-02&entry_to=2026-01-03').get_json()) == [
+        'N-1', 'N-3', 'O-1']
+    history = client.get(f'/api/history{SITE}&exit_to=2026-02-11').get_json()
+    assert codes(history) == ['H-1', 'H-2']
+
+
+def test_history_defaults_to_exit_date_order(client):
+    assert codes(client.get(f'/api/history{SITE}&order=desc').get_json()) == ['H-3', 'H-2', 'H-1']
+
+
+@pytest.mark.parametrize('args', ['cursor=not-a-cursor', 'sort=pressure', 'order=up'])
+def test_invalid_query_arguments_are_rejected(client, args):
+    response = client.get(f'/api/stock{SITE}&{args}')
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_single_cylinder_lookup(client):
+    assert client.get(f'/api/stock/O-1{SITE}').get_json()['cylinder']['gasType'] == 'O2'
+    assert client.get(f'/api/stock/Z-9{SITE}').status_code == 404
@@ -0,0 +1,36 @@
+import csv
+import time
+
+from report import iter_report_rows, report_row_count
+from synthetic import generate_dataset
+
+
+def wait_for_job(client, status_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(status_url).get_json()
+        if job['status'] not in ('queued', 'running') or time.monotonic() > deadline:
+            return job
+        time.sleep(0.05)
+
+
+def test_report_row_count_matches_rows():
+    data = generate_dataset(2000)
+    stock, history = data['cylinders'], data['history']
+    rows = list(iter_report_rows(stock, history))
+    stock_gases = {cylinder['gasType'] for cylinder in stock}
+    history_gases = {record['gasType'] for record in history}
+    assert len(stock_gases) > 3 and len(history_gases) > 3
+    assert report_row_count(len(stock), len(history), len(stock_gases), len(history_gases)) == len(rows)
+
+
+def test_async_report_total_equals_rows_written(client):
+    data = generate_dataset(3000)
+    response = client.post('/api/export-all?async=1', json=data)
+    assert response.status_code == 202
+
+    job = wait_for_job(client, response.get_json()['status_url'])
+    assert job['status'] == 'done'
+    with open(job['result']['filepath'], newline='', encoding='utf-8') as report:
+        written = sum(1 for _ in csv.reader(report))
+    assert job['rows_total'] == job['rows_processed'] == written
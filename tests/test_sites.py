@@ -0,0 +1,59 @@
+import csv
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+def cylinder(code, gas):
+    return {'code': code, 'gasType': gas, 'pressure': '200', 'cylinderVolume': '50',
+            'physicalForm': 'gas', 'entryDate': '2026-01-01T00:00:00.000Z'}
+
+
+def test_importing_the_app_starts_nothing(tmp_path):
+    # What a spawned report worker does with the server script
+    script = (
+        f"import multiprocessing, runpy, sys, threading\nsys.path.insert(0, {ROOT!r})\n"
+        f"module = runpy.run_path({os.path.join(ROOT, 'app.py')!r}, run_name='__mp_main__')\n"
+        "print(len(module['site_registry'].open_sites()), threading.active_count())\n"
+    )
+    result = subprocess.run([sys.executable, '-c', script], cwd=tmp_path, capture_output=True, text=True,
+                            timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ['0', '1']
+    assert not os.listdir(os.path.join(tmp_path, 'reports'))
+
+
+def test_unknown_site_is_not_created_by_a_read(client):
+    assert client.get('/api/stock?site=never-written').status_code == 404
+    assert client.get('/api/stock?site=Not%20Valid').status_code == 400
+
+
+def test_sites_are_partitioned(client):
+    client.post('/api/extract-localstorage?site=part-a', json={'cylinders': [cylinder('A1', 'N2')]})
+    client.post('/api/extract-localstorage', json={'cylinders': [cylinder('D1', 'O2')]},
+                headers={'X-Site': 'part-b'})
+
+    assert [c['code'] for c in client.get('/api/stock?site=part-a').get_json()['items']] == ['A1']
+    assert [c['code'] for c in client.get('/api/stock?site=part-b').get_json()['items']] == ['D1']
+    names = client.get('/api/sites').get_json()['sites']
+    assert names[0] == 'default' and {'part-a', 'part-b'} <= set(names)
+
+
+def test_cross_site_report_builds_sections_in_worker_processes(server, client, monkeypatch):
+    monkeypatch.setattr(server, 'REPORT_PROCESSES', 2)
+    client.post('/api/extract-localstorage?site=report-a', json={'cylinders': [cylinder('A1', 'N2')]})
+    client.post('/api/extract-localstorage?site=report-b',
+                json={'cylinders': [cylinder('B1', 'N2'), cylinder('B2', 'CO2')]})
+
+    response = client.post('/api/export-sites?sites=report-a,report-b')
+    assert response.status_code == 200, response.get_json()
+    result = response.get_json()
+    assert result['sites'] == ['report-a', 'report-b']
+    with open(result['filepath'], newline='', encoding='utf-8') as report:
+        rows = list(csv.reader(report))
+    assert ['SITE:', 'report-a'] in rows and ['SITE:', 'report-b'] in rows
+    assert sum(1 for row in rows if row and row[0] in ('A1', 'B1', 'B2')) == 3
+    assert server.report_pool is not None
+    server.shutdown_report_pool()
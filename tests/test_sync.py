@@ -0,0 +1,42 @@
+import pytest
+
+SITE = '?site=sync-checks'
+
+
+@pytest.mark.parametrize('body', [[1, 2], 'text', 5])
+def test_sync_rejects_a_body_that_is_not_an_object(client, body):
+    response = client.post(f'/api/sync{SITE}', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+@pytest.mark.parametrize('since', ['abc', None, [1]])
+def test_sync_rejects_a_version_that_is_not_a_number(client, since):
+    response = client.post(f'/api/sync{SITE}', json={'since': since})
+    assert response.status_code == 400
+    assert 'Versione non valida' in response.get_json()['message']
+
+
+def test_sync_rejects_malformed_records(client):
+    response = client.post(f'/api/sync{SITE}', json={'cylinders': {'upsert': [{'gasType': 'N2'}]}})
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def cylinder(code):
+    return {'code': code, 'gasType': 'N2', 'pressure': '200', 'cylinderVolume': '50',
+            'physicalForm': 'gas', 'entryDate': '2026-01-01T00:00:00.000Z'}
+
+
+def test_synced_changes_are_backed_up(client):
+    site = '?site=sync-backup'
+    client.post(f'/api/extract-localstorage{site}', json={'cylinders': [cylinder('A')], 'history': []})
+    response = client.post(f'/api/sync{site}', json={'cylinders': {'upsert': [cylinder('B')]}})
+    assert response.status_code == 200
+
+    # A client loading now gets B, so its next save keeps it
+    loaded = client.get(f'/api/load-data{site}').get_json()['data']
+    assert [c['code'] for c in loaded['cylinders']] == ['A', 'B']
+    client.post(f'/api/extract-localstorage{site}', json=loaded)
+    stock = client.get(f'/api/stock{site}').get_json()['items']
+    assert [c['code'] for c in stock] == ['A', 'B']
@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from writebehind import WriteBehind
+
+
+class Recorder:
+    """Write function recording its values; fails the first `failures` calls"""
+
+    def __init__(self, failures=0):
+        self.values = []
+        self.failures = failures
+        self.written = threading.Event()
+
+    def __call__(self, value):
+        if self.failures:
+            self.failures -= 1
+            raise OSError('disk full')
+        self.values.append(value)
+        self.written.set()
+        return {'value': value}
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_burst_is_coalesced_into_one_write():
+    write = Recorder()
+    writer = WriteBehind(write, window=0.2)
+    try:
+        assert [writer.submit(value) for value in 'abc'] == [1, 2, 3]
+        assert writer.depth() == 3
+        wait_until(lambda: writer.flushed == 3)
+        assert write.values == ['c']
+        assert writer.last_flush['coalesced'] == 3
+        assert writer.depth() == 0
+    finally:
+        writer.close()
+
+
+def test_flush_writes_the_pending_value_now():
+    write = Recorder()
+    writer = WriteBehind(write, window=60)
+    try:
+        writer.submit('a')
+        writer.submit('b')
+        flush = writer.flush()
+        assert (flush['seq'], flush['result']) == (2, {'value': 'b'})
+        assert write.values == ['b']
+        # Nothing pending: flushing again writes nothing
+        writer.flush()
+        assert write.values == ['b']
+    finally:
+        writer.close()
+
+
+def test_close_writes_what_is_pending():
+    write = Recorder()
+    writer = WriteBehind(write, window=60)
+    writer.submit('a')
+    writer.close()
+    assert write.values == ['a']
+    assert writer.status()['pending'] == 0
+    with pytest.raises(RuntimeError):
+        writer.submit('b')
+
+
+def test_failed_write_is_retried():
+    write = Recorder(failures=1)
+    writer = WriteBehind(write, window=0.05)
+    try:
+        writer.submit('a')
+        assert write.written.wait(5)
+        wait_until(lambda: writer.flushed == 1)
+        assert write.values == ['a']
+    finally:
+        writer.close()
+
+
+def test_failed_flush_reports_the_error():
+    write = Recorder(failures=1)
+    writer = WriteBehind(write, window=60)
+    try:
+        writer.submit('a')
+        assert writer.flush()['error'] == 'disk full'
+        assert writer.depth() == 1
+        assert writer.flush()['error'] is None
+        assert write.values == ['a']
+    finally:
+        writer.close()
+
+
+def test_save_status_endpoint(client):
+    site = '?site=writebehind'
+    response = client.post(f'/api/extract-localstorage{site}', json={'cylinders': [], 'history': []})
+    save_id = response.get_json()['save_id']
+    status = client.get(f'/api/save-status{site}').get_json()
+    assert (status['site'], status['pending'], status['flushed']) == ('writebehind', 0, save_id)
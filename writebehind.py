@@ -0,0 +1,131 @@
+import threading
+import time
+
+# Seconds a save may wait to be coalesced with the ones that follow it
+DEFAULT_WINDOW = 2.0
+
+
+class WriteBehind:
+    """Acknowledge writes immediately and apply them in the background, coalescing bursts
+
+    Every submitted value is a complete snapshot, so only the newest one
+    pending needs writing: a burst of submissions within `window` seconds of
+    the first results in a single call to `write`. A failed write is retried
+    after another window unless a newer value replaced it. `flush()` writes
+    the pending value right away and is called by readers that must not see
+    stale data, and by `close()` on shutdown.
+    """
+
+    def __init__(self, write, window=DEFAULT_WINDOW):
+        self.write = write
+        self.window = window
+        self.submitted = 0
+        self.flushed = 0
+        self.last_flush = None
+        self._pending = None
+        self._pending_since = None
+        self._queued = 0
+        self._writing = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def submit(self, value):
+        """Queue a value to be written; return its sequence number"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('The write-behind queue is closed')
+            self.submitted += 1
+            self._pending = (self.submitted, value)
+            self._queued += 1
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+                self._cond.notify_all()
+            return self.submitted
+
+    def depth(self):
+        """Number of acknowledged submissions not written yet"""
+        with self._cond:
+            return self._queued + self._writing
+
+    def status(self):
+        """Describe the queue: depth, sequence numbers and the last flush"""
+        with self._cond:
+            return {
+                'pending': self._queued + self._writing,
+                'submitted': self.submitted,
+                'flushed': self.flushed,
+                'window': self.window,
+                'last_flush': dict(self.last_flush) if self.last_flush else None
+            }
+
+    def flush(self):
+        """Write the pending value now, waiting for a write in progress; return the last flush"""
+        self._flush_pending()
+        with self._cond:
+            return dict(self.last_flush) if self.last_flush else None
+
+    def close(self):
+        """Stop the background thread and write what is still pending"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._flush_pending()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._pending_since is None:
+                        self._cond.wait()
+                        continue
+                    remaining = self._pending_since + self.window - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return
+            self._flush_pending()
+
+    def _flush_pending(self):
+        with self._flush_lock:
+            with self._cond:
+                if self._pending is None:
+                    return
+                (seq, value), count = self._pending, self._queued
+                self._pending = self._pending_since = None
+                self._queued = 0
+                self._writing = count
+
+            start = time.perf_counter()
+            error = None
+            try:
+                result = self.write(value)
+            except Exception as e:
+                result = None
+                error = str(e)
+            latency = time.perf_counter() - start
+
+            with self._cond:
+                self._writing = 0
+                self.last_flush = {
+                    'seq': seq,
+                    'coalesced': count,
+                    'latency': latency,
+                    'finished': time.time(),
+                    'result': result,
+                    'error': error
+                }
+                if error is None:
+                    self.flushed = seq
+                elif self._pending is None:
+                    # Keep the value for the next attempt unless a newer one replaced it
+                    self._pending = (seq, value)
+                    self._pending_since = time.monotonic()
+                    self._queued = count
+                    self._cond.notify_all()